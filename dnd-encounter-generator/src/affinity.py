@@ -0,0 +1,224 @@
+# filepath: src/affinity.py
+# Which monsters belong together: an affinity graph over the bestiary store, so minions
+# are picked among the main monster's neighbours instead of by XP alone.
+#
+# Two monsters are linked when they share a type tag (demon, goblinoid, ...), a group
+# (Chromatic Dragon, Lycanthropes, ...) or a legendary group, when one mentions the other
+# with {@creature ...} in its text, or when they have the same creature type and live in
+# the same environment. Every link adds to the edge weight (see the *_WEIGHT constants).
+#
+# The graph is kept as compact adjacency arrays (CSR): offsets[i]..offsets[i + 1] is the
+# slice of neighbours/weights belonging to monster i, so a neighbourhood lookup is
+# O(degree). It's built once and cached next to the bestiary store.
+import os
+import random
+import re
+import struct
+from array import array
+from entry_text import iter_entry_strings
+from sampling import get_monster_type
+from constraints import get_monster_tags
+from text_index import TEXT_SECTIONS
+from instrumentation import increment, timed
+
+TAG_WEIGHT = 3
+GROUP_WEIGHT = 3
+LEGENDARY_GROUP_WEIGHT = 3
+REFERENCE_WEIGHT = 4
+# Same type in the same environment is a weak hint, counted once per pair
+HABITAT_WEIGHT = 1
+# Buckets bigger than this ("every beast in the forest") say too little to link every pair
+MAX_BUCKET = 150
+# Only the strongest neighbours are kept
+MAX_DEGREE = 64
+
+GRAPH_MAGIC = b"DNDA"
+GRAPH_VERSION = 2
+# magic, version, monster count, edge count, length of the bestiary hash
+GRAPH_HEADER = struct.Struct("<4sIIII")
+
+CREATURE_PATTERN = re.compile(r"\{@creature ([^|}]+)")
+
+
+def get_creature_references(monster):
+    """
+    Returns the lowercased names of the creatures a monster mentions with {@creature ...}.
+    """
+    names = set()
+    for section in TEXT_SECTIONS:
+        for text in iter_entry_strings(monster.get(section, [])):
+            names.update(name.strip().lower() for name in CREATURE_PATTERN.findall(text))
+    return names
+
+
+def build_affinity_graph(monsters, environment_masks=None):
+    """
+    Builds the adjacency arrays.
+    :param monsters: List of full monster records, in store order.
+    :param environment_masks: Optional per-monster environment bitmasks (store rows);
+                              computed from the records when missing.
+    :return: (offsets, neighbours, weights) arrays.
+    """
+    buckets = {}
+    names = {}
+    for index, monster in enumerate(monsters):
+        names.setdefault(monster.get("name", "").lower(), index)
+        monster_type = get_monster_type(monster).lower()
+        for tag in get_monster_tags(monster):
+            buckets.setdefault(("tag", tag), []).append(index)
+        for group in monster.get("group", []) or []:
+            buckets.setdefault(("group", group), []).append(index)
+        legendary_group = monster.get("legendaryGroup")
+        if isinstance(legendary_group, dict):
+            buckets.setdefault(("legendary", legendary_group.get("name")), []).append(index)
+        if environment_masks is None:
+            environments = monster.get("environment", []) or []
+        else:
+            mask = environment_masks[index]
+            environments = [bit for bit in range(mask.bit_length()) if mask & (1 << bit)]
+        for environment in environments:
+            buckets.setdefault(("habitat", monster_type, environment), []).append(index)
+
+    bucket_weights = {"tag": TAG_WEIGHT, "group": GROUP_WEIGHT, "legendary": LEGENDARY_GROUP_WEIGHT}
+    edges = [{} for _ in monsters]
+    habitat_pairs = set()
+    for key, members in buckets.items():
+        if len(members) < 2 or len(members) > MAX_BUCKET:
+            continue
+        for position, first in enumerate(members):
+            for second in members[position + 1:]:
+                if key[0] == "habitat":
+                    pair = (first, second)
+                    if pair in habitat_pairs:
+                        continue
+                    habitat_pairs.add(pair)
+                    weight = HABITAT_WEIGHT
+                else:
+                    weight = bucket_weights[key[0]]
+                edges[first][second] = edges[first].get(second, 0) + weight
+                edges[second][first] = edges[second].get(first, 0) + weight
+
+    for index, monster in enumerate(monsters):
+        for name in get_creature_references(monster):
+            other = names.get(name)
+            if other is not None and other != index:
+                edges[index][other] = edges[index].get(other, 0) + REFERENCE_WEIGHT
+                edges[other][index] = edges[other].get(index, 0) + REFERENCE_WEIGHT
+
+    offsets = array("I", [0])
+    neighbours = array("I")
+    weights = array("B")
+    for index, linked in enumerate(edges):
+        strongest = sorted(linked.items(), key=lambda edge: (-edge[1], edge[0]))[:MAX_DEGREE]
+        strongest.sort()  # Neighbours in index order
+        neighbours.extend(other for other, _ in strongest)
+        weights.extend(min(weight, 255) for _, weight in strongest)
+        offsets.append(len(neighbours))
+    return offsets, neighbours, weights
+
+
+class AffinityGraph:
+    """
+    Affinity graph over the monsters of a BestiaryStore (see open_affinity_graph).
+    """
+
+    def __init__(self, store, offsets, neighbours, weights):
+        self.store = store
+        self.offsets = offsets
+        self.neighbours = neighbours
+        self.weights = weights
+        self._summaries = {}
+
+    def neighbourhood(self, index):
+        """
+        Returns (neighbour indexes, edge weights) of a monster, in O(degree).
+        """
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.neighbours[start:end], self.weights[start:end]
+
+    def summary(self, index):
+        if index not in self._summaries:
+            self._summaries[index] = self.store.summary(index)
+        return self._summaries[index]
+
+    def pick_minions(self, main_index, remaining_xp, max_minions=3, environment="any", sampler=None, rng=random):
+        """
+        Picks up to max_minions different neighbours of the main monster that fit in the
+        remaining XP, weighted by affinity (times the sampler's weights, if given).
+        :return: List of minion summaries (empty if no neighbour fits).
+        """
+        environment_bit = 0
+        if environment != "any":
+            if environment not in self.store.environments:
+                return []
+            environment_bit = 1 << self.store.environments.index(environment)
+        candidates = []
+        for other, affinity in zip(*self.neighbourhood(main_index)):
+            xp, _, env_mask, _, _, _, _, _, _ = self.store.row(other)
+            if xp <= 0 or xp > remaining_xp or (environment_bit and not env_mask & environment_bit):
+                continue
+            weight = affinity * (sampler.weight(self.summary(other)) if sampler else 1.0)
+            if weight > 0:
+                candidates.append([other, xp, weight])
+
+        minions = []
+        while candidates and len(minions) < max_minions:
+            candidates = [candidate for candidate in candidates if candidate[1] <= remaining_xp]
+            if not candidates:
+                break
+            position = rng.choices(range(len(candidates)), [candidate[2] for candidate in candidates])[0]
+            other, xp, _ = candidates.pop(position)
+            minions.append(self.summary(other))
+            remaining_xp -= xp
+        return minions
+
+
+def get_graph_path(store):
+    return os.path.splitext(store.path)[0] + ".affinity"
+
+
+@timed("affinity.open")
+def open_affinity_graph(store, graph_path=None):
+    """
+    Loads the affinity graph of a bestiary store from the cache, building it if it's
+    missing or belongs to another version of the bestiary.
+    :param store: An open BestiaryStore.
+    :param graph_path: Optional cache path (defaults to src/cache/<bestiary>.affinity).
+    :return: An AffinityGraph.
+    """
+    graph_path = graph_path or get_graph_path(store)
+    source_hash = store.meta.get("source_hash", "").encode("utf-8")
+    try:
+        with open(graph_path, "rb") as file:
+            data = file.read()
+        magic, version, count, edge_count, hash_length = GRAPH_HEADER.unpack_from(data, 0)
+        position = GRAPH_HEADER.size
+        if (magic == GRAPH_MAGIC and version == GRAPH_VERSION and count == len(store)
+                and data[position:position + hash_length] == source_hash):
+            position += hash_length
+            offsets, neighbours, weights = array("I"), array("I"), array("B")
+            for values, length in ((offsets, count + 1), (neighbours, edge_count), (weights, edge_count)):
+                end = position + length * values.itemsize
+                values.frombytes(data[position:end])
+                position = end
+            if len(weights) == edge_count:
+                increment("cache.affinity.hit")
+                return AffinityGraph(store, offsets, neighbours, weights)
+    except (FileNotFoundError, struct.error, ValueError):
+        pass
+
+    increment("cache.affinity.miss")
+    offsets, neighbours, weights = build_affinity_graph(
+        [store.record(index) for index in range(len(store))],
+        [store.row(index)[2] for index in range(len(store))]
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(graph_path)), exist_ok=True)
+    temp_path = f"{graph_path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as file:
+        file.write(GRAPH_HEADER.pack(GRAPH_MAGIC, GRAPH_VERSION, len(store), len(neighbours), len(source_hash)))
+        file.write(source_hash)
+        file.write(offsets.tobytes())
+        file.write(neighbours.tobytes())
+        file.write(weights.tobytes())
+    os.replace(temp_path, graph_path)
+    return AffinityGraph(store, offsets, neighbours, weights)
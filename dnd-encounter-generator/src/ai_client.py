@@ -1,24 +1,67 @@
 #This file works well with the v10-main.py and onwards
-import requests
+# requests and python-dotenv are only imported on the first AI call, so importing this
+# module (and main.py) stays fast for scripts that never reach the AI.
 import os
-from dotenv import load_dotenv
-load_dotenv()
+from instrumentation import increment, timer
 
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")  # Set this in your environment variables
+_api_key = None
+_env_loaded = False
 
-def generate_environment_description(environment):
+API_URL = "https://openrouter.ai/api/v1/chat/completions"
+MODEL = "deepseek/deepseek-chat-v3-0324:free"
+
+# Returned when there's no API key or the call fails
+FALLBACK_DESCRIPTION = "A mysterious place awaits..."
+FALLBACK_BATTLEMAP = "A mysterious battlemap awaits..."
+FALLBACK_TITLE = "A Mysterious Encounter"
+
+def get_api_key():
     """
-    Calls DeepSeek Chat API via OpenRouter to generate a short D&D environment description.
+    Returns the OpenRouter API key (OPENROUTER_API_KEY, from the environment or a .env
+    file). The .env file is only read on the first call.
     """
-    if not OPENROUTER_API_KEY:
-        print("OpenRouter API key not set. Set OPENROUTER_API_KEY environment variable.")
-        return "A mysterious place awaits..."
+    global _api_key, _env_loaded
+    if not _env_loaded:
+        _env_loaded = True
+        try:
+            from dotenv import load_dotenv
+            load_dotenv()
+        except ImportError:
+            pass  # Without python-dotenv only the real environment counts
+        _api_key = os.getenv("OPENROUTER_API_KEY")  # Set this in your environment variables
+    return _api_key
 
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
+def post_chat_request(data, timeout=15):
+    """
+    Sends a chat request to OpenRouter (requests is imported here, on first use).
+    :return: The reply text.
+    :raises Exception: Whatever requests raises on network or HTTP errors.
+    """
+    import requests
+    increment("ai.requests")
+    with timer("ai.request"):
+        try:
+            response = requests.post(
+                API_URL,
+                headers={
+                    "Authorization": f"Bearer {get_api_key()}",
+                    "Content-Type": "application/json"
+                },
+                json=data,
+                timeout=timeout
+            )
+            response.raise_for_status()
+            result = response.json()
+            return result["choices"][0]["message"]["content"].strip()
+        except Exception:
+            increment("ai.errors")  # Each one means a fallback text was used
+            raise
+
+def environment_description_request(environment):
+    """
+    Builds the chat request for an environment description (shared with async_ai_client.py).
+    :return: (prompt, request data)
+    """
     if isinstance(environment, dict):
         env_name = environment.get("name", "unknown environment")
         main_monster = environment.get("main_monster", "unknown creature")
@@ -53,10 +96,8 @@ def generate_environment_description(environment):
             f"Do not include the bracket labels in your output."
         )
 
-    print(f"\n[AI Prompt]: {prompt}\n")
-
     data = {
-        "model": "deepseek/deepseek-chat-v3-0324:free",
+        "model": MODEL,
         "messages": [
             {"role": "system", "content": "You are a creative D&D encounter designer."},
             {"role": "user", "content": prompt}
@@ -64,23 +105,29 @@ def generate_environment_description(environment):
         "max_tokens": 300,
         "temperature": 0.8
     }
+    return prompt, data
+
+def generate_environment_description(environment):
+    """
+    Calls DeepSeek Chat API via OpenRouter to generate a short D&D environment description.
+    """
+    if not get_api_key():
+        print("OpenRouter API key not set. Set OPENROUTER_API_KEY environment variable.")
+        return FALLBACK_DESCRIPTION
+
+    prompt, data = environment_description_request(environment)
+    print(f"\n[AI Prompt]: {prompt}\n")
     try:
-        response = requests.post(url, headers=headers, json=data, timeout=15)
-        response.raise_for_status()
-        result = response.json()
-        return result["choices"][0]["message"]["content"].strip()
+        return post_chat_request(data)
     except Exception as e:
         print(f"AI description error: {e}")
-        return "A mysterious place awaits..."
+        return FALLBACK_DESCRIPTION
 
-def generate_battlemap_prompt(environment):
+def battlemap_prompt_request(environment):
     """
-    Calls DeepSeek Chat API via OpenRouter to generate a D&D battlemap prompt.
+    Builds the chat request for a battlemap prompt (shared with async_ai_client.py).
+    :return: (prompt, request data)
     """
-    if not OPENROUTER_API_KEY:
-        print("OpenRouter API key not set. Set OPENROUTER_API_KEY environment variable.")
-        return "A mysterious battlemap awaits..."
-
     # Prepare environment string for prompt
     if isinstance(environment, dict):
         env_name = environment.get("name", "unknown environment")
@@ -102,10 +149,8 @@ def generate_battlemap_prompt(environment):
         "Maximum 480 characters including spaces. "
     )
 
-    print(f"\n[AI Battlemap Prompt]: {prompt}\n")
-
     data = {
-        "model": "deepseek/deepseek-chat-v3-0324:free",
+        "model": MODEL,
         "messages": [
             {"role": "system", "content": "You are a creative D&D battlemap designer."},
             {"role": "user", "content": prompt}
@@ -113,48 +158,37 @@ def generate_battlemap_prompt(environment):
         "max_tokens": 120,
         "temperature": 0.8
     }
-    try:
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                "Content-Type": "application/json"
-            },
-            json=data,
-            timeout=15
-        )
-        response.raise_for_status()
-        result = response.json()
-        return result["choices"][0]["message"]["content"].strip()
-    except Exception as e:
-        print(f"AI battlemap prompt error: {e}")
-        return "A mysterious battlemap awaits..."
+    return prompt, data
 
-def generate_encounter_title(environment, main_monster):
+def generate_battlemap_prompt(environment):
     """
-    Calls DeepSeek Chat API via OpenRouter to generate a creative D&D encounter title
-    based on the environment and main monster.
+    Calls DeepSeek Chat API via OpenRouter to generate a D&D battlemap prompt.
     """
-    if not OPENROUTER_API_KEY:
+    if not get_api_key():
         print("OpenRouter API key not set. Set OPENROUTER_API_KEY environment variable.")
-        return "A Mysterious Encounter"
+        return FALLBACK_BATTLEMAP
 
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    prompt, data = battlemap_prompt_request(environment)
+    print(f"\n[AI Battlemap Prompt]: {prompt}\n")
+    try:
+        return post_chat_request(data)
+    except Exception as e:
+        print(f"AI battlemap prompt error: {e}")
+        return FALLBACK_BATTLEMAP
 
+def encounter_title_request(environment, main_monster):
+    """
+    Builds the chat request for an encounter title (shared with async_ai_client.py).
+    :return: (prompt, request data)
+    """
     prompt = (
         f"Suggest a short, creative Dungeons & Dragons encounter title (max 8 words) "
         f"for an adventure set in a {environment} featuring a {main_monster}. "
         "Do not use quotes or punctuation at the start or end."
     )
 
-    print(f"\n[AI Title Prompt]: {prompt}\n")
-
     data = {
-        "model": "deepseek/deepseek-chat-v3-0324:free",
+        "model": MODEL,
         "messages": [
             {"role": "system", "content": "You are a creative D&D encounter designer."},
             {"role": "user", "content": prompt}
@@ -162,12 +196,22 @@ def generate_encounter_title(environment, main_monster):
         "max_tokens": 20,
         "temperature": 0.9
     }
+    return prompt, data
+
+def generate_encounter_title(environment, main_monster):
+    """
+    Calls DeepSeek Chat API via OpenRouter to generate a creative D&D encounter title
+    based on the environment and main monster.
+    """
+    if not get_api_key():
+        print("OpenRouter API key not set. Set OPENROUTER_API_KEY environment variable.")
+        return FALLBACK_TITLE
+
+    prompt, data = encounter_title_request(environment, main_monster)
+    print(f"\n[AI Title Prompt]: {prompt}\n")
     try:
-        response = requests.post(url, headers=headers, json=data, timeout=15)
-        response.raise_for_status()
-        result = response.json()
-        return result["choices"][0]["message"]["content"].strip()
+        return post_chat_request(data)
     except Exception as e:
         print(f"AI title error: {e}")
-        return "A Mysterious Encounter"
+        return FALLBACK_TITLE
     
@@ -0,0 +1,199 @@
+# filepath: src/async_ai_client.py
+# Async versions of the ai_client calls, for enriching many encounters at once.
+#
+# One httpx.AsyncClient (a shared connection pool) is used for every call, a semaphore
+# caps how many requests are in flight, and every request has its own timeout. Prompts
+# and fallbacks are the same as in ai_client.py.
+#
+#   async with AsyncAIClient(max_concurrency=8) as client:
+#       title = await client.encounter_title("forest", "Owlbear")
+#
+# or, for a whole batch from synchronous code:
+#   results = enrich_encounters(encounters, max_concurrency=8)
+#
+# or, for encounters that arrive bit by bit (batch.py's chunks), one client on one
+# background event loop for the whole run (see BatchEnricher).
+#
+# Needs httpx (pip install httpx); only imported when a client is created.
+import asyncio
+import sys
+import threading
+from ai_client import (get_api_key, API_URL, FALLBACK_DESCRIPTION, FALLBACK_BATTLEMAP, FALLBACK_TITLE,
+                       environment_description_request, battlemap_prompt_request, encounter_title_request)
+from instrumentation import increment, timer
+
+# Requests in flight at once (OpenRouter's free models rate-limit aggressively)
+MAX_CONCURRENCY = 8
+# Seconds per request, same as the sync client
+REQUEST_TIMEOUT = 15
+
+
+class AsyncAIClient:
+    """
+    Async OpenRouter client with bounded concurrency. Use it as an async context manager
+    (or call aclose()) so the connection pool is closed.
+    """
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, timeout=REQUEST_TIMEOUT, api_key=None):
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError("The async AI client needs httpx: pip install httpx") from None
+        self.api_key = api_key or get_api_key()
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client = httpx.AsyncClient(
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            },
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            timeout=timeout
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def _complete(self, data, fallback, label, timeout=None):
+        """
+        Sends one chat request. Errors are printed and answered with the fallback text,
+        like the sync client, so one failed call doesn't sink a batch.
+        """
+        if not self.api_key:
+            return fallback
+        async with self._semaphore:
+            increment("ai.requests")
+            with timer("ai.request_async"):  # Time in flight, not time waiting for the semaphore
+                try:
+                    response = await self._client.post(API_URL, json=data, timeout=timeout or self.timeout)
+                    response.raise_for_status()
+                    result = response.json()
+                    return result["choices"][0]["message"]["content"].strip()
+                except Exception as e:
+                    increment("ai.errors")
+                    print(f"AI {label} error: {e!r}", file=sys.stderr)  # Batch output may be on stdout
+                    return fallback
+
+    async def environment_description(self, environment, timeout=None):
+        _, data = environment_description_request(environment)
+        return await self._complete(data, FALLBACK_DESCRIPTION, "description", timeout)
+
+    async def battlemap_prompt(self, environment, timeout=None):
+        _, data = battlemap_prompt_request(environment)
+        return await self._complete(data, FALLBACK_BATTLEMAP, "battlemap prompt", timeout)
+
+    async def encounter_title(self, environment, main_monster, timeout=None):
+        _, data = encounter_title_request(environment, main_monster)
+        return await self._complete(data, FALLBACK_TITLE, "title", timeout)
+
+
+async def enrich_encounter(client, encounter, environment):
+    """
+    Title, environment description and battlemap prompt for one encounter, requested
+    concurrently. Description and battlemap are skipped for "any", like in main.py.
+    :param client: An AsyncAIClient.
+    :param encounter: List of monsters, main monster first.
+    :param environment: Environment name, or "any".
+    :return: Dictionary with "title", "description" and "battlemap_prompt".
+    """
+    main_monster = encounter[0].get("name", "Unknown") if encounter else "Unknown"
+    calls = [client.encounter_title(environment, main_monster)]
+    if environment and environment != "any":
+        calls.append(client.environment_description({
+            "name": environment,
+            "main_monster": main_monster,
+            "minions": [monster.get("name", "unknown minion") for monster in encounter[1:]]
+        }))
+        calls.append(client.battlemap_prompt(environment))
+    results = await asyncio.gather(*calls)
+    return {
+        "title": results[0],
+        "description": results[1] if len(results) > 1 else "",
+        "battlemap_prompt": results[2] if len(results) > 2 else "",
+    }
+
+
+async def enrich_encounters_async(encounters, max_concurrency=MAX_CONCURRENCY, timeout=REQUEST_TIMEOUT):
+    """
+    Enriches a batch of (encounter, environment) pairs with every AI call overlapping,
+    at most max_concurrency in flight.
+    :return: One result dictionary per pair (see enrich_encounter), in the same order.
+    """
+    async with AsyncAIClient(max_concurrency, timeout) as client:
+        return await asyncio.gather(*(enrich_encounter(client, encounter, environment)
+                                      for encounter, environment in encounters))
+
+
+def enrich_encounters(encounters, max_concurrency=MAX_CONCURRENCY, timeout=REQUEST_TIMEOUT):
+    """
+    Synchronous entry point for batch scripts: runs enrich_encounters_async() in an event loop.
+    """
+    return asyncio.run(enrich_encounters_async(encounters, max_concurrency, timeout))
+
+
+class BatchEnricher:
+    """
+    Enriches encounters from synchronous code with one AsyncAIClient on one event loop
+    (running in a background thread) for a whole run. Calls from every submit() overlap
+    and share the connection pool and the concurrency cap.
+
+        with BatchEnricher(max_concurrency=8) as enricher:
+            future = enricher.submit(encounters)  # Returns right away
+            ...
+            results = future.result()
+    """
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, timeout=REQUEST_TIMEOUT):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        try:
+            self._client = self._run(self._create_client(max_concurrency, timeout)).result()
+        except BaseException:
+            self._stop()
+            raise
+
+    async def _create_client(self, max_concurrency, timeout):
+        return AsyncAIClient(max_concurrency, timeout)  # Created on the loop that will use it
+
+    async def _enrich(self, encounters):
+        return await asyncio.gather(*(enrich_encounter(self._client, encounter, environment)
+                                      for encounter, environment in encounters))
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def submit(self, encounters):
+        """
+        Starts enriching a list of (encounter, environment) pairs.
+        :return: concurrent.futures.Future of one result dictionary per pair (see enrich_encounter).
+        """
+        return self._run(self._enrich(encounters))
+
+    def _stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def close(self):
+        """
+        Closes the client and the loop; wait for the submitted futures first.
+        """
+        if self._loop.is_closed():
+            return
+        try:
+            self._run(self._client.aclose()).result()
+        finally:
+            self._stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
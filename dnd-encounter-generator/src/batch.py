@@ -0,0 +1,311 @@
+# filepath: src/batch.py
+# Generates thousands of encounters across a process pool (nightly pre-generation).
+#
+# Every worker maps the bestiary store and its affinity graph once (both are cached
+# files, built by the parent before the pool starts) and then takes encounters in
+# chunks. Each encounter gets its own seed from the batch seed, so results don't
+# depend on which worker ran what, and every result carries a reproducible encounter
+# ID (see encounter_ids.py). With --save the workers render the notes as well, and
+# results come back in order to a single writer that only writes. With --ai every
+# chunk gets its titles, descriptions and battlemap prompts before its notes are
+# rendered, from one async AI client shared by the whole batch (see async_ai_client.py).
+# With DND_METRICS set, the workers' timings are merged into the parent's report.
+#
+# Usage: python batch.py --count 5000 [--difficulty medium] [--environment any] [--seed 1]
+#                        [--workers 8] [--out encounters.jsonl] [--save path/to/vault/folder] [--ai]
+import argparse
+import importlib.util
+import json
+import os
+import random
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from affinity import open_affinity_graph
+from bestiary_store import open_bestiary_store
+from encounter_generator import PROJECTED_FIELDS
+from encounter_ids import make_encounter_id
+from md_export import BulkExporter
+from renderers import make_encounter, render
+from vault_index import index_entry
+from sampling import MonsterSampler
+from stat_blocks import StatBlockCache
+from xp_tables import DIFFICULTIES, adjusted_xp_array, encounter_xp
+import instrumentation
+from main import CR_TO_XP, build_encounter, calculate_party_thresholds, get_adventurer_levels
+
+# Encounters per task; big enough to amortize the inter-process overhead
+CHUNK_SIZE = 64
+# Chunks whose AI calls may be in flight at once with --ai (the client caps the requests)
+MAX_ENRICHING_CHUNKS = 4
+
+_worker = None
+
+
+def _init_worker(source_path, weights, fields=PROJECTED_FIELDS, metrics=False, stat_blocks=False):
+    """
+    Runs once per worker process: maps the store and the graph, and keeps one sampler,
+    the filtered monster lists and (for notes with stat blocks) one stat block cache
+    for the whole batch.
+    """
+    global _worker
+    instrumentation.enable(metrics)
+    store = open_bestiary_store(source_path, CR_TO_XP, fields)
+    _worker = {
+        "store": store,
+        "graph": open_affinity_graph(store),
+        "sampler": MonsterSampler(weights),
+        "weights": weights,
+        "budgets": {},
+        "stat_blocks": StatBlockCache(source_path) if stat_blocks else None,
+    }
+
+
+def _render_notes(results):
+    """
+    Adds a "note" ({"title", "text", "entry"}) to every result with monsters: the
+    rendered markdown note and its vault index entry, ready for the writer.
+    """
+    store = _worker["store"]
+    stat_blocks = _worker["stat_blocks"]
+    for result in results:
+        if not result["monsters"]:
+            continue
+        title = result.get("title") or f"{result['monsters'][0].get('name', 'Unknown')} Encounter"
+        embedded = None
+        if stat_blocks:
+            embedded = stat_blocks.for_encounter([store.full_monster(monster) for monster in result["monsters"]])
+        encounter = make_encounter(result["monsters"], title, result["environment"], result["difficulty"],
+                                   result["encounter_id"], result.get("description", ""),
+                                   result.get("battlemap_prompt", ""), result["in_lair"], embedded)
+        result["note"] = {"title": title, "text": render(encounter), "entry": index_entry(encounter)}
+
+
+def _chunk_result(results):
+    """
+    What a task sends back: (results, stat blocks rendered since the last chunk,
+    metrics collected since the last chunk or None).
+    """
+    stat_blocks = _worker["stat_blocks"]
+    new_blocks = stat_blocks.take_new() if stat_blocks else {}
+    if not instrumentation.is_enabled():
+        return results, new_blocks, None
+    metrics = instrumentation.snapshot()
+    instrumentation.reset()  # Each chunk sends only its own metrics
+    return results, new_blocks, metrics
+
+
+def _generate_chunk(chunk, notes=False):
+    """
+    Generates one chunk of encounters.
+    :param chunk: List of (seed, spec) pairs.
+    :param notes: Also render each encounter's markdown note (see _render_notes).
+    :return: See _chunk_result; the results are dictionaries as described in generate_batch.
+    """
+    store = _worker["store"]
+    budgets = _worker["budgets"]
+    results = []
+    for seed, spec in chunk:
+        max_xp = spec["max_xp"]
+        environment = spec.get("environment", "any")
+        add_minions = spec.get("add_minions", True)
+        in_lair = spec.get("in_lair", False)
+        if max_xp not in budgets:
+            budgets[max_xp] = store.filter_monsters(max_xp)
+        encounter = build_encounter(budgets[max_xp], max_xp, environment, add_minions, None,
+                                    _worker["sampler"], random.Random(seed), _worker["graph"], in_lair)
+        xp = encounter_xp(encounter, in_lair)
+        results.append({
+            "encounter_id": make_encounter_id(seed, store.meta.get("source_hash", "_"), max_xp, environment,
+                                              add_minions, None, _worker["weights"], in_lair) if encounter else None,
+            "max_xp": max_xp,
+            "environment": environment,
+            "difficulty": spec.get("difficulty"),
+            "in_lair": in_lair,
+            "monsters": encounter,
+            "xp": xp,
+        })
+    # The whole chunk's multipliers in one pass
+    adjusted = adjusted_xp_array([result["xp"] for result in results], [len(result["monsters"]) for result in results])
+    for result, value in zip(results, adjusted):
+        result["adjusted_xp"] = value
+    if notes:
+        _render_notes(results)
+    return _chunk_result(results)
+
+
+def _render_chunk(results):
+    """
+    Renders the notes of a chunk the parent has enriched (see generate_batch).
+    """
+    _render_notes(results)
+    return _chunk_result(results)
+
+
+def _start_enrich(results, enrich):
+    """
+    Starts enrich() on every result with monsters.
+    :return: (those results, future of their AI fields or None if there are none).
+    """
+    found = [result for result in results if result["monsters"]]
+    return found, enrich([(result["monsters"], result["environment"]) for result in found]) if found else None
+
+
+def generate_batch(source_path, specs, seed=None, workers=None, chunk_size=CHUNK_SIZE, weights=None,
+                   fields=PROJECTED_FIELDS, notes=False, stat_blocks=False, enrich=None):
+    """
+    Generates encounters in parallel.
+    :param source_path: Path to the bestiary JSON file.
+    :param specs: List of dictionaries with "max_xp" and optionally "environment",
+                  "add_minions", "in_lair" and "difficulty" (one per encounter).
+    :param seed: Batch seed; the same seed and specs give the same encounters.
+    :param workers: Number of worker processes (defaults to the CPU count).
+    :param chunk_size: Encounters per task.
+    :param weights: Selection weights (the config's "selection_weights").
+    :param fields: Summary fields of the store (the config's "monster_fields"); use the
+                   same ones as the other entry points or the store cache is rebuilt.
+    :param notes: Render the markdown notes in the workers too; every result with
+                  monsters then has a "note" with "title", "text" and "entry" (its
+                  vault index entry), so the caller only has to write them.
+    :param stat_blocks: Embed full stat blocks in the notes.
+    :param enrich: Optional function that takes a list of (monsters, environment) pairs
+                   and returns a concurrent.futures.Future of one {"title", "description",
+                   "battlemap_prompt"} per pair (e.g. async_ai_client.BatchEnricher.submit).
+                   It's called on every chunk as it arrives, so the AI calls of up to
+                   MAX_ENRICHING_CHUNKS chunks overlap; the results get those keys and
+                   the notes are rendered with them (back in the workers).
+    :return: Generator of result dictionaries, in the order of specs, each with
+             "encounter_id", "max_xp", "environment", "difficulty", "in_lair",
+             "monsters" (summaries), "xp" and "adjusted_xp".
+    """
+    # Build the store and graph caches once, before the workers map them
+    store = open_bestiary_store(source_path, CR_TO_XP, fields)
+    open_affinity_graph(store)
+    store.close()
+    stat_block_cache = StatBlockCache(source_path) if notes and stat_blocks else None
+
+    seeds = random.Random(seed)
+    # 48-bit seeds, the size encounter IDs are made for
+    tasks = [(seeds.getrandbits(48), spec) for spec in specs]
+    chunks = [tasks[start:start + chunk_size] for start in range(0, len(tasks), chunk_size)]
+    initargs = (source_path, weights, fields, instrumentation.is_enabled(), stat_block_cache is not None)
+
+    def collect(chunk_result):
+        results, new_blocks, metrics = chunk_result
+        if metrics:
+            instrumentation.merge(metrics)
+        if stat_block_cache:
+            stat_block_cache.update(new_blocks)
+        return results
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+            # map() keeps the order; enriched notes can only be rendered after enrich()
+            generated = pool.map(partial(_generate_chunk, notes=notes and enrich is None), chunks)
+            if enrich is None:
+                for chunk_result in generated:
+                    yield from collect(chunk_result)
+                return
+            enriching = deque()  # (results, results with monsters, future of their AI fields), in order
+            rendering = deque()  # Futures of rendered chunks, in order
+
+            def advance(limit):
+                """
+                Moves enriched chunks on to rendering and yields the finished ones, in
+                order. Waits only while more than limit chunks are at the AI stage
+                (limit 0: wait for everything).
+                """
+                while enriching and (len(enriching) > limit or enriching[0][2] is None or enriching[0][2].done()):
+                    results, found, future = enriching.popleft()
+                    if future is not None:
+                        for result, extra in zip(found, future.result()):
+                            result.update(extra)
+                    if notes:
+                        rendering.append(pool.submit(_render_chunk, results))
+                    else:
+                        yield from results
+                while rendering and (limit == 0 or rendering[0].done()):
+                    yield from collect(rendering.popleft().result())
+
+            for chunk_result in generated:
+                results = collect(chunk_result)
+                enriching.append((results, *_start_enrich(results, enrich)))
+                yield from advance(MAX_ENRICHING_CHUNKS)
+            yield from advance(0)
+    finally:
+        if stat_block_cache:
+            stat_block_cache.save()  # The workers' renders, so the next batch finds them cached
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate many encounters in parallel.")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--difficulty", choices=DIFFICULTIES, default="medium")
+    parser.add_argument("--max-xp", type=int, help="XP pool (defaults to the saved party's threshold)")
+    parser.add_argument("--environment", default="any")
+    parser.add_argument("--no-minions", action="store_true")
+    parser.add_argument("--lair", action="store_true", help="Fight main monsters in their lair")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--out", help="JSON Lines file to write (defaults to stdout)")
+    parser.add_argument("--save", metavar="FOLDER", help="Also export every encounter as a markdown note")
+    parser.add_argument("--stat-blocks", action="store_true", help="Embed full stat blocks in the saved notes")
+    parser.add_argument("--ai", action="store_true",
+                        help="Ask the AI for titles, descriptions and battlemap prompts (needs httpx)")
+    parser.add_argument("--ai-concurrency", type=int, default=8, help="AI requests in flight at once")
+    args = parser.parse_args()
+    instrumentation.enable_from_env()  # DND_METRICS=table|json|prometheus
+
+    config_file = os.path.join(os.path.dirname(__file__), "config", "config.json")
+    try:
+        with open(config_file, "r") as f:
+            config = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        config = {}
+    max_xp = args.max_xp
+    if max_xp is None:
+        party_info = config.get("party_info", {})
+        thresholds = calculate_party_thresholds(party_info.get("level") or 1, party_info.get("size") or 4,
+                                                get_adventurer_levels(party_info))
+        max_xp = thresholds[args.difficulty]
+    monster_source = config.get("monster_source", "bestiary-mm.json")
+    source_path = os.path.join(os.path.dirname(__file__), "data", monster_source)
+    monster_fields = config.get("monster_fields", PROJECTED_FIELDS)
+
+    spec = {"max_xp": max_xp, "environment": args.environment, "add_minions": not args.no_minions, "in_lair": args.lair,
+            "difficulty": args.difficulty}
+    enricher = None
+    if args.ai:
+        if importlib.util.find_spec("httpx") is None:  # Fail before the batch starts, not after its first chunk
+            parser.error("--ai needs httpx: pip install httpx")
+        from async_ai_client import BatchEnricher
+        enricher = BatchEnricher(args.ai_concurrency)  # One client and loop for the whole batch
+    results = generate_batch(source_path, [spec] * args.count, args.seed, args.workers, args.chunk_size,
+                             config.get("selection_weights"), monster_fields, bool(args.save), args.stat_blocks,
+                             enricher.submit if enricher else None)
+    # The single writer: results arrive in order (notes already rendered), one line each
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    exporter = BulkExporter(args.save) if args.save else None
+    try:
+        for result in results:
+            note = result.pop("note", None)
+            out.write(json.dumps(result, separators=(",", ":")) + "\n")
+            if exporter and note:
+                exporter.submit(note["text"], note["title"], note["entry"])
+    finally:
+        results.close()  # Stops the pool before the enricher goes
+        if enricher:
+            enricher.close()
+        if exporter:
+            exporter.close()
+            # Without --out stdout is the JSON Lines stream, so status goes to stderr
+            print(f"📝 {len(exporter.paths)} notes saved to {args.save}",
+                  file=sys.stderr if out is sys.stdout else sys.stdout)
+        if args.out:
+            out.close()
+            print(f"💾 {args.count} encounters written to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+# filepath: src/benchmarks.py
+# Benchmark suite for loading, selection, rendering and the AI client, so performance
+# work can be measured and regressions caught.
+#
+# Each benchmark is timed over several runs (each run repeats the call enough times
+# to last a few tens of milliseconds) and reported as milliseconds per call. Results
+# are written as JSON and compared with a saved baseline; a benchmark that got slower
+# than the baseline by more than the threshold fails the run. Baselines are machine
+# specific, so the default one lives in src/cache/ (not committed).
+#
+# Usage: python benchmarks.py [--filter load] [--runs 7] [--out results.json]
+#                             [--save-baseline] [--baseline path] [--threshold 0.2]
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from bestiary_store import CACHE_DIR
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+BUNDLED_BESTIARY = os.path.join(DATA_DIR, "bestiary-mm.json")
+BASELINE_PATH = os.path.join(CACHE_DIR, "benchmark-baseline.json")
+# Monsters in the synthetic bestiary
+SYNTHETIC_SIZE = 20000
+# Seconds each run should last at least (calls are repeated to get there)
+MIN_RUN_TIME = 0.05
+# Slowdown against the baseline that counts as a regression (0.2 = 20% slower)
+REGRESSION_THRESHOLD = 0.2
+# Encounters enriched per run in the async AI benchmark
+ASYNC_BATCH = 20
+
+BENCHMARKS = {}
+
+
+class SkipBenchmark(Exception):
+    """
+    Raised by a setup function when the benchmark can't run here (missing package, ...).
+    """
+
+
+def benchmark(name):
+    """
+    Registers a benchmark. The decorated setup function gets a contextlib.ExitStack
+    for cleanup and returns the function to time (called without arguments).
+    """
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def write_synthetic_bestiary(path, size=SYNTHETIC_SIZE):
+    """
+    Writes a bestiary of `size` monsters made by renaming copies of the bundled ones.
+    """
+    with open(BUNDLED_BESTIARY, "r", encoding="utf-8") as f:
+        originals = json.load(f)["monster"]
+    monsters = []
+    for i in range(size):
+        monster = dict(originals[i % len(originals)])
+        monster["name"] = f"{monster.get('name', 'Monster')} {i // len(originals) + 1}"
+        monster["source"] = "SYN"
+        monsters.append(monster)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"monster": monsters}, f)
+
+
+@contextlib.contextmanager
+def patched(target, **attributes):
+    """
+    Temporarily replaces module attributes.
+    """
+    originals = {name: getattr(target, name) for name in attributes}
+    for name, value in attributes.items():
+        setattr(target, name, value)
+    try:
+        yield
+    finally:
+        for name, value in originals.items():
+            setattr(target, name, value)
+
+
+def start_mock_ai_server(stack):
+    """
+    Starts a local server answering OpenRouter chat requests with a fixed reply.
+    :return: URL of its chat completions endpoint.
+    """
+    reply = json.dumps({"choices": [{"message": {"content": "A Mock Encounter"}}]}).encode("utf-8")
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(reply)))
+            self.end_headers()
+            self.wfile.write(reply)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stack.callback(server.server_close)
+    stack.callback(server.shutdown)
+    return f"http://127.0.0.1:{server.server_address[1]}/api/v1/chat/completions"
+
+
+@benchmark("load_monsters.bundled")
+def bench_load_bundled(stack):
+    from encounter_generator import load_monsters
+    return lambda: load_monsters(BUNDLED_BESTIARY)
+
+
+@benchmark("load_monsters.synthetic_20k")
+def bench_load_synthetic(stack):
+    from encounter_generator import load_monsters
+    path = os.path.join(stack.enter_context(tempfile.TemporaryDirectory()), "bestiary-synthetic.json")
+    write_synthetic_bestiary(path)
+    return lambda: load_monsters(path)
+
+
+@benchmark("load_monsters.synthetic_20k_stream")
+def bench_load_synthetic_stream(stack):
+    from encounter_generator import load_monsters
+    path = os.path.join(stack.enter_context(tempfile.TemporaryDirectory()), "bestiary-synthetic.json")
+    write_synthetic_bestiary(path)
+    return lambda: load_monsters(path, stream=True)
+
+
+@benchmark("filter_monsters_by_xp")
+def bench_filter_by_xp(stack):
+    from encounter_generator import load_monsters
+    from main import filter_monsters_by_xp
+    monsters = load_monsters(BUNDLED_BESTIARY)["monster"]
+    return lambda: filter_monsters_by_xp(monsters, 1100)
+
+
+@benchmark("store.filter_monsters")
+def bench_store_filter(stack):
+    from bestiary_store import open_bestiary_store
+    from xp_tables import CR_TO_XP
+    store = open_bestiary_store(BUNDLED_BESTIARY, CR_TO_XP)
+    stack.callback(store.close)
+    return lambda: store.filter_monsters(1100)
+
+
+@benchmark("generate_encounter")
+def bench_generate_encounter(stack):
+    import main
+    from bestiary_store import open_bestiary_store
+    from affinity import open_affinity_graph
+    from sampling import MonsterSampler
+    store = open_bestiary_store(BUNDLED_BESTIARY, main.CR_TO_XP)
+    stack.callback(store.close)
+    monsters = store.filter_monsters(1100)
+    graph = open_affinity_graph(store)
+    sampler = MonsterSampler()
+
+    def answer(prompt, config_file=None):
+        # First environment, never the lair, always minions
+        if "lair" in prompt:
+            return "n"
+        if "minions" in prompt:
+            return "y"
+        return "1"
+    stack.enter_context(patched(main, interactive_input=answer,
+                                generate_environment_description=lambda environment: ""))
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return main.generate_encounter(monsters, 1100, sampler=sampler, seed=12345, graph=graph)
+    return run
+
+
+@benchmark("save_encounter_to_md")
+def bench_save_encounter(stack):
+    import main
+    from bestiary_store import open_bestiary_store
+    store = open_bestiary_store(BUNDLED_BESTIARY, main.CR_TO_XP)
+    stack.callback(store.close)
+    encounter = [store.full_monster(monster) for monster in store.filter_monsters(1100)[:4]]
+    folder = stack.enter_context(tempfile.TemporaryDirectory())
+    calls = iter(range(sys.maxsize))
+
+    def run():
+        # A new title each call, so the name search doesn't grow with the folder
+        with contextlib.redirect_stdout(io.StringIO()):
+            return main.save_encounter_to_md(encounter, folder, "A dark forest.", "Top-down forest map",
+                                             f"Benchmark Encounter {next(calls)}", "forest", "medium", "id")
+    return run
+
+
+@benchmark("ai_client.encounter_title")
+def bench_ai_title(stack):
+    try:
+        import requests  # noqa: F401 - checked here so the benchmark is skipped, not failed
+    except ImportError:
+        raise SkipBenchmark("requests is not installed") from None
+    import ai_client
+    url = start_mock_ai_server(stack)
+    stack.enter_context(patched(ai_client, API_URL=url, _api_key="benchmark", _env_loaded=True))
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return ai_client.generate_encounter_title("forest", "Owlbear")
+    return run
+
+
+@benchmark("async_ai_client.enrich_encounters")
+def bench_async_enrich(stack):
+    try:
+        import httpx  # noqa: F401
+    except ImportError:
+        raise SkipBenchmark("httpx is not installed") from None
+    import async_ai_client
+    url = start_mock_ai_server(stack)
+    stack.enter_context(patched(async_ai_client, API_URL=url))
+    encounters = [([{"name": "Owlbear"}, {"name": "Wolf"}], "forest")] * ASYNC_BATCH
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            with patched(async_ai_client, get_api_key=lambda: "benchmark"):
+                return async_ai_client.enrich_encounters(encounters)
+    return run
+
+
+def time_benchmark(run, runs):
+    """
+    Times a function: each run repeats the call until it lasts MIN_RUN_TIME.
+    :return: Dictionary with median_ms, min_ms, runs and calls_per_run.
+    """
+    start = time.perf_counter()
+    run()  # Warm-up, also used to pick the number of calls per run
+    first = time.perf_counter() - start
+    number = max(1, int(MIN_RUN_TIME / first)) if first > 0 else 1000
+    per_call = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        per_call.append((time.perf_counter() - start) / number * 1000)
+    return {
+        "median_ms": statistics.median(per_call),
+        "min_ms": min(per_call),
+        "runs": runs,
+        "calls_per_run": number,
+    }
+
+
+def run_benchmarks(names, runs):
+    """
+    Runs the named benchmarks.
+    :return: Results document: environment info plus {name: timing or {"skipped": reason}}.
+    """
+    results = {}
+    for name in names:
+        with contextlib.ExitStack() as stack:
+            try:
+                run = BENCHMARKS[name](stack)
+            except SkipBenchmark as e:
+                results[name] = {"skipped": str(e)}
+                print(f"⏭️  {name}: skipped ({e})")
+                continue
+            results[name] = time_benchmark(run, runs)
+            print(f"⏱️  {name}: {results[name]['median_ms']:.3f} ms")
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    Compares results with a baseline by median time.
+    :return: (report lines, list of regressed benchmark names).
+    """
+    lines = [f"{'Benchmark':<36} {'baseline ms':>12} {'current ms':>11} {'change':>8}"]
+    regressions = []
+    for name, current in results["results"].items():
+        previous = baseline.get("results", {}).get(name, {})
+        if "median_ms" not in current or "median_ms" not in previous:
+            lines.append(f"{name:<36} {'-':>12} {current.get('median_ms', float('nan')):>11.3f} {'n/a':>8}")
+            continue
+        change = current["median_ms"] / previous["median_ms"] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = " ❌"
+        lines.append(f"{name:<36} {previous['median_ms']:>12.3f} {current['median_ms']:>11.3f} {change:>+8.1%}{flag}")
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark suite and compare it with a baseline.")
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--out", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Save these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="Slowdown that counts as a regression (0.2 = 20%%)")
+    parser.add_argument("--list", action="store_true", help="List the benchmarks and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        print("\n".join(BENCHMARKS))
+        return
+    names = [name for name in BENCHMARKS if not args.filter or args.filter in name]
+    results = run_benchmarks(names, args.runs)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results written to {args.out}")
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"📌 Baseline saved to {args.baseline}")
+        return
+    try:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"No baseline at {args.baseline} yet (run with --save-baseline to create one).")
+        return
+    lines, regressions = compare(results, baseline, args.threshold)
+    print("\n" + "\n".join(lines))
+    if regressions:
+        print(f"\n❌ Slower than the baseline: {', '.join(regressions)}")
+        sys.exit(1)
+    print("\n✅ No regressions")
+
+
+if __name__ == "__main__":
+    main()
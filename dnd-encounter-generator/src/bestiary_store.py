@@ -0,0 +1,262 @@
+# filepath: src/bestiary_store.py
+# On-disk bestiary store read through mmap.
+#
+# Layout of a store file:
+#   header   magic, version, monster count, length of the meta block
+#   meta     JSON with the environment names, projected fields and source file info
+#   rows     one fixed-width row of numbers per monster (see ROW below)
+#   blob     per-monster JSON: a small summary (projected fields) and the full record
+#
+# Opening a store only maps the file. Filtering by XP/environment reads the rows
+# without decoding any JSON; summaries are decoded for candidates and full records
+# only for monsters that end up in an encounter.
+import json
+import mmap
+import os
+import struct
+from encounter_generator import iter_monsters, project_monster, PROJECTED_FIELDS
+from xp_tables import cr_code, monster_xp
+from encounter_ids import file_hash
+from instrumentation import increment, timed
+
+STORE_MAGIC = b"DNDB"
+STORE_VERSION = 5
+CACHE_DIR = os.path.join(os.path.dirname(__file__), "cache")
+
+# magic, version, monster count, meta length
+HEADER = struct.Struct("<4sIII")
+# xp, hp average, environment bitmask, summary offset, summary length, record offset, record length,
+# CR code (see xp_tables.py), xp in the monster's lair
+ROW = struct.Struct("<IIQQIQIBI")
+# Bits in the environment bitmask of a row
+MAX_ENVIRONMENTS = 64
+
+
+def get_monster_xp(monster, cr_to_xp, in_lair=False):
+    """
+    Get the budget XP of a monster (see xp_tables.monster_xp).
+    :param monster: Monster dictionary.
+    :param cr_to_xp: CR-to-XP mapping (CR_TO_XP in main.py).
+    :param in_lair: Whether the monster is fought in its lair.
+    :return: XP value, 0 if the CR is unknown.
+    """
+    return monster_xp(monster, in_lair, cr_to_xp)
+
+
+def build_store(source_path, store_path, cr_to_xp, fields=PROJECTED_FIELDS):
+    """
+    Converts a bestiary JSON file into a store file.
+    The file is written to a temporary path first and then moved into place,
+    so other processes never see a half-written store.
+    :param source_path: Path to the bestiary JSON file.
+    :param store_path: Where to write the store.
+    :param cr_to_xp: CR-to-XP mapping used for the XP column.
+    :param fields: Fields kept in each monster's summary.
+    """
+    environments = []
+    environment_bits = {}
+    rows = []
+    blob = bytearray()
+
+    for monster in iter_monsters(source_path):
+        mask = 0
+        for env in monster.get("environment", []) or []:
+            if env not in environment_bits:
+                if len(environments) == MAX_ENVIRONMENTS:
+                    raise ValueError(f"{source_path} has more than {MAX_ENVIRONMENTS} environments, "
+                                     f"the most a bestiary store can hold")
+                environment_bits[env] = 1 << len(environments)
+                environments.append(env)
+            mask |= environment_bits[env]
+
+        xp = get_monster_xp(monster, cr_to_xp)
+        lair_xp = get_monster_xp(monster, cr_to_xp, in_lair=True)
+        # Precomputed here because summaries don't keep the fields this needs (legendary, ...)
+        summary = project_monster(monster, fields)
+        summary["_xp"] = xp
+        summary["_lair_xp"] = lair_xp
+        summary = json.dumps(summary, separators=(",", ":")).encode("utf-8")
+        record = json.dumps(monster, separators=(",", ":")).encode("utf-8")
+        summary_offset = len(blob)
+        blob += summary
+        record_offset = len(blob)
+        blob += record
+
+        hp = monster.get("hp", {})
+        hp_average = hp.get("average", 0) if isinstance(hp, dict) else 0
+        rows.append(ROW.pack(
+            xp,
+            hp_average if isinstance(hp_average, int) and hp_average >= 0 else 0,
+            mask,
+            summary_offset, len(summary),
+            record_offset, len(record),
+            cr_code(monster.get("cr", "0")),
+            lair_xp
+        ))
+
+    source_stat = os.stat(source_path)
+    meta = json.dumps({
+        "environments": environments,
+        "fields": list(fields),
+        "source_size": source_stat.st_size,
+        "source_mtime_ns": source_stat.st_mtime_ns,
+        "source_hash": file_hash(source_path),  # Goes into encounter IDs
+    }).encode("utf-8")
+
+    os.makedirs(os.path.dirname(os.path.abspath(store_path)), exist_ok=True)
+    temp_path = f"{store_path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as file:
+        file.write(HEADER.pack(STORE_MAGIC, STORE_VERSION, len(rows), len(meta)))
+        file.write(meta)
+        file.write(b"".join(rows))
+        file.write(blob)
+    os.replace(temp_path, store_path)
+
+
+class BestiaryStore:
+    """
+    Read-only view of a store file. Monsters are addressed by their index in the store.
+    """
+
+    def __init__(self, store_path):
+        self.path = store_path
+        self._file = open(store_path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise  # Empty file
+        magic, version, count, meta_length = HEADER.unpack_from(self._map, 0)
+        if magic != STORE_MAGIC or version != STORE_VERSION:
+            self.close()
+            raise ValueError(f"{store_path} is not a bestiary store (version {STORE_VERSION})")
+        self.count = count
+        self.meta = json.loads(self._map[HEADER.size:HEADER.size + meta_length])
+        self.environments = self.meta["environments"]
+        self._rows_start = HEADER.size + meta_length
+        self._blob_start = self._rows_start + count * ROW.size
+        self._rows = memoryview(self._map)[self._rows_start:self._blob_start]
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        if getattr(self, "_rows", None) is not None:
+            self._rows.release()
+            self._rows = None
+        self._map.close()
+        self._file.close()
+
+    def row(self, index):
+        """
+        Returns the numeric columns of a monster as a tuple (see ROW).
+        """
+        return ROW.unpack_from(self._rows, index * ROW.size)
+
+    def xp(self, index):
+        return self.row(index)[0]
+
+    def cr_code(self, index):
+        return self.row(index)[7]
+
+    def lair_xp(self, index):
+        return self.row(index)[8]
+
+    def _decode(self, offset, length):
+        start = self._blob_start + offset
+        return json.loads(self._map[start:start + length])
+
+    def summary(self, index):
+        """
+        Decodes the projected fields of a monster. The result carries "_store_index"
+        so the full record can be fetched later with full_monster().
+        """
+        _, _, _, offset, length, _, _, _, _ = self.row(index)
+        monster = self._decode(offset, length)
+        monster["_store_index"] = index
+        return monster
+
+    def record(self, index):
+        """
+        Decodes the full record of a monster (actions, traits, ...).
+        """
+        _, _, _, _, _, offset, length, _, _ = self.row(index)
+        return self._decode(offset, length)
+
+    def full_monster(self, monster):
+        """
+        Returns the full record for a summary from this store (or the monster itself
+        if it didn't come from a store).
+        """
+        if "_store_index" not in monster:
+            return monster
+        return self.record(monster["_store_index"])
+
+    @timed("select.filter")
+    def filter_indexes(self, max_xp, min_xp=0, environment=None, in_lair=False):
+        """
+        Finds monsters by XP range and environment using only the numeric columns.
+        :param max_xp: Maximum XP value.
+        :param min_xp: Minimum XP value.
+        :param environment: Environment name, or None/"any" for all environments.
+        :param in_lair: Compare the monsters' lair XP instead.
+        :return: List of monster indexes.
+        """
+        mask = 0
+        if environment and environment != "any":
+            if environment not in self.environments:
+                return []
+            mask = 1 << self.environments.index(environment)
+        return [
+            index for index, (xp, _, env_mask, _, _, _, _, _, lair_xp) in enumerate(ROW.iter_unpack(self._rows))
+            if min_xp <= (lair_xp if in_lair else xp) <= max_xp and (not mask or env_mask & mask)
+        ]
+
+    def filter_monsters(self, max_xp, min_xp=0, environment=None, in_lair=False):
+        """
+        Same as filter_indexes() but returns the decoded summaries.
+        """
+        return [self.summary(index) for index in self.filter_indexes(max_xp, min_xp, environment, in_lair)]
+
+    def monsters(self):
+        """
+        Decodes the summaries of every monster in the store.
+        """
+        return [self.summary(index) for index in range(self.count)]
+
+
+def get_store_path(source_path):
+    """
+    Returns the cache path of the store for a bestiary file.
+    """
+    name = os.path.splitext(os.path.basename(source_path))[0]
+    return os.path.join(CACHE_DIR, f"{name}.store")
+
+
+@timed("bestiary.open")
+def open_bestiary_store(source_path, cr_to_xp, fields=PROJECTED_FIELDS, store_path=None):
+    """
+    Opens the store for a bestiary file, (re)building it if it's missing or out of date.
+    :param source_path: Path to the bestiary JSON file.
+    :param cr_to_xp: CR-to-XP mapping used for the XP column.
+    :param fields: Fields kept in each monster's summary.
+    :param store_path: Optional store path (defaults to src/cache/<bestiary>.store).
+    :return: A BestiaryStore.
+    """
+    store_path = store_path or get_store_path(source_path)
+    source_stat = os.stat(source_path)
+    try:
+        store = BestiaryStore(store_path)
+    except (FileNotFoundError, ValueError, struct.error, json.JSONDecodeError):
+        store = None
+    if store is not None:
+        meta = store.meta
+        if (meta.get("source_size") == source_stat.st_size
+                and meta.get("source_mtime_ns") == source_stat.st_mtime_ns
+                and meta.get("fields") == list(fields)):
+            increment("cache.store.hit")
+            return store
+        store.close()
+    increment("cache.store.miss")
+    build_store(source_path, store_path, cr_to_xp, fields)
+    return BestiaryStore(store_path)
@@ -0,0 +1,377 @@
+# filepath: src/constraints.py
+# Thematic encounters: compositions that follow constraints such as "all undead",
+# "a Large-or-bigger leader with minions of its own kind" or "no flying creatures".
+#
+# Every monster in the bestiary store gets one bit. Attributes (type, tags, size,
+# alignment, speeds) are turned into bitmasks once, when the ConstraintIndex is built,
+# and XP/CR ranges into prefix masks over the monsters sorted by value. A constraint
+# set then compiles into a couple of AND-ed masks, and a small backtracking search
+# picks the leader and minions from them. No rejection sampling.
+#
+# Constraints are short strings, so they fit in the config and on the command line:
+#   type:undead[,fiend]    every monster is one of these types
+#   leader-type:dragon     the leader is one of these types
+#   min-size:L             every monster is at least this size (T, S, M, L, H, G)
+#   max-size:M             every monster is at most this size
+#   leader-min-size:L      the leader is at least this size
+#   alignment:E            every monster's alignment includes this (L, N, C, G, E, U = unaligned, A = any)
+#   no-fly                 no monster has this speed (also no-swim, no-climb, no-burrow)
+#   same-tags              minions share a type tag with the leader (or its type, if it has no tags)
+#   max-cr-gap:5           no two monsters are more than this many CR apart
+#   min-minions:2          at least this many minions
+#
+# Usage: python constraints.py -c type:undead -c no-fly --count 10 [--max-xp 1100] [--seed 1]
+import argparse
+import json
+import os
+import random
+from bisect import bisect_left, bisect_right
+from fractions import Fraction
+from sampling import get_monster_type
+from text_index import SPEED_MODES
+from xp_tables import CR_VALUES, UNKNOWN_CR
+
+SIZES = ("T", "S", "M", "L", "H", "G")
+# Search nodes tried per encounter before giving up on it
+MAX_NODES = 5000
+
+# CR code -> numeric CR, for CR gaps (unknown CRs never match a gap)
+CR_NUMBERS = [float(Fraction(cr)) for cr in CR_VALUES] + [float("inf")]
+
+
+def get_monster_tags(monster):
+    """
+    Returns the type tags of a monster ("demon", "goblinoid", ...) as a tuple.
+    """
+    monster_type = monster.get("type")
+    if not isinstance(monster_type, dict):
+        return ()
+    tags = []
+    for tag in monster_type.get("tags", []):
+        if isinstance(tag, dict):  # {"tag": "elf", "prefix": "high"}
+            tag = tag.get("tag", "")
+        if isinstance(tag, str) and tag:
+            tags.append(tag.lower())
+    return tuple(tags)
+
+
+def get_monster_alignment(monster):
+    """
+    Returns the set of alignment letters of a monster (e.g. {"C", "E"}).
+    """
+    letters = set()
+    for part in monster.get("alignment", []):
+        if isinstance(part, str):
+            letters.add(part)
+        elif isinstance(part, dict):  # {"alignment": ["N", "E"], "chance": 50}
+            letters.update(a for a in part.get("alignment", []) if isinstance(a, str))
+    return letters
+
+
+def _prefix_masks(values):
+    """
+    Sorts monsters by value and builds prefix masks, so every value range becomes a
+    mask in O(log n) (see _range_mask).
+    :param values: One value per monster index.
+    :return: (sorted values, prefix masks); prefix_masks[k] holds the k lowest monsters.
+    """
+    order = sorted(range(len(values)), key=values.__getitem__)
+    prefix_masks = [0]
+    for index in order:
+        prefix_masks.append(prefix_masks[-1] | (1 << index))
+    return [values[index] for index in order], prefix_masks
+
+
+def _range_mask(sorted_values, prefix_masks, low, high):
+    start = bisect_left(sorted_values, low)
+    end = bisect_right(sorted_values, high)
+    return prefix_masks[end] & ~prefix_masks[start]
+
+
+def iter_bits(mask):
+    """
+    Yields the monster indexes set in a mask, lowest first.
+    """
+    while mask:
+        low_bit = mask & -mask
+        yield low_bit.bit_length() - 1
+        mask ^= low_bit
+
+
+def parse_constraints(specs):
+    """
+    Parses constraint strings (see the top of this file).
+    :param specs: List of strings like "type:undead" or "no-fly".
+    :return: Dictionary of constraints.
+    :raises ValueError: If a constraint is unknown or malformed.
+    """
+    constraints = {}
+    for spec in specs:
+        name, _, value = spec.strip().lower().partition(":")
+        if name in ("type", "leader-type"):
+            constraints[name] = {part.strip() for part in value.split(",") if part.strip()}
+        elif name in ("min-size", "max-size", "leader-min-size"):
+            if value.upper() not in SIZES:
+                raise ValueError(f"Unknown size in {spec!r} (use one of {', '.join(SIZES)})")
+            constraints[name] = SIZES.index(value.upper())
+        elif name == "alignment":
+            constraints[name] = value.upper()
+        elif name.startswith("no-") and name[3:] in SPEED_MODES:
+            constraints.setdefault("no-speed", set()).add(name[3:])
+        elif name == "same-tags":
+            constraints[name] = True
+        elif name in ("max-cr-gap", "min-minions"):
+            try:
+                constraints[name] = float(Fraction(value)) if name == "max-cr-gap" else int(value)
+            except (ValueError, ZeroDivisionError):
+                raise ValueError(f"{spec!r} needs a number") from None
+        else:
+            raise ValueError(f"Unknown constraint: {spec!r}")
+    return constraints
+
+
+class ConstraintIndex:
+    """
+    Attribute masks over every monster of a bestiary store. Build it once and reuse it
+    for a whole batch.
+
+        index = ConstraintIndex(store)
+        encounter = compose_encounter(index, parse_constraints(["type:undead"]), 1100)
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.count = len(store)
+        self.all = (1 << self.count) - 1
+        self.type_masks = {}
+        self.tag_masks = {}
+        self.size_masks = [0] * len(SIZES)
+        self.alignment_masks = {}
+        self.speed_masks = {mode: 0 for mode in SPEED_MODES}
+        self.environment_masks = {name: 0 for name in store.environments}
+        # Per monster: what "same-tags" minions have to share with it
+        self.kin_keys = []
+        xp_values = []
+        cr_numbers = []
+
+        for index in range(self.count):
+            bit = 1 << index
+            monster = store.record(index)
+            xp, _, env_mask, _, _, _, _, code, _ = store.row(index)
+            xp_values.append(xp)
+            cr_numbers.append(CR_NUMBERS[code] if code != UNKNOWN_CR else CR_NUMBERS[-1])
+
+            monster_type = get_monster_type(monster).lower()
+            self.type_masks[monster_type] = self.type_masks.get(monster_type, 0) | bit
+            tags = get_monster_tags(monster)
+            for tag in tags:
+                self.tag_masks[tag] = self.tag_masks.get(tag, 0) | bit
+            self.kin_keys.append(tags or (None, monster_type))
+
+            for size in monster.get("size", []):
+                if size in SIZES:
+                    self.size_masks[SIZES.index(size)] |= bit
+            for letter in get_monster_alignment(monster):
+                self.alignment_masks[letter] = self.alignment_masks.get(letter, 0) | bit
+            speed = monster.get("speed", {})
+            if isinstance(speed, dict):
+                for mode in SPEED_MODES:
+                    if speed.get(mode):
+                        self.speed_masks[mode] |= bit
+            for i, name in enumerate(store.environments):
+                if env_mask & (1 << i):
+                    self.environment_masks[name] |= bit
+
+        self._xp = xp_values
+        self._cr = cr_numbers
+        self._xp_sorted, self._xp_prefix = _prefix_masks(xp_values)
+        self._cr_sorted, self._cr_prefix = _prefix_masks(cr_numbers)
+        self._kin_cache = {}
+
+    def xp(self, index):
+        return self._xp[index]
+
+    def xp_mask(self, low, high):
+        """
+        Monsters worth between low and high XP (inclusive).
+        """
+        return _range_mask(self._xp_sorted, self._xp_prefix, low, high)
+
+    def cr_gap_mask(self, index, gap):
+        """
+        Monsters whose CR is at most gap away from this monster's CR.
+        """
+        cr = self._cr[index]
+        return _range_mask(self._cr_sorted, self._cr_prefix, cr - gap, cr + gap)
+
+    def kin_mask(self, index):
+        """
+        Monsters sharing a type tag with this monster, or its type if it has no tags.
+        """
+        key = self.kin_keys[index]
+        if key not in self._kin_cache:
+            if key[0] is None:
+                mask = self.type_masks.get(key[1], 0)
+            else:
+                mask = 0
+                for tag in key:
+                    mask |= self.tag_masks.get(tag, 0)
+            self._kin_cache[key] = mask
+        return self._kin_cache[key]
+
+    def size_range_mask(self, low=0, high=len(SIZES) - 1):
+        mask = 0
+        for size in range(low, high + 1):
+            mask |= self.size_masks[size]
+        return mask
+
+    def compile(self, constraints, environment="any"):
+        """
+        Compiles constraints into (leader mask, member mask). Relational constraints
+        (same-tags, max-cr-gap) depend on the chosen monsters and are applied during search.
+        """
+        members = self.all
+        if environment != "any":
+            members &= self.environment_masks.get(environment, 0)
+        if "type" in constraints:
+            members &= self._types_mask(constraints["type"])
+        if "min-size" in constraints or "max-size" in constraints:
+            members &= self.size_range_mask(constraints.get("min-size", 0), constraints.get("max-size", len(SIZES) - 1))
+        if "alignment" in constraints:
+            members &= self.alignment_masks.get(constraints["alignment"], 0)
+        for mode in constraints.get("no-speed", ()):
+            members &= ~self.speed_masks[mode]
+
+        leaders = members
+        if "leader-type" in constraints:
+            leaders &= self._types_mask(constraints["leader-type"])
+        if "leader-min-size" in constraints:
+            leaders &= self.size_range_mask(constraints["leader-min-size"])
+        return leaders, members
+
+    def _types_mask(self, types):
+        mask = 0
+        for monster_type in types:
+            mask |= self.type_masks.get(monster_type, 0)
+        return mask
+
+
+def _add_minions(index, allowed, remaining_xp, chosen, constraints, max_minions, rng, nodes):
+    """
+    Backtracking over minions: extends chosen until no minion fits, and backs up only
+    when that leaves fewer than min-minions. Returns the minion indexes or None.
+    """
+    nodes[0] += 1
+    enough = len(chosen) >= constraints.get("min-minions", 0)
+    if len(chosen) == max_minions or nodes[0] > MAX_NODES:
+        return chosen if enough else None
+    candidates = list(iter_bits(allowed & index.xp_mask(1, remaining_xp)))
+    if not candidates:
+        return chosen if enough else None
+    rng.shuffle(candidates)
+    gap = constraints.get("max-cr-gap")
+    for candidate in candidates:
+        next_allowed = allowed & ~(1 << candidate)
+        if gap is not None:
+            next_allowed &= index.cr_gap_mask(candidate, gap)
+        result = _add_minions(index, next_allowed, remaining_xp - index.xp(candidate), chosen + [candidate],
+                              constraints, max_minions, rng, nodes)
+        if result is not None:
+            return result
+        if nodes[0] > MAX_NODES:
+            break
+    return None
+
+
+def compose_encounter(index, constraints, max_xp, environment="any", max_minions=3, rng=random, compiled=None):
+    """
+    Builds one encounter that satisfies the constraints: a leader worth 50%-90% of the
+    XP pool (like pick_main_monster) plus up to max_minions different minions.
+    :param index: ConstraintIndex of the bestiary store.
+    :param constraints: Dictionary from parse_constraints().
+    :param max_xp: Maximum XP for the encounter.
+    :param environment: Environment name, or "any".
+    :param max_minions: Maximum number of minions.
+    :param rng: Random number generator.
+    :param compiled: Result of index.compile() to reuse across a batch.
+    :return: List of monster summaries, leader first. Empty if nothing satisfies the constraints.
+    """
+    leaders, members = compiled or index.compile(constraints, environment)
+    leaders &= index.xp_mask(max(int(max_xp * 0.5), 1), int(max_xp * 0.9))
+    candidates = list(iter_bits(leaders))
+    rng.shuffle(candidates)
+    nodes = [0]
+    gap = constraints.get("max-cr-gap")
+    for leader in candidates:
+        allowed = members & ~(1 << leader)
+        if constraints.get("same-tags"):
+            allowed &= index.kin_mask(leader)
+        if gap is not None:
+            allowed &= index.cr_gap_mask(leader, gap)
+        minions = _add_minions(index, allowed, max_xp - index.xp(leader), [], constraints, max_minions, rng, nodes)
+        if minions is not None:
+            return [index.store.summary(i) for i in [leader] + minions]
+        if nodes[0] > MAX_NODES:
+            break
+    return []
+
+
+def compose_encounters(index, constraints, max_xp, count, environment="any", max_minions=3, seed=None):
+    """
+    Batch mode: builds count encounters with the same constraints, compiling them once.
+    :return: List of encounters (empty lists where nothing fit).
+    """
+    rng = random.Random(seed)
+    compiled = index.compile(constraints, environment)
+    return [compose_encounter(index, constraints, max_xp, environment, max_minions, rng, compiled) for _ in range(count)]
+
+
+def main():
+    from bestiary_store import open_bestiary_store
+    from encounter_generator import PROJECTED_FIELDS
+    from main import CR_TO_XP, calculate_party_thresholds, get_adventurer_levels
+
+    parser = argparse.ArgumentParser(description="Generate thematic encounters that follow constraints.")
+    parser.add_argument("-c", "--constraint", action="append", default=[], help="Constraint such as type:undead (repeatable)")
+    parser.add_argument("--max-xp", type=int, help="XP pool (defaults to the saved party's medium threshold)")
+    parser.add_argument("--count", type=int, default=10)
+    parser.add_argument("--environment", default="any")
+    parser.add_argument("--max-minions", type=int, default=3)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", action="store_true", help="Print the encounters as JSON")
+    args = parser.parse_args()
+
+    config_file = os.path.join(os.path.dirname(__file__), "config", "config.json")
+    try:
+        with open(config_file, "r") as f:
+            config = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        config = {}
+    try:
+        constraints = parse_constraints(args.constraint)
+    except ValueError as e:
+        parser.error(str(e))
+    max_xp = args.max_xp
+    if max_xp is None:
+        party_info = config.get("party_info", {})
+        thresholds = calculate_party_thresholds(party_info.get("level") or 1, party_info.get("size") or 4,
+                                                get_adventurer_levels(party_info))
+        max_xp = thresholds["medium"]
+
+    monster_source = config.get("monster_source", "bestiary-mm.json")
+    store = open_bestiary_store(os.path.join(os.path.dirname(__file__), "data", monster_source), CR_TO_XP,
+                                config.get("monster_fields", PROJECTED_FIELDS))
+    index = ConstraintIndex(store)
+    encounters = compose_encounters(index, constraints, max_xp, args.count, args.environment, args.max_minions, args.seed)
+    if args.json:
+        print(json.dumps([[monster.get("name") for monster in encounter] for encounter in encounters], indent=2))
+    else:
+        print(f"\n🎯 {args.count} encounters for {max_xp} XP ({', '.join(args.constraint) or 'no constraints'})\n")
+        for i, encounter in enumerate(encounters, 1):
+            names = ", ".join(f"{monster.get('name', 'Unknown')} (CR {monster.get('cr', '?')})" for monster in encounter)
+            print(f"{i}. {names or '😢 Nothing satisfies these constraints.'}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
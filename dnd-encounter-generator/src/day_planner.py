@@ -0,0 +1,232 @@
+# filepath: src/day_planner.py
+# Plans a whole adventuring day: several encounters whose adjusted XP adds up to the
+# party's adventuring-day budget (DMG pg. 84), following a difficulty curve.
+#
+# Candidate encounters for every slot are generated in parallel across a process pool,
+# then one candidate per slot is chosen so the day as a whole lands on its budget.
+#
+# Usage: python day_planner.py --encounters 6 --curve rising [--level 5 --size 4] [--save]
+import argparse
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from bestiary_store import open_bestiary_store
+from encounter_generator import PROJECTED_FIELDS
+from main import CR_TO_XP, get_adventurer_levels, build_encounter, save_encounter_to_md
+from xp_tables import adjusted_xp, encounter_xp
+
+# Adjusted XP per character per adventuring day (DMG pg. 84)
+ADVENTURING_DAY_XP = {
+    1: 300, 2: 600, 3: 1200, 4: 1700, 5: 3500,
+    6: 4000, 7: 5000, 8: 6000, 9: 7500, 10: 9000,
+    11: 10500, 12: 11500, 13: 13500, 14: 15000, 15: 18000,
+    16: 20000, 17: 25000, 18: 27000, 19: 30000, 20: 40000
+}
+
+# Relative size of each encounter in the day, by its index and the number of encounters
+DIFFICULTY_CURVES = {
+    "flat": lambda i, count: 1.0,
+    "rising": lambda i, count: 1.0 + i / max(count - 1, 1),
+    "climax": lambda i, count: 3.0 if i == count - 1 else 1.0,
+    "wave": lambda i, count: 1.6 if i % 2 else 1.0,
+}
+
+# How far each slot's candidates stray from the slot's target (as max XP factors)
+CANDIDATE_SPREAD = (0.6, 1.4)
+# Retries per candidate whose adjusted XP overshoots its goal
+MAX_RETRIES = 3
+# How much being off a slot's own target costs compared to missing the day's budget
+SLOT_WEIGHT = 0.25
+# Budget resolution of the optimizer
+BUCKETS = 400
+
+_worker_monsters = None
+
+
+def get_day_budget(party_level, party_size, adventurer_levels=None):
+    """
+    Adjusted XP budget for the day, summed per adventurer for mixed-level parties.
+    """
+    levels = adventurer_levels or [party_level] * party_size
+    return sum(ADVENTURING_DAY_XP.get(level, 0) for level in levels)
+
+
+def get_curve_targets(budget, count, curve="rising"):
+    """
+    Splits the day's budget into per-encounter targets following a curve.
+    """
+    shape = DIFFICULTY_CURVES[curve]
+    shares = [shape(i, count) for i in range(count)]
+    total = sum(shares)
+    return [budget * share / total for share in shares]
+
+
+def _init_worker(source_path, fields=PROJECTED_FIELDS):
+    """
+    Runs once per worker process: maps the bestiary store (already built by the parent).
+    """
+    global _worker_monsters
+    _worker_monsters = open_bestiary_store(source_path, CR_TO_XP, fields).monsters()
+
+
+def _generate_candidates(task):
+    """
+    Generates candidate encounters for one slot. Each task has its own seed, so
+    results don't depend on which worker runs it.
+    """
+    slot, target, count, environment, seed = task
+    rng = random.Random(seed)
+    low, high = CANDIDATE_SPREAD
+    candidates = []
+    for _ in range(count):
+        goal = target * rng.uniform(low, high)
+        # build_encounter caps raw XP, the goal is adjusted XP: when minions push the
+        # multiplier over it, retry with the cap scaled down by the overshoot
+        max_xp = goal
+        for _ in range(MAX_RETRIES + 1):
+            encounter = build_encounter(_worker_monsters, int(max_xp), environment, rng=rng)
+            if not encounter:
+                break
+            xp = adjusted_xp(encounter_xp(encounter), len(encounter))
+            if xp <= goal:
+                break
+            max_xp *= goal / xp
+        if encounter:
+            candidates.append((xp, encounter))
+    return slot, candidates
+
+
+def choose_encounters(slot_candidates, targets, budget):
+    """
+    Picks one candidate per slot so the total adjusted XP is as close to the budget as
+    possible, while each encounter stays near its own target. Dynamic programming over
+    the running total (rounded to budget / BUCKETS), so it's exact up to that rounding.
+    :param slot_candidates: Per slot, a list of (adjusted_xp, encounter) pairs.
+    :param targets: Per slot, the target adjusted XP.
+    :param budget: The day's adjusted XP budget.
+    :return: List with the chosen (adjusted_xp, encounter) for every slot.
+    :raises ValueError: If a slot has no candidates (no monster fits its target).
+    """
+    for slot, candidates in enumerate(slot_candidates):
+        if not candidates:
+            raise ValueError(f"No encounter fits slot {slot + 1} (target {targets[slot]:.0f} XP); "
+                             "try a bigger budget, fewer encounters or another environment")
+    step = max(budget / BUCKETS, 1.0)
+    # running total bucket -> (cost so far, exact total, chosen candidate indexes)
+    states = {0: (0.0, 0.0, ())}
+    for slot, candidates in enumerate(slot_candidates):
+        next_states = {}
+        for cost, total, chosen in states.values():
+            for i, (xp, _) in enumerate(candidates):
+                new_cost = cost + SLOT_WEIGHT * ((xp - targets[slot]) / budget) ** 2
+                new_total = total + xp
+                bucket = round(new_total / step)
+                if bucket not in next_states or new_cost < next_states[bucket][0]:
+                    next_states[bucket] = (new_cost, new_total, chosen + (i,))
+        states = next_states
+    _, _, best = min(states.values(), key=lambda state: state[0] + ((state[1] - budget) / budget) ** 2)
+    return [slot_candidates[slot][i] for slot, i in enumerate(best)]
+
+
+def plan_day(source_path, party_level, party_size, encounters=6, curve="rising", budget=None,
+             environment="any", candidates_per_slot=60, workers=None, seed=None, adventurer_levels=None,
+             fields=PROJECTED_FIELDS):
+    """
+    Plans an adventuring day.
+    :param source_path: Path to the bestiary JSON file.
+    :param party_level: Level of the party members.
+    :param party_size: Number of party members.
+    :param encounters: Number of encounters in the day.
+    :param curve: Difficulty curve, one of DIFFICULTY_CURVES.
+    :param budget: Adjusted XP for the whole day (defaults to the DMG budget).
+    :param environment: Environment name, or "any".
+    :param candidates_per_slot: How many candidate encounters to generate per slot.
+    :param workers: Number of worker processes (defaults to the CPU count).
+    :param seed: Seed for reproducible plans.
+    :param adventurer_levels: Optional list of every adventurer's own level.
+    :param fields: Summary fields of the store (the config's "monster_fields").
+    :return: Dictionary with the budget, the total and the list of planned encounters.
+    :raises ValueError: If no encounter fits one of the slots.
+    """
+    if budget is None:
+        budget = get_day_budget(party_level, party_size, adventurer_levels)
+    targets = get_curve_targets(budget, encounters, curve)
+    open_bestiary_store(source_path, CR_TO_XP, fields).close()  # Build the store once, before the workers map it
+
+    seeds = random.Random(seed)
+    # Split every slot into a few tasks so the pool stays busy even for short days
+    per_task = max(candidates_per_slot // 4, 1)
+    tasks = []
+    for slot, target in enumerate(targets):
+        for start in range(0, candidates_per_slot, per_task):
+            tasks.append((slot, target, min(per_task, candidates_per_slot - start), environment, seeds.getrandbits(64)))
+
+    slot_candidates = [[] for _ in targets]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(source_path, fields)) as pool:
+        for slot, candidates in pool.map(_generate_candidates, tasks):
+            slot_candidates[slot].extend(candidates)
+
+    chosen = choose_encounters(slot_candidates, targets, budget)
+    planned = [
+        {"target": round(target), "adjusted_xp": xp, "monsters": encounter}
+        for target, (xp, encounter) in zip(targets, chosen)
+    ]
+    return {
+        "budget": budget,
+        "curve": curve,
+        "total_adjusted_xp": sum(encounter["adjusted_xp"] for encounter in planned),
+        "encounters": planned,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan a full adventuring day of encounters.")
+    parser.add_argument("--level", type=int, help="Party level (defaults to the saved party)")
+    parser.add_argument("--size", type=int, help="Number of adventurers (defaults to the saved party)")
+    parser.add_argument("--encounters", type=int, default=6, help="Encounters in the day")
+    parser.add_argument("--curve", choices=sorted(DIFFICULTY_CURVES), default="rising")
+    parser.add_argument("--budget", type=int, help="Adjusted XP for the day (defaults to DMG pg. 84)")
+    parser.add_argument("--environment", default="any")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--save", action="store_true", help="Save every encounter to the save folder")
+    args = parser.parse_args()
+
+    config_file = os.path.join(os.path.dirname(__file__), "config", "config.json")
+    try:
+        with open(config_file, "r") as f:
+            config = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        config = {}
+    party_info = config.get("party_info", {})
+    party_level = args.level or party_info.get("level") or 1
+    party_size = args.size or party_info.get("size") or 4
+    # The saved adventurers' own levels count unless the party is given on the command line
+    adventurer_levels = None if (args.level or args.size) else get_adventurer_levels(party_info)
+    monster_source = config.get("monster_source", "bestiary-mm.json")
+    source_path = os.path.join(os.path.dirname(__file__), "data", monster_source)
+
+    try:
+        plan = plan_day(source_path, party_level, party_size, args.encounters, args.curve, args.budget,
+                        args.environment, workers=args.workers, seed=args.seed, adventurer_levels=adventurer_levels,
+                        fields=config.get("monster_fields", PROJECTED_FIELDS))
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"\n📅 Adventuring day for {party_size} adventurers of level {party_level} ({plan['curve']} curve)")
+    print(f"   Budget: {plan['budget']} XP, planned: {plan['total_adjusted_xp']:.0f} XP\n")
+    for i, encounter in enumerate(plan["encounters"], 1):
+        names = ", ".join(monster.get("name", "Unknown") for monster in encounter["monsters"])
+        print(f"{i}. {encounter['adjusted_xp']:.0f} XP (target {encounter['target']}): {names}")
+
+    if args.save:
+        folder_paths = config.get("folder_paths", [])
+        folder_path = folder_paths[-1] if folder_paths else "./encounters"
+        for i, encounter in enumerate(plan["encounters"], 1):
+            title = f"Day Encounter {i} {encounter['monsters'][0].get('name', 'Unknown')}"
+            save_encounter_to_md(encounter["monsters"], folder_path, encounter_title=title,
+                                 environment_name=args.environment)
+
+
+if __name__ == "__main__":
+    main()
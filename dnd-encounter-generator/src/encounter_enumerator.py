@@ -0,0 +1,186 @@
+# filepath: src/encounter_enumerator.py
+# Lists every valid encounter for a budget instead of picking one at random:
+# one main monster worth 50%-90% of the budget plus up to K minions (repeats allowed)
+# that fit in the XP left over, best fit first.
+#
+# Monsters are grouped by XP value, so the search runs over "shapes" (a main XP value
+# plus a multiset of minion XP values) rather than over individual monsters. Shapes are
+# found with branch-and-bound on adjusted XP and memoized per main XP value; only then
+# are they expanded into concrete monster combinations, lazily and in order of fit.
+#
+# Usage: python encounter_enumerator.py [--max-xp 1200 | --difficulty hard] [--environment forest]
+#                                       [--max-minions 3] [--time-budget 2] [--limit 100] [--out shapes.jsonl]
+import argparse
+import json
+import os
+import sys
+import time
+from itertools import combinations_with_replacement, product
+from xp_tables import monster_xp, multiplier
+
+# Compositions whose adjusted XP is further than this from the target are skipped
+MAX_ERROR = 0.25
+
+
+def _fit(adjusted, target):
+    return abs(adjusted - target) / target
+
+
+def _find_shapes(main_xp, levels, max_xp, max_minions, target, max_error, deadline):
+    """
+    Finds every minion XP multiset for one main XP value.
+    :param levels: Distinct minion XP values, highest first.
+    :return: List of (fit, minion XP tuple, total XP, adjusted XP).
+    """
+    low, high = target * (1 - max_error), target * (1 + max_error)
+    best_multiplier = multiplier(max_minions + 1)
+    shapes = []
+
+    def extend(start, chosen, total):
+        if deadline and time.perf_counter() > deadline:
+            return
+        adjusted = total * multiplier(len(chosen) + 1)
+        if low <= adjusted <= high:
+            shapes.append((_fit(adjusted, target), tuple(chosen), total, adjusted))
+        if len(chosen) == max_minions:
+            return
+        # Adding minions only ever raises adjusted XP, so once we're above the window stop
+        if adjusted > high:
+            return
+        budget_left = max_xp - total
+        # levels are sorted high to low: skip the ones that no longer fit
+        while start < len(levels) and levels[start] > budget_left:
+            start += 1
+        if start == len(levels):
+            return
+        # Upper bound for this branch: fill every free slot with the biggest minion that
+        # still fits (capped by the XP left), at the multiplier of a full encounter
+        slots = max_minions - len(chosen)
+        if (total + min(budget_left, slots * levels[start])) * best_multiplier < low:
+            return
+        for i in range(start, len(levels)):
+            xp = levels[i]
+            chosen.append(xp)
+            extend(i, chosen, total + xp)  # i, not i + 1: the same XP value can repeat
+            chosen.pop()
+
+    extend(0, [], main_xp)
+    return shapes
+
+
+def enumerate_encounters(monsters, max_xp, environment="any", max_minions=3, target_xp=None,
+                         max_error=MAX_ERROR, time_budget=None):
+    """
+    Yields every encounter composition for a budget, best fit first.
+    :param monsters: List of monster dictionaries.
+    :param max_xp: Maximum XP for the encounter (same meaning as in build_encounter).
+    :param environment: Environment name, or "any".
+    :param max_minions: Maximum number of minions (K).
+    :param target_xp: Adjusted XP to aim for (defaults to max_xp, the difficulty threshold).
+    :param max_error: Skip compositions whose adjusted XP is off the target by more than this fraction.
+    :param time_budget: Optional number of seconds after which enumeration stops. It covers
+                        both the shape search and the expansion into monsters: if it runs
+                        out during the search, the shapes found so far are not ranked and
+                        nothing is yielded; if it runs out during the expansion, the
+                        generator stops after the compositions already yielded, which are
+                        the best fits (in order) among the shapes found.
+    :return: Generator of dictionaries with "monsters" (main first), "xp", "adjusted_xp" and
+             "fit" (0 is a perfect fit).
+    """
+    deadline = time.perf_counter() + time_budget if time_budget else None
+    target = target_xp or max_xp
+    if target <= 0:
+        return
+
+    by_xp = {}
+    for monster in monsters:
+        if environment != "any" and environment not in monster.get("environment", []):
+            continue
+        xp = monster_xp(monster)
+        if 0 < xp <= max_xp:
+            by_xp.setdefault(xp, []).append(monster)
+    levels = sorted(by_xp, reverse=True)
+    min_main_xp = int(max_xp * 0.5)
+    max_main_xp = int(max_xp * 0.9)
+
+    # Memoized per main XP value: every main monster with that XP shares the same shapes
+    shapes = []
+    for main_xp in levels:
+        if min_main_xp <= main_xp <= max_main_xp:
+            for fit, minion_xps, total, adjusted in _find_shapes(
+                    main_xp, levels, max_xp, max_minions, target, max_error, deadline):
+                shapes.append((fit, main_xp, minion_xps, total, adjusted))
+    shapes.sort(key=lambda shape: (shape[0], len(shape[2])))
+
+    for fit, main_xp, minion_xps, total, adjusted in shapes:
+        counts = {}
+        for xp in minion_xps:
+            counts[xp] = counts.get(xp, 0) + 1
+        for main_monster in by_xp[main_xp]:
+            groups = [
+                combinations_with_replacement([m for m in by_xp[xp] if m is not main_monster], count)
+                for xp, count in counts.items()
+            ]
+            for picks in product(*groups):
+                if deadline and time.perf_counter() > deadline:
+                    return
+                encounter = [main_monster]
+                for pick in picks:
+                    encounter.extend(pick)
+                yield {"monsters": encounter, "xp": total, "adjusted_xp": adjusted, "fit": fit}
+
+
+def main():
+    from bestiary_store import open_bestiary_store
+    from encounter_generator import PROJECTED_FIELDS
+    from main import CR_TO_XP, calculate_party_thresholds, get_adventurer_levels
+    from xp_tables import DIFFICULTIES
+
+    parser = argparse.ArgumentParser(description="List every encounter for a budget, best fit first.")
+    parser.add_argument("--max-xp", type=int, help="XP pool (defaults to the saved party's threshold)")
+    parser.add_argument("--difficulty", choices=DIFFICULTIES, default="medium")
+    parser.add_argument("--environment", default="any")
+    parser.add_argument("--max-minions", type=int, default=3, help="Most minions per encounter (K)")
+    parser.add_argument("--target-xp", type=int, help="Adjusted XP to aim for (defaults to the XP pool)")
+    parser.add_argument("--max-error", type=float, default=MAX_ERROR, help="Largest allowed miss of the target")
+    parser.add_argument("--time-budget", type=float, help="Seconds for the whole enumeration")
+    parser.add_argument("--limit", type=int, help="Stop after this many encounters")
+    parser.add_argument("--out", help="JSON Lines file to write (defaults to stdout)")
+    args = parser.parse_args()
+
+    config_file = os.path.join(os.path.dirname(__file__), "config", "config.json")
+    try:
+        with open(config_file, "r") as f:
+            config = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        config = {}
+    max_xp = args.max_xp
+    if max_xp is None:
+        party_info = config.get("party_info", {})
+        thresholds = calculate_party_thresholds(party_info.get("level") or 1, party_info.get("size") or 4,
+                                                get_adventurer_levels(party_info))
+        max_xp = thresholds[args.difficulty]
+    monster_source = config.get("monster_source", "bestiary-mm.json")
+    store = open_bestiary_store(os.path.join(os.path.dirname(__file__), "data", monster_source), CR_TO_XP,
+                                config.get("monster_fields", PROJECTED_FIELDS))
+
+    encounters = enumerate_encounters(store.filter_monsters(max_xp), max_xp, args.environment, args.max_minions,
+                                      args.target_xp, args.max_error, args.time_budget)
+    # Streamed one line per encounter, so big enumerations never sit in memory
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    written = 0
+    try:
+        for encounter in encounters:
+            if args.limit is not None and written >= args.limit:
+                break
+            out.write(json.dumps(encounter, separators=(",", ":")) + "\n")
+            written += 1
+    finally:
+        store.close()
+        if args.out:
+            out.close()
+            print(f"💾 {written} encounters written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,205 @@
 # filepath: src/encounter_generator.py
 import json  # This is a built-in Python library for working with JSON files.
+import codecs
+import re
+from fnmatch import translate
+from instrumentation import timed
 
-def load_monsters(file_path):
+# Monster fields the generator never reads. They are dropped while streaming so
+# big homebrew compilations don't keep them in memory. "*" works like in file names.
+SKIPPED_FIELDS = ("soundClip", "altArt", "hasFluffImages", "*Tags*")
+
+# Fields the generator actually uses for selection and output. Loading with this
+# projection keeps only these; the rest can be read back with load_full_monster().
+PROJECTED_FIELDS = ("name", "source", "cr", "environment", "hp", "type", "size")
+
+# How many bytes the streaming loader reads from disk at a time
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = " \t\r\n"
+
+
+@timed("bestiary.load_json")
+def load_monsters(file_path, stream=False, skip_fields=SKIPPED_FIELDS, fields=None):
     """
     Loads monster data from a JSON file.
     :param file_path: Path to the JSON file.
-    :return: A list of monsters.
+    :param stream: If True, read the file in chunks and decode one monster at a time
+                   instead of parsing the whole file in one go.
+    :param skip_fields: Field names (or patterns like "*Tags*") to drop when streaming.
+    :param fields: Optional list of fields to keep (e.g. PROJECTED_FIELDS). Implies streaming.
+    :return: A dictionary with the list of monsters under the "monster" key.
     """
+    if stream or fields:
+        return {"monster": list(iter_monsters(file_path, skip_fields, fields=fields))}
     with open(file_path, 'r') as file:  # Open the file in read mode.
         return json.load(file)  # Parse the JSON data and return it.
+
+
+def iter_monsters(file_path, skip_fields=SKIPPED_FIELDS, chunk_size=CHUNK_SIZE, fields=None):
+    """
+    Streams monsters from a bestiary file, yielding them one at a time.
+    Only the "monster" list is yielded; other top-level keys (like "_meta") are skipped.
+    :param file_path: Path to the JSON file.
+    :param skip_fields: Field names (or patterns) to drop from every monster.
+    :param chunk_size: Number of bytes to read from disk at a time.
+    :param fields: Optional list of fields to keep. Projected monsters also get "_offset"
+                   and "_length" keys so load_full_monster() can fetch the full record.
+    :return: A generator of monster dictionaries.
+    """
+    is_skipped = _compile_field_filter(skip_fields) if skip_fields else None
+    for monster, offset, length in _iter_monster_records(file_path, chunk_size):
+        if fields:
+            monster = project_monster(monster, fields)
+            monster["_offset"] = offset
+            monster["_length"] = length
+        elif is_skipped:
+            for key in [key for key in monster if is_skipped(key)]:
+                del monster[key]
+        yield monster
+
+
+def project_monster(monster, fields):
+    """
+    Returns a copy of the monster with only the requested fields.
+    :param monster: Monster dictionary.
+    :param fields: Field names to keep; missing fields are left out.
+    :return: The projected monster dictionary.
+    """
+    return {field: monster[field] for field in fields if field in monster}
+
+
+def load_full_monster(file_path, monster):
+    """
+    Reads the full record of a projected monster back from the bestiary file.
+    Monsters that were loaded without a projection are returned unchanged.
+    :param file_path: Path to the JSON file the monster was loaded from.
+    :param monster: A monster dictionary from load_monsters(..., fields=...).
+    :return: The complete monster dictionary.
+    """
+    if "_offset" not in monster:
+        return monster
+    with open(file_path, "rb") as file:
+        file.seek(monster["_offset"])
+        return json.loads(file.read(monster["_length"]))
+
+
+def _iter_monster_records(file_path, chunk_size=CHUNK_SIZE):
+    """
+    Yields (monster, byte_offset, byte_length) for every entry of the "monster" list.
+    The offset and length point at the raw JSON text of the monster inside the file.
+    """
+    with open(file_path, "rb") as file:
+        stream = _JsonStream(file, chunk_size)
+        stream.expect("{")
+        if stream.peek() == "}":
+            return
+        while True:
+            key, _, _ = stream.value()
+            stream.expect(":")
+            if key == "monster":
+                stream.expect("[")
+                if stream.peek() == "]":
+                    stream.expect("]")
+                else:
+                    while True:
+                        yield stream.value()
+                        if stream.peek() == ",":
+                            stream.expect(",")
+                            continue
+                        stream.expect("]")
+                        break
+            else:
+                stream.value()  # Decode and throw away anything that isn't a monster
+            if stream.peek() == ",":
+                stream.expect(",")
+                continue
+            stream.expect("}")
+            break
+
+
+def _compile_field_filter(patterns):
+    """
+    Turns a list of field names/patterns into a single fast "should this key go?" check.
+    """
+    exact = {pattern for pattern in patterns if "*" not in pattern}
+    wildcards = [translate(pattern) for pattern in patterns if "*" in pattern]
+    if not wildcards:
+        return exact.__contains__
+    matcher = re.compile("|".join(wildcards)).match
+    return lambda key: key in exact or matcher(key) is not None
+
+
+class _JsonStream:
+    """
+    Minimal chunked JSON reader: decodes one value at a time from a binary file and
+    keeps track of byte offsets, so only a chunk or two of text is held in memory.
+    """
+
+    def __init__(self, file, chunk_size):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0  # Position in the buffer
+        self.byte_pos = 0  # Absolute byte offset in the file matching self.pos
+        self.eof = False
+
+    def _fill(self):
+        """
+        Reads the next chunk, dropping already consumed text. Returns False at end of file.
+        """
+        if self.eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            text = self.text_decoder.decode(b"", final=True)
+        else:
+            text = self.text_decoder.decode(chunk)
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        Skips whitespace and returns the next character ("" at end of file).
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+                self.byte_pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Malformed bestiary file: expected '{char}' at byte {self.byte_pos}, found '{found}'")
+        self.pos += 1
+        self.byte_pos += 1
+
+    def value(self):
+        """
+        Decodes the next JSON value. Returns (value, byte_offset, byte_length).
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # The value is cut off at the end of the buffer: read more and retry
+                if self._fill():
+                    continue
+                raise
+            if end == len(self.buffer) and self._fill():
+                continue  # A number at the very end of the buffer might continue in the next chunk
+            break
+        offset = self.byte_pos
+        length = len(self.buffer[self.pos:end].encode("utf-8"))
+        self.pos = end
+        self.byte_pos += length
+        return value, offset, length
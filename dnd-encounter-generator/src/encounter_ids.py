@@ -0,0 +1,107 @@
+# filepath: src/encounter_ids.py
+# Compact, reproducible encounter IDs.
+#
+# An ID holds everything selection depends on: the seed, a hash of the bestiary file,
+# the XP budget, the environment, whether minions were added, the pinned main monster
+# (if any), a hash of the selection weights and whether the fight is in the main
+# monster's lair. Feeding it back to
+# main.regenerate_encounter() gives the identical encounter, without storing anything.
+#
+# Example: 3.k2x9a7.3f2a9c01.1z4.forest.m._._._
+import hashlib
+import json
+import random
+
+ID_VERSION = "3"
+# Seeds are 0 .. 2 ** SEED_BITS - 1 (short in base 36, plenty of variety)
+SEED_BITS = 48
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def to_base36(number):
+    if number < 0:
+        raise ValueError(f"Can't encode a negative number: {number}")
+    if number == 0:
+        return "0"
+    digits = []
+    while number:
+        number, remainder = divmod(number, 36)
+        digits.append(_DIGITS[remainder])
+    return "".join(reversed(digits))
+
+
+def new_seed():
+    """
+    A fresh random seed for one run (48 bits: short in base 36, plenty of variety).
+    """
+    return random.SystemRandom().getrandbits(SEED_BITS)
+
+
+def file_hash(file_path):
+    """
+    Short hash of a file's contents (first 8 hex digits of its SHA-1).
+    """
+    digest = hashlib.sha1()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:8]
+
+
+def weights_hash(weights):
+    """
+    Short hash of the selection weights, "_" when there are none.
+    """
+    if not weights:
+        return "_"
+    return hashlib.sha1(json.dumps(weights, sort_keys=True).encode("utf-8")).hexdigest()[:4]
+
+
+def make_encounter_id(seed, bestiary_hash, max_xp, environment="any", add_minions=True, pinned_index=None, weights=None,
+                      in_lair=False):
+    """
+    Builds an encounter ID.
+    :param seed: Seed of the selection RNG.
+    :param bestiary_hash: file_hash() of the bestiary the monsters came from.
+    :param max_xp: XP budget of the encounter.
+    :param environment: Environment the monsters were chosen for.
+    :param add_minions: Whether minions were added.
+    :param pinned_index: Store index of a pinned main monster, or None.
+    :param weights: Selection weights used by the sampler.
+    :param in_lair: Whether the main monster is fought in its lair.
+    :return: The ID string.
+    """
+    return ".".join([
+        ID_VERSION,
+        to_base36(seed),
+        bestiary_hash,
+        to_base36(max_xp),
+        environment.replace(".", "_"),
+        "m" if add_minions else "n",
+        to_base36(pinned_index) if pinned_index is not None else "_",
+        weights_hash(weights),
+        "l" if in_lair else "_",
+    ])
+
+
+def parse_encounter_id(encounter_id):
+    """
+    Splits an ID back into its parts.
+    :return: Dictionary with seed, bestiary_hash, max_xp, environment, add_minions,
+             pinned_index, weights_hash and in_lair.
+    :raises ValueError: If the ID is malformed or from another ID version.
+    """
+    parts = encounter_id.strip().split(".")
+    if len(parts) != 9 or parts[0] != ID_VERSION:
+        raise ValueError(f"Not a valid encounter ID: {encounter_id}")
+    _, seed, bestiary_hash, max_xp, environment, minions, pinned, weights, lair = parts
+    return {
+        "seed": int(seed, 36),
+        "bestiary_hash": bestiary_hash,
+        "max_xp": int(max_xp, 36),
+        "environment": environment,
+        "add_minions": minions == "m",
+        "pinned_index": int(pinned, 36) if pinned != "_" else None,
+        "weights_hash": weights,
+        "in_lair": lair == "l",
+    }
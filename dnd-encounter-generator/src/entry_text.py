@@ -0,0 +1,66 @@
+# filepath: src/entry_text.py
+# Helpers for the 5etools entry format: nested "entries" lists and {@tag ...} markup.
+import re
+
+# {@tag text} with no nested braces inside
+TAG_PATTERN = re.compile(r"\{@(\w+)(?: ([^{}]*))?\}")
+
+# Tags whose text isn't simply "the first part before |"
+_ATTACK_TYPES = {
+    "mw": "Melee Weapon Attack:", "rw": "Ranged Weapon Attack:",
+    "ms": "Melee Spell Attack:", "rs": "Ranged Spell Attack:",
+    "mw,rw": "Melee or Ranged Weapon Attack:", "ms,rs": "Melee or Ranged Spell Attack:",
+}
+
+
+def plain_tag(match):
+    """
+    Plain text for one TAG_PATTERN match: "{@hit 4}" -> "+4" (also used by stat_blocks.py).
+    """
+    tag, text = match.group(1), match.group(2) or ""
+    parts = text.split("|")
+    if tag == "h":
+        return "Hit: "
+    if tag == "atk":
+        return _ATTACK_TYPES.get(text, "Attack:")
+    if tag == "hit":
+        return f"+{text}" if not text.startswith(("+", "-")) else text
+    if tag == "dc":
+        return f"DC {text}"
+    if tag == "recharge":
+        return f"(Recharge {text}-6)" if text and text != "6" else "(Recharge 6)"
+    if tag == "chance":
+        return f"{parts[0]} percent"
+    # {@creature air elemental|MM|Air Elemental} shows the third part when there is one
+    if len(parts) >= 3 and parts[2]:
+        return parts[2]
+    return parts[0]
+
+
+def strip_tags(text):
+    """
+    Converts 5etools markup to plain text.
+    "{@atk mw} {@hit 4} to hit" -> "Melee Weapon Attack: +4 to hit"
+    """
+    previous = None
+    while previous != text:  # Tags can be nested, so strip from the inside out
+        previous = text
+        text = TAG_PATTERN.sub(plain_tag, text)
+    return text
+
+
+def iter_entry_strings(entries):
+    """
+    Yields every string inside a (possibly nested) entries structure: lists, dicts with
+    "name"/"entries"/"items", spellcasting blocks and so on.
+    """
+    if isinstance(entries, str):
+        yield entries
+    elif isinstance(entries, list):
+        for entry in entries:
+            yield from iter_entry_strings(entry)
+    elif isinstance(entries, dict):
+        for key, value in entries.items():
+            if key in ("type", "ability", "displayAs", "hidden", "slots"):
+                continue  # Structural fields, not text
+            yield from iter_entry_strings(value)
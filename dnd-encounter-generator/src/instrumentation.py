@@ -0,0 +1,254 @@
+# filepath: src/instrumentation.py
+# Timers and counters for the generation pipeline (bestiary load, filtering,
+# selection, AI calls, file writes, cache hits), to see where time goes and catch
+# latency regressions in production batches.
+#
+# Off by default: a disabled timer is one flag check and a shared no-op context
+# manager, a disabled counter is one flag check. Turn it on with enable() or the
+# DND_METRICS environment variable (table, json or prometheus), which also prints
+# the report when the process exits (to DND_METRICS_FILE if set).
+#
+#   with timer("bestiary.open"):
+#       store = open_bestiary_store(...)
+#
+#   @timed("select.build_encounter")
+#   def build_encounter(...): ...
+#
+#   increment("cache.stat_blocks.hit")
+import atexit
+import functools
+import json
+import os
+import threading
+from time import perf_counter
+
+REPORT_FORMATS = ("table", "json", "prometheus")
+PROMETHEUS_PREFIX = "dnd_encounter"
+
+_enabled = False
+_lock = threading.Lock()
+# Timer name -> [count, total seconds, min seconds, max seconds]
+_timings = {}
+# Counter name -> value
+_counters = {}
+
+
+def enable(enabled=True):
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _timings.clear()
+        _counters.clear()
+
+
+def record(name, seconds):
+    """
+    Adds one timing (used by the timers; call it directly for times measured elsewhere).
+    """
+    with _lock:
+        stats = _timings.get(name)
+        if stats is None:
+            _timings[name] = [1, seconds, seconds, seconds]
+        else:
+            stats[0] += 1
+            stats[1] += seconds
+            if seconds < stats[2]:
+                stats[2] = seconds
+            if seconds > stats[3]:
+                stats[3] = seconds
+
+
+def increment(name, value=1):
+    """
+    Increments a counter (AI errors, cache hits, re-rolls, ...).
+    """
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+class _Timer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, perf_counter() - self.start)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name):
+    """
+    Context manager timing its block under name (a no-op while disabled).
+    """
+    return _Timer(name) if _enabled else _NULL_TIMER
+
+
+def timed(name):
+    """
+    Decorator timing every call of a function under name.
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def snapshot():
+    """
+    Copy of the collected metrics, to send from a worker process and merge() in the parent.
+    :return: {"timings": {name: [count, total, min, max]}, "counters": {name: value}}
+    """
+    with _lock:
+        return {
+            "timings": {name: list(stats) for name, stats in _timings.items()},
+            "counters": dict(_counters),
+        }
+
+
+def merge(metrics):
+    """
+    Adds a snapshot() (from another process) to the metrics of this one.
+    """
+    with _lock:
+        for name, (calls, total, low, high) in metrics.get("timings", {}).items():
+            stats = _timings.get(name)
+            if stats is None:
+                _timings[name] = [calls, total, low, high]
+            else:
+                stats[0] += calls
+                stats[1] += total
+                stats[2] = min(stats[2], low)
+                stats[3] = max(stats[3], high)
+        for name, value in metrics.get("counters", {}).items():
+            _counters[name] = _counters.get(name, 0) + value
+
+
+def report_table():
+    """
+    Human-readable summary: timers sorted by total time, then counters.
+    """
+    metrics = snapshot()
+    lines = []
+    if metrics["timings"]:
+        lines.append(f"{'Timer':<32} {'calls':>8} {'total ms':>11} {'mean ms':>10} {'min ms':>9} {'max ms':>9}")
+        for name, (calls, total, low, high) in sorted(metrics["timings"].items(), key=lambda item: -item[1][1]):
+            lines.append(f"{name:<32} {calls:>8} {total * 1000:>11.2f} {total * 1000 / calls:>10.3f} "
+                         f"{low * 1000:>9.3f} {high * 1000:>9.3f}")
+    if metrics["counters"]:
+        if lines:
+            lines.append("")
+        lines.append(f"{'Counter':<32} {'value':>8}")
+        for name, value in sorted(metrics["counters"].items()):
+            lines.append(f"{name:<32} {value:>8}")
+    return "\n".join(lines) if lines else "No metrics recorded."
+
+
+def report_json():
+    metrics = snapshot()
+    return json.dumps({
+        "timings": {
+            name: {"calls": calls, "total_s": total, "mean_s": total / calls, "min_s": low, "max_s": high}
+            for name, (calls, total, low, high) in sorted(metrics["timings"].items())
+        },
+        "counters": dict(sorted(metrics["counters"].items())),
+    }, indent=2)
+
+
+def report_prometheus(prefix=PROMETHEUS_PREFIX):
+    """
+    Prometheus text exposition format: timers as summaries (count, sum, plus a max
+    gauge), counters as counters. Metric names go in the "name" label.
+    """
+    metrics = snapshot()
+    lines = []
+    if metrics["timings"]:
+        lines.append(f"# HELP {prefix}_duration_seconds Time spent per pipeline step.")
+        lines.append(f"# TYPE {prefix}_duration_seconds summary")
+        for name, (calls, total, _, _) in sorted(metrics["timings"].items()):
+            lines.append(f'{prefix}_duration_seconds_count{{name="{name}"}} {calls}')
+            lines.append(f'{prefix}_duration_seconds_sum{{name="{name}"}} {total:.6f}')
+        lines.append(f"# HELP {prefix}_duration_max_seconds Slowest call per pipeline step.")
+        lines.append(f"# TYPE {prefix}_duration_max_seconds gauge")
+        for name, (_, _, _, high) in sorted(metrics["timings"].items()):
+            lines.append(f'{prefix}_duration_max_seconds{{name="{name}"}} {high:.6f}')
+    if metrics["counters"]:
+        lines.append(f"# HELP {prefix}_events_total Pipeline events (AI errors, cache hits, ...).")
+        lines.append(f"# TYPE {prefix}_events_total counter")
+        for name, value in sorted(metrics["counters"].items()):
+            lines.append(f'{prefix}_events_total{{name="{name}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def report(output_format="table"):
+    """
+    The collected metrics in one of REPORT_FORMATS.
+    """
+    if output_format == "json":
+        return report_json()
+    if output_format == "prometheus":
+        return report_prometheus()
+    if output_format == "table":
+        return report_table()
+    raise ValueError(f"Unknown metrics format {output_format!r} (use one of {', '.join(REPORT_FORMATS)})")
+
+
+def write_report(output_format="table", path=None):
+    """
+    Prints the report, or writes it to path.
+    """
+    text = report(output_format)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text if text.endswith("\n") else text + "\n")
+    else:
+        print(f"\n📊 Metrics:\n{text}")
+
+
+def enable_from_env():
+    """
+    Enables instrumentation if DND_METRICS is set (to a report format) and prints or
+    writes the report at exit. Called by the entry points (main, batch, server).
+    :return: True if enabled.
+    """
+    output_format = os.getenv("DND_METRICS", "").strip().lower()
+    if not output_format or output_format in ("0", "off", "false"):
+        return False
+    if output_format not in REPORT_FORMATS:
+        output_format = "table"
+    enable()
+    atexit.register(write_report, output_format, os.getenv("DND_METRICS_FILE"))
+    return True
@@ -2,61 +2,24 @@
 # This only works with the v4_ai_client.py file in /archive/ai_client/
 import os
 import random
-from datetime import datetime
-from encounter_generator import load_monsters  # Import the function to load monsters
+from encounter_generator import PROJECTED_FIELDS
+from bestiary_store import open_bestiary_store
+from name_index import build_name_index, search_names, autocomplete, normalize_name
+from text_index import open_text_index, search_monsters
+from sampling import MonsterSampler
+from usage_history import UsageHistory
+from affinity import open_affinity_graph
+from md_export import save_note
+from renderers import make_encounter
+from stat_blocks import StatBlockCache
+from encounter_ids import new_seed, make_encounter_id, parse_encounter_id, weights_hash
 import json
-import sys
-import re
+from collections import Counter
+from xp_tables import CR_TO_XP, DIFFICULTIES, multiplier, monster_xp, threshold
 from ai_client import generate_environment_description, generate_battlemap_prompt, generate_encounter_title
-from dotenv import load_dotenv
-load_dotenv()
-
-# XP thresholds per character level (DMG pg. 82)
-XP_THRESHOLDS = {
-    1: [25, 50, 75, 100], 
-    2: [50, 100, 150, 200],
-    3: [75, 150, 225, 400],
-    4: [125, 250, 375, 500],
-    5: [250, 500, 750, 1100],
-    6: [300, 600, 900, 1400],
-    7: [350, 750, 1100, 1700],
-    8: [450, 900, 1400, 2100],
-    9: [550, 1100, 1600, 2400],
-    10: [600, 1200, 1900, 2800],
-    11: [800, 1600, 2400, 3600],
-    12: [1000, 2000, 3000, 4500],
-    13: [1100, 2200, 3400, 5100],
-    14: [1250, 2500, 3800, 5700],
-    15: [1400, 2800, 4300, 6400],
-    16: [1600, 3200, 4800, 7200],
-    17: [2000, 3900, 5900, 8800],
-    18: [2100, 4200, 6300, 9500],
-    19: [2400, 4900, 7300, 10900],
-    20: [2800, 5700, 8500, 12700]
-}
-
-# CR-to-XP mapping (DMG pg. 274)
-CR_TO_XP = {
-    "0": 10, "1/8": 25, "1/4": 50, "1/2": 100,
-    "1": 200, "2": 450, "3": 700, "4": 1100,
-    "5": 1800, "6": 2300, "7": 2900, "8": 3900,
-    "9": 5000, "10": 5900, "11": 7200, "12": 8400,
-    "13": 10000, "14": 11500, "15": 13000, "16": 15000,
-    "17": 18000, "18": 20000, "19": 22000, "20": 25000,
-    "21": 33000, "22": 41000, "23": 50000, "24": 62000,
-    "25": 75000, "26": 90000, "27": 105000, "28": 120000,
-    "29": 135000, "30": 155000
-}
-
-# Monster multiplier table (DMG pg. 82)
-MONSTER_MULTIPLIERS = {
-    1: 1,
-    2: 1.5,
-    3: 2,
-    7: 2.5,
-    11: 3,
-    15: 4
-}
+from instrumentation import increment, timed, enable_from_env
+
+# XP_THRESHOLDS, CR_TO_XP and MONSTER_MULTIPLIERS (DMG pg. 82 and 274) live in xp_tables.py
 
 def get_monster_multiplier(num_monsters):
     """
@@ -64,24 +27,36 @@ def get_monster_multiplier(num_monsters):
     :param num_monsters: Number of monsters in the encounter.
     :return: XP multiplier.
     """
-    for threshold, multiplier in sorted(MONSTER_MULTIPLIERS.items(), reverse=True):
-        if num_monsters >= threshold:
-            return multiplier
-    return 1  # Default multiplier for 1 monster
+    return multiplier(num_monsters)  # Precomputed per count in xp_tables.py
+
+def get_adventurer_levels(party_info):
+    """
+    Get the level of every adventurer in the party. Adventurers without their own
+    level (older configs) use the party level.
+    :param party_info: The "party_info" section of the config.
+    :return: List of levels, one per adventurer.
+    """
+    party_level = party_info.get("level") or 1
+    party_size = party_info.get("size") or 0
+    levels = [adv.get("level") or party_level for adv in party_info.get("adventurers", [])[:party_size]]
+    # Adventurers counted in the party size but never described use the party level
+    return levels + [party_level] * (party_size - len(levels))
 
-def calculate_party_thresholds(party_level, party_size):
+def calculate_party_thresholds(party_level, party_size, adventurer_levels=None):
     """
     Calculate the XP thresholds for the party based on their level and size.
     :param party_level: Level of the party members.
     :param party_size: Number of party members.
+    :param adventurer_levels: Optional list with every adventurer's own level (mixed-level
+                              parties). When given, party_level and party_size are ignored.
     :return: A dictionary with XP thresholds for each difficulty.
     """
-    thresholds = XP_THRESHOLDS.get(party_level, [0, 0, 0, 0])  # Default to 0 if level is not in the table
+    # One lookup per distinct level, so even mixed-level parties need only a few additions
+    level_counts = Counter(adventurer_levels) if adventurer_levels else {party_level: party_size}
     return {
-        "easy": thresholds[0] * party_size,
-        "medium": thresholds[1] * party_size,
-        "hard": thresholds[2] * party_size,
-        "deadly": thresholds[3] * party_size
+        # threshold() is 0 for levels outside the table
+        name: sum(threshold(level, difficulty) * count for level, count in level_counts.items())
+        for difficulty, name in enumerate(DIFFICULTIES)
     }
 
 def filter_monsters_by_xp(monsters, max_xp):
@@ -91,19 +66,8 @@ def filter_monsters_by_xp(monsters, max_xp):
     :param max_xp: Maximum XP for the encounter.
     :return: Filtered list of monsters.
     """
-    filtered = []
-    for monster in monsters:
-        cr = monster.get("cr", "0")  # Default to "0" if "cr" is missing
-        
-        # Handle cases where CR is a dictionary
-        if isinstance(cr, dict):
-            cr = cr.get("cr", "0")  # Extract the "cr" key from the dictionary
-        
-        # Get XP value for the monster's CR
-        xp = CR_TO_XP.get(str(cr), 0)  # Ensure CR is a string before lookup
-        if xp <= max_xp:
-            filtered.append(monster)
-    return filtered
+    # get_monster_xp handles dictionary CRs and unknown CRs (0 XP)
+    return [monster for monster in monsters if get_monster_xp(monster) <= max_xp]
 
 def get_monster_source(config_file, edit_mode=False):
     """
@@ -156,7 +120,7 @@ def get_party_info(config_file, edit_mode=False):
         print(f"  Number of adventurers: {party_size}")
         print(f"  Level: {party_level}")
         for i, adv in enumerate(adventurers, 1):
-            print(f"    Adventurer {i}: {adv['race']} {adv['class']} | Interest: {adv['interest']} | Fear: {adv['fear']}")
+            print(f"    Adventurer {i}: {adv['race']} {adv['class']} (level {adv.get('level', party_level)}) | Interest: {adv['interest']} | Fear: {adv['fear']}")
         return party_level, party_size
 
     # In edit mode, always prompt for new info
@@ -164,7 +128,7 @@ def get_party_info(config_file, edit_mode=False):
     while True:
         try:
             party_size = int(input("🧙 Number of adventurers: "))
-            party_level = int(input("🎲 The party's level (1-20): "))
+            party_level = int(input("🎲 The party's level (1-20, you can set each adventurer's own level next): "))
             break
         except ValueError:
             print("⚠️ Invalid input. Please enter numbers.")
@@ -175,12 +139,22 @@ def get_party_info(config_file, edit_mode=False):
         name = input("  Name: ").strip()
         race = input("  Race: ").strip()
         adv_class = input("  Class: ").strip()
+        while True:
+            level_input = input(f"  Level (Enter for {party_level}): ").strip()
+            if not level_input:
+                level = party_level
+                break
+            if level_input.isdigit() and 1 <= int(level_input) <= 20:
+                level = int(level_input)
+                break
+            print("⚠️ Please enter a level from 1 to 20.")
         interest = input("  Main interest: ").strip()
         fear = input("  Biggest fear: ").strip()
         adventurers.append({
             "name": name,
             "race": race,
             "class": adv_class,
+            "level": level,
             "interest": interest,
             "fear": fear
         })
@@ -254,7 +228,10 @@ def interactive_input(prompt, config_file=None):
                 print(f"  Level: {party_info.get('level', '?')}")
                 adventurers = party_info.get("adventurers", [])
                 for i, adv in enumerate(adventurers, 1):
-                    print(f"    Adventurer {i}: {adv.get('name', '[No Name]')} | {adv.get('race', '?')} {adv.get('class', '?')} | Interest: {adv.get('interest', '?')} | Fear: {adv.get('fear', '?')}")
+                    print(f"    Adventurer {i}: {adv.get('name', '[No Name]')} | {adv.get('race', '?')} {adv.get('class', '?')} (level {adv.get('level', party_info.get('level', '?'))}) | Interest: {adv.get('interest', '?')} | Fear: {adv.get('fear', '?')}")
+            return "_RESTART_SECTION_"
+        elif user_input.strip() in ("-s", "--search") and config_file:
+            search_bestiary(config_file)
             return "_RESTART_SECTION_"
         elif user_input.strip() == "--help":
             print_help()
@@ -267,9 +244,225 @@ def interactive_input(prompt, config_file=None):
         else:
             return user_input
 
-def generate_encounter(monsters, max_xp, config_file=None):
-    
-    random.shuffle(monsters)
+def get_monster_xp(monster, in_lair=False):
+    """
+    Get the XP a monster takes from the budget: its CR's XP (0 if unknown), its lair CR's
+    when fought in its lair, weighted for legendary actions (see xp_tables.monster_xp).
+    """
+    return monster_xp(monster, in_lair)
+
+def format_cr(cr):
+    """
+    Readable CR: "13", or "13 (14 in lair)" for 5etools CR dictionaries.
+    """
+    if not isinstance(cr, dict):
+        return cr
+    extras = [f"{cr[key]} {label}" for key, label in (("lair", "in lair"), ("coven", "in coven")) if key in cr]
+    return f"{cr.get('cr', '?')} ({', '.join(extras)})" if extras else cr.get("cr", "?")
+
+def in_environment(monster, environment):
+    return environment == "any" or environment in monster.get("environment", [])
+
+# Used when no sampler is passed in: every monster equally likely
+DEFAULT_SAMPLER = MonsterSampler()
+
+# How many seeds the interactive generator tries before accepting a recently used main monster
+MAX_SEED_ATTEMPTS = 20
+
+@timed("select.main_monster")
+def pick_main_monster(monsters, max_xp, environment="any", sampler=None, rng=random):
+    """
+    Pick the main monster: a random one worth 50%-90% of the max XP pool.
+    :param monsters: List of monster dictionaries.
+    :param max_xp: Maximum XP for the encounter.
+    :param environment: Environment name, or "any".
+    :param sampler: MonsterSampler with the selection weights (uniform if None).
+    :param rng: Random number generator.
+    :return: The main monster, or None if nothing fits.
+    """
+    sampler = sampler or DEFAULT_SAMPLER
+    min_main_xp = int(max_xp * 0.5)
+    max_main_xp = int(max_xp * 0.9)
+    return sampler.draw(
+        monsters,
+        ("main", environment, min_main_xp, max_main_xp),
+        lambda monster: (min_main_xp <= get_monster_xp(monster) <= max_main_xp
+                         and in_environment(monster, environment)),
+        rng
+    )
+
+@timed("select.minions")
+def pick_minions(monsters, main_monster, remaining_xp, max_minions=3, environment="any", sampler=None, rng=random, graph=None):
+    """
+    Pick up to max_minions different minions that fit in the remaining XP.
+    With an affinity graph, minions come from the main monster's neighbours (monsters
+    that belong with it); the whole list is only used when none of them fits.
+    :param monsters: List of monster dictionaries.
+    :param main_monster: The main monster (never picked as its own minion).
+    :param remaining_xp: XP left after the main monster.
+    :param max_minions: Maximum number of minions.
+    :param environment: Environment name, or "any".
+    :param sampler: MonsterSampler with the selection weights (uniform if None).
+    :param rng: Random number generator.
+    :param graph: Optional AffinityGraph of the store the monsters came from.
+    :return: List of minions.
+    """
+    if graph is not None and "_store_index" in main_monster:
+        minions = graph.pick_minions(main_monster["_store_index"], remaining_xp, max_minions, environment, sampler, rng)
+        if minions:
+            return minions
+    sampler = sampler or DEFAULT_SAMPLER
+    minions = []
+    while len(minions) < max_minions and remaining_xp > 0:
+        budget = remaining_xp
+        fits = lambda monster: get_monster_xp(monster) <= budget and in_environment(monster, environment)
+        minion = None
+        for _ in range(10):  # Redraw a few times if we hit the main monster or a repeat
+            candidate = sampler.draw(monsters, ("minion", environment, budget), fits, rng)
+            if candidate is None:
+                break
+            if candidate != main_monster and candidate not in minions:
+                minion = candidate
+                break
+        if minion is None:
+            break
+        minions.append(minion)
+        remaining_xp -= get_monster_xp(minion)
+    return minions
+
+@timed("select.build_encounter")
+def build_encounter(monsters, max_xp, environment="any", add_minions=True, main_monster=None, sampler=None, rng=random,
+                    graph=None, in_lair=False):
+    """
+    Non-interactive encounter generation (the batch API): no prompts, no AI calls.
+    Reuse the same monsters list and sampler across calls to benefit from cached tables.
+    :param monsters: List of monster dictionaries, already filtered by XP.
+    :param max_xp: Maximum XP for the encounter.
+    :param environment: Environment name, or "any".
+    :param add_minions: Whether to fill the remaining XP with minions.
+    :param main_monster: Optional pinned main monster (see name_index.find_monster).
+    :param sampler: MonsterSampler with the selection weights (uniform if None).
+    :param rng: Random number generator.
+    :param graph: Optional AffinityGraph for picking minions that belong with the main monster.
+    :param in_lair: Whether the main monster is fought in its lair (lair CR and lair actions).
+    :return: List of monsters, main monster first. Empty if no main monster fits.
+    """
+    if main_monster is None:
+        main_monster = pick_main_monster(monsters, max_xp, environment, sampler, rng)
+        if main_monster is None:
+            return []
+    encounter = [main_monster]
+    remaining_xp = max_xp - get_monster_xp(main_monster, in_lair)
+    if add_minions and remaining_xp > 0:
+        encounter.extend(pick_minions(monsters, main_monster, remaining_xp, environment=environment, sampler=sampler, rng=rng, graph=graph))
+    return encounter
+
+def regenerate_encounter(encounter_id, store, weights=None):
+    """
+    Rebuilds an encounter from its ID (see encounter_ids.py).
+    :param encounter_id: ID from the encounter's front matter.
+    :param store: BestiaryStore of the same bestiary file the encounter came from.
+    :param weights: The "selection_weights" that were in the config.
+    :return: List of monsters, main monster first.
+    :raises ValueError: If the ID is malformed or the bestiary or weights changed since.
+    """
+    parts = parse_encounter_id(encounter_id)
+    if parts["bestiary_hash"] != store.meta.get("source_hash"):
+        raise ValueError("The bestiary changed since this encounter was generated.")
+    if parts["weights_hash"] != weights_hash(weights):
+        raise ValueError("The selection weights changed since this encounter was generated.")
+    max_xp = parts["max_xp"]
+    pinned_index = parts["pinned_index"]
+    if pinned_index is not None and not 0 <= pinned_index < store.count:
+        raise ValueError(f"The pinned monster {pinned_index} isn't in this bestiary.")
+    main_monster = store.summary(pinned_index) if pinned_index is not None else None
+    return build_encounter(
+        store.filter_monsters(max_xp), max_xp, parts["environment"], parts["add_minions"],
+        main_monster, MonsterSampler(weights), random.Random(parts["seed"]), open_affinity_graph(store),
+        parts["in_lair"]
+    )
+
+def describe_environment(selected_environment, main_monster=None, minions=None):
+    """
+    Ask the AI for an environment description (skipped for "any").
+    """
+    if selected_environment == "any":
+        return ""
+    print("\n🌎 Generating a description for this environment...")
+    env_desc_input = {
+        "name": selected_environment,
+        "main_monster": main_monster.get("name", "unknown creature") if main_monster else "unknown creature",
+        "minions": [m.get("name", "unknown minion") for m in minions] if minions else []
+    }
+    environment_description = generate_environment_description(env_desc_input)
+    print(f"\n📜 Environment Description:\n{environment_description}\n")
+    return environment_description
+
+def choose_pinned_monster(store, config_file=None):
+    """
+    Lets the user pin a main monster by name, with typo-tolerant suggestions.
+    :param store: The bestiary store; the name index is only built if a name is typed.
+    :return: The chosen monster, or None to let the generator pick.
+    """
+    name_index = None
+    while True:
+        query = interactive_input("🐲  Pin a main monster by name (Enter to let fate decide): ", config_file).strip()
+        if query == "_RESTART_SECTION_":
+            continue
+        if not query:
+            return None
+        if name_index is None:
+            name_index = build_name_index(store.monsters())
+        suggestions = autocomplete(name_index, query, limit=5)
+        if not suggestions or normalize_name(suggestions[0].get("name", "")) != normalize_name(query):
+            suggestions = [monster for monster, _ in search_names(name_index, query, limit=5)] or suggestions
+        if not suggestions:
+            print("No monster by that name. Try again.")
+            continue
+        if normalize_name(suggestions[0].get("name", "")) == normalize_name(query):
+            return suggestions[0]
+        print("Did you mean:")
+        for i, monster in enumerate(suggestions, 1):
+            print(f"{i}. {monster.get('name', 'Unknown')} (CR: {monster.get('cr', 'Unknown')})")
+        choice = interactive_input(f"Your choice (1-{len(suggestions)}, Enter to search again): ", config_file).strip()
+        if choice.isdigit() and 1 <= int(choice) <= len(suggestions):
+            return suggestions[int(choice) - 1]
+
+def search_bestiary(config_file):
+    """
+    Prompts for a full-text query over traits, actions and spells and prints the matches.
+    Queries look like: speed:fly fireball, "pack tactics", undead -sunlight
+    """
+    try:
+        with open(config_file, "r") as f:
+            config = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        config = {}
+    monster_source = config.get("monster_source", "bestiary-mm.json")
+    monster_source_path = os.path.join(os.path.dirname(__file__), "data", monster_source)
+    store = open_bestiary_store(monster_source_path, CR_TO_XP, config.get("monster_fields", PROJECTED_FIELDS))
+    postings = open_text_index(monster_source_path)
+
+    query = input("🔎 Search traits, actions and spells (e.g. speed:fly fireball): ").strip()
+    results = search_monsters(store, postings, query)
+    if not results:
+        print("No monsters match that search.")
+    for monster in results:
+        print(f"- {monster.get('name', 'Unknown')} (CR: {monster.get('cr', 'Unknown')})")
+    store.close()
+
+def generate_encounter(monsters, max_xp, config_file=None, main_monster=None, sampler=None, seed=None, history=None, graph=None):
+    """
+    Interactive encounter generation. Selection uses random.Random(seed), so the result
+    can be rebuilt with regenerate_encounter(). If a usage history is given, recently
+    used main monsters are re-rolled with the next seed instead of changing the weights.
+    With an affinity graph, minions are picked among monsters that belong with the main one.
+    Returns (encounter, environment_description, environment, seed actually used, in_lair).
+    """
+    if seed is None:
+        seed = new_seed()
+    rng = random.Random(seed)
+    in_lair = False
     environment_description = ""
     selected_environment = "any"
 
@@ -309,66 +502,59 @@ def generate_encounter(monsters, max_xp, config_file=None):
             if selected_environment in monster.get("environment", [])
         ]
 
-    if not monsters:
+    if not monsters and main_monster is None:
         print("😢 No monsters found for the chosen environment. The adventurers are safe... for now.")
-        # Generate environment description if not 'any'
-        if selected_environment != "any":
-            print("\n🌎 Generating a description for this environment...")
-            env_desc_input = {
-                "name": selected_environment,
-                "main_monster": main_monster.get("name", "unknown creature"),
-                "minions": [m.get("name", "unknown minion") for m in minions] if 'minions' in locals() and minions else []
-            }
-            environment_description = generate_environment_description(env_desc_input)
-            print(f"\n📜 Environment Description:\n{environment_description}\n")
-        return [], environment_description, selected_environment
-
-    # Step 2: Choose a main monster within 50%-90% of the max XP pool
-    min_main_xp = int(max_xp * 0.5)
-    max_main_xp = int(max_xp * 0.9)
-    main_candidates = [
-        monster for monster in monsters
-        if min_main_xp <= CR_TO_XP.get(str(monster.get("cr", "0")), 0) <= max_main_xp
-    ]
+        environment_description = describe_environment(selected_environment)
+        return [], environment_description, selected_environment, seed, in_lair
+
+    # Step 2: Choose a main monster within 50%-90% of the max XP pool (unless one was pinned)
+    if main_monster is None:
+        for _ in range(MAX_SEED_ATTEMPTS):
+            rng = random.Random(seed)
+            main_monster = pick_main_monster(monsters, max_xp, sampler=sampler, rng=rng)
+            if main_monster is None or history is None:
+                break
+            # Its own stream from the same seed: drawing from rng would shift the minion
+            # picks away from what regenerate_encounter rebuilds from the ID
+            if random.Random(f"{seed}:history").random() < history.acceptance(main_monster):
+                break
+            increment("select.seed_rerolls")
+            seed = (seed + 1) % 2 ** 48  # Used too recently: try the next seed
 
-    if not main_candidates:
+    if main_monster is None:
         print("🛑 No worthy main monster found within the XP range. The adventurers might get bored!")
-        if selected_environment != "any":
-            print("\n🌎 Generating a description for this environment...")
-            env_desc_input = {
-                "name": selected_environment,
-                "main_monster": main_monster.get("name", "unknown creature"),
-                "minions": [m.get("name", "unknown minion") for m in minions] if 'minions' in locals() and minions else []
-            }
-            environment_description = generate_environment_description(env_desc_input)
-            print(f"\n📜 Environment Description:\n{environment_description}\n")
-        return [], environment_description, selected_environment
-
-    # Select the first suitable main monster
-    main_monster = main_candidates[0]
+        environment_description = describe_environment(selected_environment)
+        return [], environment_description, selected_environment, seed, in_lair
+
     encounter = [main_monster]
-    main_monster_xp = CR_TO_XP.get(str(main_monster.get("cr", "0")), 0)
+    main_monster_xp = get_monster_xp(main_monster)
+    print(f"\n 🐲  Your main monster is: {main_monster.get('name', 'Unknown')} (CR: {format_cr(main_monster.get('cr', 'Unknown'))}, XP: {main_monster_xp})")
+
+    # Step 3: Bosses with a lair (lair CR or lair actions) can be fought at home
+    lair_xp = get_monster_xp(main_monster, in_lair=True)
+    if lair_xp != main_monster_xp:
+        while True:
+            lair_choice = interactive_input(f"🏰  Fight it in its lair? ({lair_xp} XP there) (y/n): ", config_file).strip().lower()
+            if lair_choice == "_RESTART_SECTION_":
+                continue
+            if lair_choice in ("y", "n"):
+                break
+            print("Please enter 'y' or 'n'.")
+        if lair_choice == "y":
+            in_lair = True
+            main_monster_xp = lair_xp
     remaining_xp = max_xp - main_monster_xp
 
-    print(f"\n 🐲  Your main monster is: {main_monster.get('name', 'Unknown')} (CR: {main_monster.get('cr', 'Unknown')}, XP: {main_monster_xp})")
     if remaining_xp <= 0:
         print("⚔️ The main monster is so powerful that there's no room for minions!")
-        if selected_environment != "any":
-            print("\n🌎 Generating a description for this environment...")
-            env_desc_input = {
-                "name": selected_environment,
-                "main_monster": main_monster.get("name", "unknown creature"),
-                "minions": [m.get("name", "unknown minion") for m in minions] if 'minions' in locals() and minions else []
-            }
-            environment_description = generate_environment_description(env_desc_input)
-            print(f"\n📜 Environment Description:\n{environment_description}\n")
-        return encounter, environment_description, selected_environment
+        environment_description = describe_environment(selected_environment, main_monster)
+        return encounter, environment_description, selected_environment, seed, in_lair
 
     # Step 4: Ask if the user wants minions
     while True:
         add_minions = interactive_input("🐭  Would you like to add some minions? (y/n): ", config_file).strip().lower()
         if add_minions == "_RESTART_SECTION_":
-            print(f"\n 🐲  Your main monster is: {main_monster.get('name', 'Unknown')} (CR: {main_monster.get('cr', 'Unknown')}, XP: {main_monster_xp})")
+            print(f"\n 🐲  Your main monster is: {main_monster.get('name', 'Unknown')} (CR: {format_cr(main_monster.get('cr', 'Unknown'))}, XP: {main_monster_xp})")
             continue
         if add_minions in ("y", "n"):
             break
@@ -376,32 +562,13 @@ def generate_encounter(monsters, max_xp, config_file=None):
 
     if add_minions != 'y':
         print("🛡️ No minions? A bold choice!")
-        if selected_environment != "any":
-            print("\n🌎 Generating a description for this environment...")
-            env_desc_input = {
-                "name": selected_environment,
-                "main_monster": main_monster.get("name", "unknown creature"),
-                "minions": [m.get("name", "unknown minion") for m in minions] if 'minions' in locals() and minions else []
-            }
-            environment_description = generate_environment_description(env_desc_input)
-            print(f"\n📜 Environment Description:\n{environment_description}\n")
-        return encounter, environment_description, selected_environment
+        environment_description = describe_environment(selected_environment, main_monster)
+        return encounter, environment_description, selected_environment, seed, in_lair
 
     # Step 5: Add minions to fill the remaining XP
     print("\n🪄  Summoning minions to join the fray...")
-    minions = []
-    for monster in monsters:
-        if monster == main_monster:
-            continue
-        cr = monster.get("cr", "0")
-        if isinstance(cr, dict):
-            cr = cr.get("cr", "0")
-        xp = CR_TO_XP.get(str(cr), 0)
-        if xp <= remaining_xp:
-            minions.append(monster)
-            remaining_xp -= xp
-        if len(minions) >= 3 or remaining_xp <= 0:
-            break
+    minions = pick_minions(monsters, main_monster, remaining_xp, environment=selected_environment,
+                           sampler=sampler, rng=rng, graph=graph)
 
     if minions:
         print(f" {len(minions)} minions have joined the encounter!")
@@ -411,18 +578,10 @@ def generate_encounter(monsters, max_xp, config_file=None):
     encounter.extend(minions)
 
     # --- AI Environment Description ---
-    if selected_environment != "any":
-        print("\n🌎 Generating a description for this environment...")
-        env_desc_input = {
-            "name": selected_environment,
-            "main_monster": main_monster.get("name", "unknown creature"),
-            "minions": [m.get("name", "unknown minion") for m in minions] if 'minions' in locals() and minions else []
-            }
-        environment_description = generate_environment_description(env_desc_input)
-        print(f"\n📜 Environment Description:\n{environment_description}\n")
+    environment_description = describe_environment(selected_environment, main_monster, minions)
     # --- End AI Environment Description ---
 
-    return encounter, environment_description, selected_environment
+    return encounter, environment_description, selected_environment, seed, in_lair
 
 def save_encounter_to_md(
     encounter, 
@@ -431,81 +590,28 @@ def save_encounter_to_md(
     battlemap_prompt="", 
     encounter_title=None,
     environment_name=None,
-    difficulty=None
+    difficulty=None,
+    encounter_id=None,
+    stat_blocks=None,
+    in_lair=False
 ):
-   
-    # Ensure the folder exists
-    os.makedirs(folder_path, exist_ok=True)
-
-     # Use only the AI-generated title
-    if not encounter_title:
-        encounter_title = "A Mysterious Encounter"
-
-    # Use the title as the filename, replacing spaces with underscores
-    file_name = f"{encounter_title.replace(' ', '_')}.md"
-    file_path = os.path.join(folder_path, file_name)
-
-    # Prepare Initiative Tracker block
-    creatures_yaml = ""
-    for monster in encounter:
-        name = monster.get("name", "Unknown")
-        creatures_yaml += f" - 1: {name}\n"
-
-    initiative_block = (
-        "```encounter\n"
-        f"name: {encounter_title.replace(' ', '_')}\n"
-        "rollHP: false\n"
-        "party:\n"
-        "players: true\n"
-        "creatures:\n"
-        f"{creatures_yaml}"
-        "```\n\n"
-    )
-
-    # Write the encounter to the Markdown file
-    with open(file_path, "w", encoding="utf-8") as file:
-
-        # --- YAML front matter ---
-        file.write("---\n")
-        file.write(f"location: {environment_name if environment_name else 'unknown'}\n")
-        file.write(f"difficulty: {difficulty if difficulty else 'unknown'}\n")
-        file.write("---\n\n")
-
-        # Initiative Tracker block 
-        file.write(initiative_block)
-
-        if environment_description:
-            file.write(f"## Environment Description\n\n")
-            file.write(f"{environment_description}\n\n")
-        
-        file.write("### Monsters:\n")
-        # Write the table header
-        file.write("| Monster | CR | HP | Dead | Note |\n")
-        file.write("|---------|----|----|------|------|\n")
-        for monster in encounter:
-            name = monster.get("name", "Unknown")
-            cr = monster.get("cr", "Unknown")
-            hp = monster.get("hp", {}).get("average", "Unknown")
-            link_name = re.sub(r"[()]", "", name)
-            link_name = re.sub(r"\s+", " ", link_name)
-            link_name = link_name.strip().lower().replace(" ", "-")
-            obsidian_link = f"[[{link_name}\\|{name}]]"
-            file.write(f"| {obsidian_link} | {cr} | {hp} | [ ] |  |\n")
-        file.write("\n---\n")
-
-        file.write("## Encounter Details\n\n")
-        if battlemap_prompt:
-            file.write("```copy\n")
-            file.write(f"{battlemap_prompt}\n")
-            file.write("```\n\n")
-
-         # Add the custom frames code block
-        file.write("```custom-frames\n")
-        file.write("frame: Image Creator\n")
-        file.write("style: width: 1200px; height: 700px;\n")
-        file.write("```\n\n")
-
+    """
+    Saves an encounter as a markdown note. The note is built in memory and written
+    atomically; if the title is already taken, the first free "_2", "_3", ... name is used.
+    The note is also added to the folder's encounter index (vault_index.py).
+    :param stat_blocks: Optional StatBlockCache; when given, the full stat blocks of the
+                        monsters (full records) are embedded in the note.
+    :param in_lair: Whether the main monster is fought in its lair (its XP uses the lair CR).
+    :return: Path of the saved note.
+    """
+    embedded = stat_blocks.for_encounter(encounter) if stat_blocks else None
+    file_path = save_note(folder_path, make_encounter(encounter, encounter_title, environment_name, difficulty,
+                                                      encounter_id, environment_description, battlemap_prompt,
+                                                      in_lair, stat_blocks=embedded))
+    if stat_blocks:
+        stat_blocks.save()
     print(f"\nEncounter saved to: {file_path}")
+    return file_path
 
 def get_save_folder_path(edit_mode=False):
     """
@@ -570,6 +676,7 @@ How to Use:
 - Press [Enter] to start with your saved setup, or enter new info if none is saved.
 - At any prompt, type a flag to edit settings or get help:
     --help      Show this help message
+    -s, --search   Search monsters by traits, actions and spells
     -p, --party    Edit party info (level, size)
     -m, --monster  Edit monster source file
     -f, --folder   Edit save folder path
@@ -578,9 +685,10 @@ How to Use:
 Workflow:
 1. Review or edit your party, monster source, and save folder.
 2. Choose encounter difficulty (Easy, Medium, Hard, Deadly).
-3. Pick an environment or let the tool surprise you.
-4. A main monster is selected; add minions if you wish.
-5. Encounter is saved as a Markdown file in your chosen folder.
+3. Optionally pin a main monster by name (typos are fine, you'll get suggestions).
+4. Pick an environment or let the tool surprise you.
+5. A main monster is selected; add minions if you wish.
+6. Encounter is saved as a Markdown file in your chosen folder.
 
 Tips:
 - You can use flags at any prompt to change settings on the fly.
@@ -590,6 +698,7 @@ Tips:
 """)
 
 def main():
+    enable_from_env()  # DND_METRICS=table|json|prometheus prints timings at exit
     config_dir = os.path.join(os.path.dirname(__file__), "config")
     os.makedirs(config_dir, exist_ok=True)
     config_file = os.path.join(config_dir, "config.json")
@@ -649,7 +758,7 @@ def main():
                 print(f"  Level: {party_info.get('level', '?')}")
                 adventurers = party_info.get("adventurers", [])
                 for i, adv in enumerate(adventurers, 1):
-                    print(f"    Adventurer {i}: {adv.get('name', '[No Name]')} | {adv.get('race', '?')} {adv.get('class', '?')} | Interest: {adv.get('interest', '?')} | Fear: {adv.get('fear', '?')}")
+                    print(f"    Adventurer {i}: {adv.get('name', '[No Name]')} | {adv.get('race', '?')} {adv.get('class', '?')} (level {adv.get('level', party_info.get('level', '?'))}) | Interest: {adv.get('interest', '?')} | Fear: {adv.get('fear', '?')}")
             print(f"\nPress [Enter] to continue...", end="")
             input()  # Wait for user to press Enter
             continue  # Reprint the prompt and context after printing party info
@@ -684,10 +793,18 @@ def main():
         folder_path = get_save_folder_path()
 
     monster_source_path = os.path.join(os.path.dirname(__file__), "data", monster_source)
-    data = load_monsters(monster_source_path)
-    monsters = data["monster"]
+    # Map the bestiary store (built from the JSON file on first run or when it changes).
+    # Summaries keep only the fields we use (set "monster_fields" in the config to change them)
+    monster_fields = config.get("monster_fields", PROJECTED_FIELDS)
+    store = open_bestiary_store(monster_source_path, CR_TO_XP, monster_fields)
 
-    thresholds = calculate_party_thresholds(party_level, party_size)
+    # Re-read the party in case it was just entered, so every adventurer's own level counts
+    try:
+        with open(config_file, "r") as f:
+            party_info = json.load(f).get("party_info", party_info)
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    thresholds = calculate_party_thresholds(party_level, party_size, get_adventurer_levels(party_info))
 
     # Difficulty selection section with restart support
     while True:
@@ -705,15 +822,36 @@ def main():
     difficulty_to_key = {"1": "easy", "2": "medium", "3": "hard", "4": "deadly"}
     max_xp = thresholds.get(difficulty_to_key.get(difficulty, "easy"), thresholds["easy"])
 
-    filtered_monsters = filter_monsters_by_xp(monsters, max_xp)
+    pinned_monster = choose_pinned_monster(store, config_file)
+
+    filtered_monsters = store.filter_monsters(max_xp)
     # Pass config_file to generate_encounter for further section restarts
-    encounter, environment_description, environment_name = generate_encounter(filtered_monsters, max_xp, config_file)
+    # Optional "selection_weights" in the config make some sources/types/monsters more likely,
+    # and the usage history makes recently used monsters and types less likely
+    selection_weights = config.get("selection_weights")
+    sampler = MonsterSampler(selection_weights)
+    history = UsageHistory(campaign=party_info.get("name"))
+    encounter, environment_description, environment_name, seed, in_lair = generate_encounter(
+        filtered_monsters, max_xp, config_file, pinned_monster, sampler, new_seed(), history,
+        open_affinity_graph(store)
+    )
+    history.record_encounter(encounter)
+    history.close()
+    # Everything needed to rebuild this exact encounter later (see regenerate_encounter)
+    encounter_id = None
+    if encounter:
+        encounter_id = make_encounter_id(
+            seed, store.meta.get("source_hash", "_"), max_xp, environment_name, len(encounter) > 1,
+            pinned_monster.get("_store_index") if pinned_monster else None, selection_weights, in_lair
+        )
+    # Only the monsters that made it into the encounter get their full record decoded
+    encounter = [store.full_monster(monster) for monster in encounter]
 
     print("\nGenerated Encounter:")
     for i, monster in enumerate(encounter):
         name = monster.get("name", "Unknown")
-        cr = monster.get("cr", "Unknown")
-        xp = CR_TO_XP.get(str(cr), 0)
+        cr = format_cr(monster.get("cr", "Unknown"))
+        xp = get_monster_xp(monster, in_lair and i == 0)
         if i == 0:
             print(f"- 🐲 {name} (CR: {cr}, XP: {xp})")
         else:
@@ -728,6 +866,8 @@ def main():
     else:
         battlemap_prompt = ""
     print("\n💾 Saving the encounter...")
+    # Set "embed_stat_blocks": true in the config for notes that don't need the bestiary
+    stat_blocks = StatBlockCache(monster_source_path) if config.get("embed_stat_blocks") else None
     save_encounter_to_md(
         encounter, 
         folder_path, 
@@ -735,7 +875,10 @@ def main():
         battlemap_prompt, 
         encounter_title,
         environment_name,
-        difficulty_to_key.get(difficulty, "easy")
+        difficulty_to_key.get(difficulty, "easy"),
+        encounter_id,
+        stat_blocks,
+        in_lair
     )
     print("\n🎉 Encounter saved successfully! Happy adventuring! ⚔️")
             
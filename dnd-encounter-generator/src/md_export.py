@@ -0,0 +1,187 @@
+# filepath: src/md_export.py
+# Writes encounters as markdown notes (Obsidian vault), one at a time or in bulk.
+# The same writer handles the other formats from renderers.py.
+#
+# Each note is built in memory, written to a temporary file in the target folder and
+# then linked into place, so a note is never half-written and an existing note is
+# never overwritten: a title that's already taken gets the first free "_2", "_3", ...
+# suffix. Bulk exports go through a single writer thread fed by a bounded queue, so
+# generating and writing overlap without piling up thousands of notes in memory.
+# Saved notes are added to the folder's encounter index (see vault_index.py).
+import os
+import queue
+import re
+import threading
+from renderers import make_encounter, render
+from vault_index import VaultIndex, index_entry
+from instrumentation import timed
+
+# Notes waiting for the writer thread before submit() blocks
+MAX_PENDING = 256
+
+
+def build_encounter_md(
+    encounter,
+    environment_description="",
+    battlemap_prompt="",
+    encounter_title=None,
+    environment_name=None,
+    difficulty=None,
+    encounter_id=None,
+    stat_blocks=None
+):
+    """
+    Builds the markdown note of an encounter (same parameters as main.save_encounter_to_md)
+    from the Obsidian template (templates/obsidian.md).
+    :return: The note as a string.
+    """
+    return render(make_encounter(encounter, encounter_title, environment_name, difficulty, encounter_id,
+                                 environment_description, battlemap_prompt, stat_blocks=stat_blocks), "obsidian")
+
+
+def save_note(folder_path, encounter):
+    """
+    Writes the Obsidian note of an encounter object (see renderers.make_encounter) and
+    adds it to the folder's encounter index.
+    :return: Path of the written note.
+    """
+    path = write_note(folder_path, get_file_name(encounter["title"]), render(encounter, "obsidian"))
+    with VaultIndex(folder_path) as index:
+        index.add(path, index_entry(encounter))
+    return path
+
+
+def get_file_name(encounter_title):
+    """
+    File name for a title: spaces become underscores, characters that aren't allowed
+    in file names are dropped.
+    """
+    name = re.sub(r'[<>:"/\\|?*\x00-\x1f]', "", (encounter_title or "A Mysterious Encounter").replace(" ", "_"))
+    return name.strip(".") or "Encounter"
+
+
+@timed("export.write_note")
+def write_note(folder_path, file_name, text, taken=None, extension=".md"):
+    """
+    Writes a note without ever overwriting or half-writing one. The text goes to a
+    temporary file first, which is then hard-linked to the first free name
+    (file_name, then file_name_2.md, file_name_3.md, ...).
+    :param folder_path: Target folder (created if missing).
+    :param file_name: File name without the extension.
+    :param text: Note contents.
+    :param taken: Optional set of names already used in the folder, kept up to date;
+                  saves a directory lookup per candidate name in bulk exports.
+    :param extension: File extension, ".md" for notes (see renderers.FORMATS for others).
+    :return: Path of the written note.
+    """
+    os.makedirs(folder_path, exist_ok=True)
+    temp_path = os.path.join(folder_path, f".{file_name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(temp_path, "w", encoding="utf-8") as file:
+        file.write(text)
+    try:
+        number = 1
+        while True:
+            candidate = f"{file_name}{extension}" if number == 1 else f"{file_name}_{number}{extension}"
+            number += 1
+            if taken is not None and candidate in taken:
+                continue
+            path = os.path.join(folder_path, candidate)
+            try:
+                os.link(temp_path, path)  # Fails if the name exists, so nothing gets clobbered
+            except FileExistsError:
+                if taken is not None:
+                    taken.add(candidate)
+                continue
+            except OSError:
+                # No hard links on this file system: check, then rename
+                if os.path.exists(path):
+                    continue
+                os.replace(temp_path, path)
+            if taken is not None:
+                taken.add(candidate)
+            return path
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+class BulkExporter:
+    """
+    Writes many notes through one writer thread. submit() blocks while max_pending
+    notes are waiting, so memory stays bounded however many encounters are exported.
+    Notes are written in submission order, so name collisions resolve the same way
+    on every run. Notes submitted with an index entry are added to the folder's
+    encounter index in one transaction.
+
+        with BulkExporter(folder_path) as exporter:
+            for result in results:
+                encounter = make_encounter(result["monsters"], title, ...)
+                exporter.submit(render(encounter), title, index_entry(encounter))
+        print(exporter.paths)
+    """
+
+    def __init__(self, folder_path, max_pending=MAX_PENDING, extension=".md"):
+        self.folder_path = folder_path
+        self.extension = extension
+        self.index = None
+        os.makedirs(folder_path, exist_ok=True)
+        self.paths = []
+        self._taken = set(os.listdir(folder_path))
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._write_all, daemon=True)
+        self._thread.start()
+
+    def _write_all(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                if self._error is not None:
+                    continue  # Drain the queue so submit() never blocks forever
+                text, encounter_title, entry = item
+                try:
+                    path = write_note(self.folder_path, get_file_name(encounter_title), text, self._taken,
+                                      self.extension)
+                    self.paths.append(path)
+                    if entry is not None:
+                        if self.index is None:
+                            # SQLite connections belong to the thread that opens them
+                            self.index = VaultIndex(self.folder_path)
+                        self.index.add(path, entry, commit=False)
+                except Exception as e:  # OSError, sqlite3 errors, ...: keep draining, re-raise in close()
+                    self._error = e
+        finally:
+            if self.index is not None:
+                try:
+                    self.index.close()
+                except Exception as e:
+                    self._error = self._error or e
+
+    def submit(self, text, encounter_title, entry=None):
+        """
+        Queues a note for writing.
+        :param entry: Optional index entry (vault_index.index_entry) for the note.
+        """
+        if self._error is not None:
+            raise self._error
+        self._queue.put((text, encounter_title, entry))
+
+    def close(self):
+        """
+        Waits until every note is written.
+        :raises Exception: The first error the writer thread hit (OSError, sqlite3.Error, ...).
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self.paths
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
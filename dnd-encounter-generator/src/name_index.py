@@ -0,0 +1,125 @@
+# filepath: src/name_index.py
+# Name lookup for the bestiary: typo-tolerant search (trigrams) and autocomplete (prefixes).
+import heapq
+import re
+from bisect import bisect_left
+from collections import Counter
+from itertools import chain
+
+# Results scoring below this are too different from the query to be useful
+MIN_SCORE = 0.3
+
+
+def normalize_name(name):
+    """
+    Lowercases a name and collapses everything that isn't a letter or digit into single spaces.
+    "Adult Red Dragon (Lair)" -> "adult red dragon lair"
+    """
+    return " ".join(re.findall(r"[a-z0-9]+", name.lower()))
+
+
+def _trigrams(text):
+    """
+    Returns the set of trigrams of a normalized name, with word boundaries padded
+    so short words and word starts count too.
+    """
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def build_name_index(monsters):
+    """
+    Builds a name index over a list of monsters.
+    :param monsters: List of monster dictionaries (full records or summaries).
+    :return: A dictionary holding the index; pass it to search_names()/autocomplete().
+    """
+    normalized = [normalize_name(monster.get("name", "")) for monster in monsters]
+    trigrams = {}
+    words = []
+    for i, name in enumerate(normalized):
+        for trigram in _trigrams(name):
+            trigrams.setdefault(trigram, []).append(i)
+        for word in set(name.split()):
+            words.append((word, i))
+    words.sort()
+    return {
+        "monsters": monsters,
+        "normalized": normalized,
+        "trigram_counts": [len(_trigrams(name)) for name in normalized],
+        "trigrams": trigrams,
+        "names": sorted((name, i) for i, name in enumerate(normalized)),
+        "words": words,
+    }
+
+
+def search_names(index, query, limit=5, min_score=MIN_SCORE):
+    """
+    Typo-tolerant name search.
+    :param index: Index from build_name_index().
+    :param query: Name as typed by the user, e.g. "behodler".
+    :param limit: Maximum number of results.
+    :param min_score: Minimum similarity (0-1) for a result to be returned.
+    :return: List of (monster, score) pairs, best match first.
+    """
+    query = normalize_name(query)
+    if not query:
+        return []
+    query_trigrams = _trigrams(query)
+    postings = index["trigrams"]
+    shared = Counter(chain.from_iterable(postings.get(trigram, ()) for trigram in query_trigrams))
+    # Nothing sharing fewer trigrams than this can reach min_score
+    min_common = min_score * len(query_trigrams) / 2
+
+    counts = index["trigram_counts"]
+    normalized = index["normalized"]
+    scored = []
+    for i, common in shared.items():
+        if common < min_common:
+            continue
+        # Dice coefficient of the two trigram sets
+        score = 2 * common / (len(query_trigrams) + counts[i])
+        name = normalized[i]
+        if name == query:
+            score = 2.0  # Exact matches always come first
+        elif name.startswith(query):
+            score += 0.5
+        if score >= min_score:
+            scored.append((-score, len(name), name, i))
+    scored.sort()
+    return [(index["monsters"][i], min(-score, 1.0)) for score, _, _, i in scored[:limit]]
+
+
+def autocomplete(index, prefix, limit=10):
+    """
+    Suggests monsters for a partially typed name. Names starting with the prefix come
+    first, then names with a word starting with it ("drag" -> "Adult Red Dragon").
+    Shorter names rank higher within each group.
+    :param index: Index from build_name_index().
+    :param prefix: The text typed so far.
+    :param limit: Maximum number of suggestions.
+    :return: List of monster dictionaries.
+    """
+    prefix = normalize_name(prefix)
+    if not prefix:
+        return []
+    normalized = index["normalized"]
+    rank = lambda i: (len(normalized[i]), normalized[i])
+    results = []
+    for entries in (index["names"], index["words"]):
+        # Everything between these two positions starts with the prefix
+        start = bisect_left(entries, (prefix,))
+        end = bisect_left(entries, (prefix + "\uffff",), start)
+        matches = {i for _, i in entries[start:end]}.difference(results)
+        results.extend(heapq.nsmallest(limit - len(results), matches, key=rank))
+        if len(results) >= limit:
+            break
+    return [index["monsters"][i] for i in results]
+
+
+def find_monster(index, name):
+    """
+    Returns the monster best matching a name, or None if nothing is close enough.
+    Handy for the batch API: find_monster(index, "beholder").
+    """
+    results = search_names(index, name, limit=1)
+    return results[0][0] if results else None
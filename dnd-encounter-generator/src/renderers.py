@@ -0,0 +1,294 @@
+# filepath: src/renderers.py
+# Renders one encounter object to different output formats: Obsidian markdown,
+# JSON, YAML and Foundry VTT actor JSON.
+#
+# Text formats come from the files in src/templates/. A template is compiled once
+# into a tree of small render functions (cached per file), so rendering thousands of
+# encounters only walks that tree. Template syntax:
+#   {{ path.to.value|filter|filter:arg }}   value with filters (see FILTERS)
+#   {{#if path}} ... {{/if}}                only if the value is truthy
+#   {{#each path}} ... {{/each}}            once per item; names resolve on the item first
+# A block tag followed by a newline swallows that newline, so block tags can sit on
+# their own lines without leaving blank lines behind.
+#
+# Usage: python renderers.py encounters.jsonl --format foundry --out exports/
+import argparse
+import json
+import os
+import re
+from functools import lru_cache
+from xp_tables import adjusted_xp, monster_xp
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), "templates")
+TAG_PATTERN = re.compile(r"\{\{(.*?)\}\}(\n?)", re.S)
+
+
+def _link_name(value):
+    link_name = re.sub(r"[()]", "", str(value))
+    link_name = re.sub(r"\s+", " ", link_name)
+    return link_name.strip().lower().replace(" ", "-")
+
+
+FILTERS = {
+    "or": lambda value, default: default if value in (None, "", [], {}) else value,
+    "underscore": lambda value: str(value).replace(" ", "_"),
+    "link": _link_name,  # Obsidian note name of a monster
+    "json": lambda value: json.dumps(value, ensure_ascii=False),  # Also a valid YAML scalar
+}
+
+
+def _lookup(scopes, path):
+    """
+    Resolves a dotted path, trying the innermost scope first. Missing values are None.
+    """
+    first, *rest = path.split(".")
+    for scope in reversed(scopes):
+        if isinstance(scope, dict) and first in scope:
+            value = scope[first]
+            break
+    else:
+        return None
+    for key in rest:
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def _compile_value(expression):
+    path, *filters = [part.strip() for part in expression.split("|")]
+    steps = []
+    for spec in filters:
+        name, separator, argument = spec.partition(":")
+        if name not in FILTERS:
+            raise ValueError(f"Unknown template filter: {name}")
+        steps.append((FILTERS[name], argument if separator else None))
+
+    def render(scopes, out):
+        value = _lookup(scopes, path)
+        for function, argument in steps:
+            value = function(value) if argument is None else function(value, argument)
+        out.append("" if value is None else str(value))
+    return render
+
+
+def compile_template(text):
+    """
+    Compiles template text into a render function.
+    :return: Function (context dictionary) -> rendered string.
+    :raises ValueError: On unbalanced blocks or unknown filters.
+    """
+    root = []
+    stack = [("root", None, root)]
+    position = 0
+    for match in TAG_PATTERN.finditer(text):
+        nodes = stack[-1][2]
+        literal = text[position:match.start()]
+        if literal:
+            nodes.append(lambda scopes, out, literal=literal: out.append(literal))
+        position = match.end()
+        tag = match.group(1).strip()
+        if tag.startswith("#"):
+            kind, _, path = tag[1:].partition(" ")
+            if kind not in ("if", "each"):
+                raise ValueError(f"Unknown template block: {tag}")
+            stack.append((kind, path.strip(), []))
+        elif tag.startswith("/"):
+            kind, path, children = stack.pop()
+            if kind != tag[1:].strip():
+                raise ValueError(f"Template block {kind} closed by {tag}")
+            stack[-1][2].append(_compile_block(kind, path, children))
+        else:
+            _, newline = match.groups()
+            nodes.append(_compile_value(tag))
+            if newline:  # Only block tags swallow the newline after them
+                nodes.append(lambda scopes, out: out.append("\n"))
+    if len(stack) != 1:
+        raise ValueError(f"Unclosed template block: {stack[-1][0]} {stack[-1][1]}")
+    if text[position:]:
+        root.append(lambda scopes, out, literal=text[position:]: out.append(literal))
+
+    def render(context):
+        out = []
+        scopes = [context]
+        for node in root:
+            node(scopes, out)
+        return "".join(out)
+    return render
+
+
+def _compile_block(kind, path, children):
+    if kind == "if":
+        def render(scopes, out):
+            if _lookup(scopes, path):
+                for node in children:
+                    node(scopes, out)
+    else:
+        def render(scopes, out):
+            for item in _lookup(scopes, path) or []:
+                scopes.append(item)
+                for node in children:
+                    node(scopes, out)
+                scopes.pop()
+    return render
+
+
+@lru_cache(maxsize=None)
+def load_template(name):
+    """
+    Loads and compiles a template from src/templates/ (once per process).
+    """
+    with open(os.path.join(TEMPLATE_DIR, name), "r", encoding="utf-8") as f:
+        return compile_template(f.read())
+
+
+def make_encounter(
+    encounter,
+    encounter_title=None,
+    environment_name=None,
+    difficulty=None,
+    encounter_id=None,
+    environment_description="",
+    battlemap_prompt="",
+    in_lair=False,
+    stat_blocks=None
+):
+    """
+    Builds the encounter object every format is rendered from.
+    :param encounter: List of monsters (summaries or full records), main monster first.
+    :param stat_blocks: Optional rendered stat blocks to embed (see
+                        stat_blocks.StatBlockCache.for_encounter).
+    :return: Dictionary with title, environment, difficulty, encounter_id, description,
+             battlemap_prompt, xp, adjusted_xp, monsters (internal "_" keys dropped,
+             "xp" added) and stat_blocks.
+    """
+    monsters = []
+    for i, monster in enumerate(encounter):
+        public = {key: value for key, value in monster.items() if not key.startswith("_")}
+        public["xp"] = monster_xp(monster, in_lair and i == 0)
+        monsters.append(public)
+    xp = sum(monster["xp"] for monster in monsters)
+    return {
+        "title": encounter_title or "A Mysterious Encounter",
+        "environment": environment_name,
+        "difficulty": difficulty,
+        "encounter_id": encounter_id,
+        "description": environment_description,
+        "battlemap_prompt": battlemap_prompt,
+        "xp": xp,
+        "adjusted_xp": adjusted_xp(xp, len(monsters)),
+        "monsters": monsters,
+        "stat_blocks": stat_blocks or [],
+    }
+
+
+def render_json(encounter):
+    return json.dumps(encounter, indent=2, ensure_ascii=False) + "\n"
+
+
+def _foundry_cr(cr):
+    if isinstance(cr, dict):
+        cr = cr.get("cr", "0")
+    numerator, _, denominator = str(cr).partition("/")
+    try:
+        return int(numerator) / int(denominator) if denominator else float(numerator)
+    except ValueError:
+        return 0
+
+
+def foundry_actor(monster):
+    """
+    A dnd5e-system NPC actor with the basics filled in (name, CR, XP, HP, AC, size, type).
+    """
+    hp = monster.get("hp", {}) if isinstance(monster.get("hp"), dict) else {}
+    ac = monster.get("ac", [None])
+    ac = ac[0] if isinstance(ac, list) and ac else ac
+    if isinstance(ac, dict):
+        ac = ac.get("ac")
+    monster_type = monster.get("type", "")
+    if isinstance(monster_type, dict):
+        monster_type = monster_type.get("type", "")
+    sizes = {"T": "tiny", "S": "sm", "M": "med", "L": "lg", "H": "huge", "G": "grg"}
+    return {
+        "name": monster.get("name", "Unknown"),
+        "type": "npc",
+        "system": {
+            "attributes": {
+                "hp": {"value": hp.get("average"), "max": hp.get("average"), "formula": hp.get("formula", "")},
+                "ac": {"calc": "flat", "flat": ac} if isinstance(ac, int) else {"calc": "natural"},
+            },
+            "details": {
+                "cr": _foundry_cr(monster.get("cr", "0")),
+                "xp": {"value": monster.get("xp", 0)},
+                "type": {"value": monster_type if isinstance(monster_type, str) else ""},
+                "source": {"book": monster.get("source", "")},
+            },
+            "traits": {"size": sizes.get((monster.get("size") or ["M"])[0], "med")},
+        },
+        "flags": {"dnd-encounter-generator": {"source": monster.get("source", "")}},
+    }
+
+
+def render_foundry(encounter):
+    """
+    Foundry VTT import JSON: the encounter's actors plus the details as flags.
+    """
+    return json.dumps({
+        "name": encounter["title"],
+        "actors": [foundry_actor(monster) for monster in encounter["monsters"]],
+        "flags": {"dnd-encounter-generator": {
+            key: encounter[key] for key in ("encounter_id", "environment", "difficulty", "xp", "adjusted_xp", "description")
+        }},
+    }, indent=2, ensure_ascii=False) + "\n"
+
+
+# Format -> (render function, file extension)
+FORMATS = {
+    "obsidian": (lambda encounter: load_template("obsidian.md")(encounter), ".md"),
+    "yaml": (lambda encounter: load_template("encounter.yaml")(encounter), ".yaml"),
+    "json": (render_json, ".json"),
+    "foundry": (render_foundry, ".foundry.json"),
+}
+
+
+def render(encounter, output_format="obsidian"):
+    """
+    Renders an encounter object (see make_encounter) to one of FORMATS.
+    """
+    if output_format not in FORMATS:
+        raise ValueError(f"Unknown format {output_format!r} (use one of {', '.join(FORMATS)})")
+    return FORMATS[output_format][0](encounter)
+
+
+def main():
+    from encounter_ids import parse_encounter_id
+    from md_export import BulkExporter
+    from vault_index import index_entry
+
+    parser = argparse.ArgumentParser(description="Re-render saved encounters (batch.py JSON Lines) to another format.")
+    parser.add_argument("source", help="JSON Lines file written by batch.py")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="obsidian")
+    parser.add_argument("--out", required=True, help="Folder to write the files to")
+    args = parser.parse_args()
+
+    extension = FORMATS[args.format][1]
+    with open(args.source, "r", encoding="utf-8") as f, BulkExporter(args.out, extension=extension) as exporter:
+        for line in f:
+            result = json.loads(line)
+            if not result.get("monsters"):
+                continue
+            # Same title batch.py gave the note (the AI's with --ai)
+            title = result.get("title") or f"{result['monsters'][0].get('name', 'Unknown')} Encounter"
+            in_lair = result.get("in_lair")
+            if in_lair is None and result.get("encounter_id"):
+                in_lair = parse_encounter_id(result["encounter_id"])["in_lair"]  # Older batch files
+            encounter = make_encounter(result["monsters"], title, result.get("environment"),
+                                       result.get("difficulty"), result.get("encounter_id"),
+                                       result.get("description", ""), result.get("battlemap_prompt", ""),
+                                       bool(in_lair))
+            # Only notes go in the vault index
+            exporter.submit(render(encounter, args.format), title,
+                            index_entry(encounter) if args.format == "obsidian" else None)
+    print(f"📝 {len(exporter.paths)} files written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# filepath: src/sampling.py
+# Weighted random monster selection with Walker alias tables.
+#
+# Building a table for a set of candidates is O(n); after that every draw is O(1).
+# Tables are cached per filter key (e.g. "main monsters for the forest worth
+# 700-1260 XP"), so generating many encounters from the same monster list
+# doesn't rescan or reshuffle it each time.
+import random
+from collections import OrderedDict
+
+
+def build_alias_table(weights):
+    """
+    Builds a Walker alias table (Vose's method) for a list of weights.
+    :param weights: List of non-negative weights. At least one must be positive.
+    :return: (probabilities, aliases) lists, to be used with alias_draw().
+    """
+    count = len(weights)
+    total = float(sum(weights))
+    scaled = [weight * count / total for weight in weights]
+    probabilities = [0.0] * count
+    aliases = list(range(count))
+    small = [i for i, p in enumerate(scaled) if p < 1.0]
+    large = [i for i, p in enumerate(scaled) if p >= 1.0]
+    while small and large:
+        less, more = small.pop(), large.pop()
+        probabilities[less] = scaled[less]
+        aliases[less] = more
+        scaled[more] = scaled[more] + scaled[less] - 1.0
+        if scaled[more] < 1.0:
+            small.append(more)
+        else:
+            large.append(more)
+    for i in large + small:  # Whatever is left over (rounding errors) always picks itself
+        probabilities[i] = 1.0
+    return probabilities, aliases
+
+
+def alias_draw(table, rng=random):
+    """
+    Draws one index from an alias table in O(1).
+    """
+    probabilities, aliases = table
+    i = int(rng.random() * len(probabilities))
+    return i if rng.random() < probabilities[i] else aliases[i]
+
+
+def get_monster_type(monster):
+    """
+    Returns a monster's creature type as a string ("undead", "dragon", ...).
+    """
+    monster_type = monster.get("type", "")
+    if isinstance(monster_type, dict):
+        monster_type = monster_type.get("type", "")
+    return monster_type if isinstance(monster_type, str) else ""
+
+
+class MonsterSampler:
+    """
+    Picks monsters at random, weighted by source, creature type, individual monster
+    (for rarity) and past usage. With no weights every candidate is equally likely.
+
+    weights looks like the "selection_weights" section of config.json:
+        {"source": {"MM": 1, "VGM": 2}, "type": {"undead": 3}, "monster": {"Tarrasque": 0.1}}
+    usage maps monster names to how often they were used; each use lowers the weight.
+    type_usage does the same per creature type, scaled down by type_balance, so
+    recently overused types get picked less (see usage_history.py).
+    """
+
+    def __init__(self, weights=None, usage=None, max_tables=256, type_usage=None, type_balance=0.5):
+        weights = weights or {}
+        self.source_weights = weights.get("source", {})
+        self.type_weights = weights.get("type", {})
+        self.monster_weights = weights.get("monster", {})
+        self.usage = usage if usage is not None else {}
+        self.type_usage = type_usage if type_usage is not None else {}
+        self.type_balance = type_balance
+        self.max_tables = max_tables
+        self._tables = OrderedDict()
+
+    def weight(self, monster):
+        name = monster.get("name", "")
+        weight = self.monster_weights.get(name, 1.0)
+        weight *= self.source_weights.get(monster.get("source", ""), 1.0)
+        monster_type = get_monster_type(monster)
+        weight *= self.type_weights.get(monster_type, 1.0)
+        weight /= 1.0 + self.type_balance * self.type_usage.get(monster_type, 0)
+        return weight / (1.0 + self.usage.get(name, 0))
+
+    def clear(self):
+        """
+        Drops all cached tables (call after changing weights or usage).
+        """
+        self._tables.clear()
+
+    def record_usage(self, monster):
+        name = monster.get("name", "")
+        self.usage[name] = self.usage.get(name, 0) + 1
+        self.clear()
+
+    def _table(self, monsters, key, predicate):
+        entry = self._tables.get(key)
+        if entry is not None and entry[0] is monsters:
+            self._tables.move_to_end(key)
+            return entry[1], entry[2]
+        candidates = []
+        weights = []
+        for monster in monsters:
+            if predicate(monster):
+                weight = self.weight(monster)
+                if weight > 0:
+                    candidates.append(monster)
+                    weights.append(weight)
+        table = build_alias_table(weights) if candidates else None
+        # Keep a reference to the monster list so a different list never reuses this table
+        self._tables[key] = (monsters, candidates, table)
+        if len(self._tables) > self.max_tables:
+            self._tables.popitem(last=False)
+        return candidates, table
+
+    def draw(self, monsters, key, predicate, rng=random):
+        """
+        Draws one monster matching a filter.
+        :param monsters: The full list of monsters to choose from.
+        :param key: Hashable description of the filter; tables are cached under it.
+        :param predicate: Function returning True for monsters that pass the filter.
+        :param rng: Random number generator (anything with a random() method).
+        :return: A monster, or None if nothing matches.
+        """
+        candidates, table = self._table(monsters, key, predicate)
+        if not candidates:
+            return None
+        return candidates[alias_draw(table, rng)]
@@ -0,0 +1,224 @@
+# filepath: src/server.py
+# Long-running HTTP/JSON API around the encounter engine, for tools (VTT bridge, Discord
+# bot, ...) that would otherwise start main.py for every request.
+#
+# The bestiary store, the name and text indexes and the affinity graph are loaded once
+# at startup and stay warm; a request only does the actual selection work. No AI calls.
+#
+#   GET /encounter?level=5&size=4&difficulty=hard&environment=forest[&seed=..][&monster=beholder][&lair=1]
+#   GET /encounter?max_xp=2000                       (explicit budget instead of a party)
+#   GET /encounter?id=3.k2x9a7...                    (rebuild a saved encounter)
+#   GET /monsters/search?name=behodler               (typo-tolerant name search)
+#   GET /monsters/search?text=speed:fly fireball[&max_xp=..][&environment=..]
+#   GET /thresholds?level=5&size=4  or  ?levels=3,4,4,5
+#
+# Usage: python server.py [--host 127.0.0.1] [--port 8765]
+import argparse
+import json
+import os
+import random
+import threading
+import traceback
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from affinity import open_affinity_graph
+from bestiary_store import open_bestiary_store
+from encounter_generator import PROJECTED_FIELDS
+from encounter_ids import SEED_BITS, make_encounter_id, new_seed, parse_encounter_id
+from name_index import build_name_index, search_names
+from sampling import MonsterSampler
+from text_index import open_text_index, search_monsters
+from xp_tables import DIFFICULTIES, adjusted_xp, encounter_xp
+from instrumentation import increment, enable_from_env
+from main import (CR_TO_XP, build_encounter, regenerate_encounter, calculate_party_thresholds,
+                  get_adventurer_levels, get_monster_xp)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Filtered monster lists kept per XP budget (reusing a list keeps the sampler's tables warm)
+MAX_CACHED_BUDGETS = 64
+MAX_SEARCH_RESULTS = 50
+
+
+class EncounterEngine:
+    """
+    Everything the server needs, loaded once. Selection state (sampler tables, cached
+    lists) isn't thread-safe, so generation runs under a lock; it takes milliseconds.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        monster_source = config.get("monster_source", "bestiary-mm.json")
+        self.source_path = os.path.join(os.path.dirname(__file__), "data", monster_source)
+        self.store = open_bestiary_store(self.source_path, CR_TO_XP, config.get("monster_fields", PROJECTED_FIELDS))
+        self.weights = config.get("selection_weights")
+        self.sampler = MonsterSampler(self.weights)
+        self.graph = open_affinity_graph(self.store)
+        self.name_index = build_name_index(self.store.monsters())
+        self.postings = open_text_index(self.source_path)
+        self.party_info = config.get("party_info", {})
+        self.lock = threading.Lock()
+        self._budgets = OrderedDict()
+
+    def monsters_for(self, max_xp):
+        monsters = self._budgets.get(max_xp)
+        if monsters is None:
+            increment("cache.budgets.miss")
+            monsters = self.store.filter_monsters(max_xp)
+            self._budgets[max_xp] = monsters
+            if len(self._budgets) > MAX_CACHED_BUDGETS:
+                self._budgets.popitem(last=False)
+        else:
+            increment("cache.budgets.hit")
+            self._budgets.move_to_end(max_xp)
+        return monsters
+
+    def thresholds(self, params):
+        if "levels" in params:
+            levels = [int(level) for level in params["levels"].split(",") if level.strip()]
+            return calculate_party_thresholds(0, 0, levels)
+        if "level" in params or "size" in params:
+            return calculate_party_thresholds(int(params.get("level", 1)), int(params.get("size", 4)))
+        # The saved party
+        return calculate_party_thresholds(self.party_info.get("level") or 1, self.party_info.get("size") or 4,
+                                          get_adventurer_levels(self.party_info))
+
+    def encounter(self, params):
+        with self.lock:
+            if "id" in params:
+                encounter = regenerate_encounter(params["id"], self.store, self.weights)
+                in_lair = parse_encounter_id(params["id"])["in_lair"]
+                return self._describe(encounter, params["id"], params.get("full") == "1", in_lair)
+
+            if "max_xp" in params:
+                max_xp = int(params["max_xp"])
+            else:
+                difficulty = params.get("difficulty", "medium")
+                if difficulty not in DIFFICULTIES:
+                    raise ValueError(f"difficulty must be one of {', '.join(DIFFICULTIES)}")
+                max_xp = self.thresholds(params)[difficulty]
+            if max_xp <= 0:
+                raise ValueError("max_xp must be positive (or the party needs levels from 1 to 20)")
+            environment = params.get("environment", "any")
+            add_minions = params.get("minions", "1") != "0"
+            in_lair = params.get("lair") == "1"
+            seed = int(params["seed"]) if "seed" in params else new_seed()
+            if not 0 <= seed < 2 ** SEED_BITS:
+                raise ValueError(f"seed must be from 0 to {2 ** SEED_BITS - 1}")
+
+            main_monster = None
+            if "monster" in params:
+                results = search_names(self.name_index, params["monster"], limit=1)
+                if not results:
+                    raise LookupError(f"No monster named {params['monster']!r}")
+                main_monster = results[0][0]
+
+            encounter = build_encounter(self.monsters_for(max_xp), max_xp, environment, add_minions, main_monster,
+                                        self.sampler, random.Random(seed), self.graph, in_lair)
+            encounter_id = None
+            if encounter:
+                encounter_id = make_encounter_id(
+                    seed, self.store.meta.get("source_hash", "_"), max_xp, environment, add_minions,
+                    main_monster.get("_store_index") if main_monster else None, self.weights, in_lair
+                )
+            result = self._describe(encounter, encounter_id, params.get("full") == "1", in_lair)
+            result["max_xp"] = max_xp
+            return result
+
+    def _describe(self, encounter, encounter_id, full=False, in_lair=False):
+        xp = encounter_xp(encounter, in_lair)
+        return {
+            "encounter_id": encounter_id,
+            "monsters": [self.store.full_monster(monster) if full else public_fields(monster) for monster in encounter],
+            "xp": xp,
+            "adjusted_xp": adjusted_xp(xp, len(encounter)),
+        }
+
+    def search(self, params):
+        limit = min(int(params.get("limit", 10)), MAX_SEARCH_RESULTS)
+        if "name" in params:
+            return [dict(public_fields(monster), score=round(score, 3))
+                    for monster, score in search_names(self.name_index, params["name"], limit=limit)]
+        if "text" in params:
+            max_xp = int(params["max_xp"]) if "max_xp" in params else None
+            results = search_monsters(self.store, self.postings, params["text"], max_xp,
+                                      int(params.get("min_xp", 0)), params.get("environment"))
+            return [public_fields(monster) for monster in results[:limit]]
+        raise ValueError("Pass name= or text=")
+
+
+def public_fields(monster):
+    """
+    A summary without the store's internal keys, plus its XP.
+    """
+    result = {key: value for key, value in monster.items() if not key.startswith("_")}
+    result["xp"] = get_monster_xp(monster)
+    return result
+
+
+def make_handler(engine):
+    routes = {
+        "/encounter": engine.encounter,
+        "/monsters/search": engine.search,
+        "/thresholds": engine.thresholds,
+    }
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            route = routes.get(url.path.rstrip("/") or "/")
+            if route is None:
+                return self._send(404, {"error": f"Unknown endpoint {url.path}", "endpoints": sorted(routes)})
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            try:
+                self._send(200, route(params))
+            except LookupError as e:
+                self._send(404, {"error": str(e).strip("'")})
+            except ValueError as e:
+                self._send(400, {"error": str(e)})
+            except Exception as e:  # Always answer, even on a bug
+                traceback.print_exc()  # log_message() is silenced, so print the traceback directly
+                self._send(500, {"error": f"Internal error: {e!r}"})
+
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Keep the console quiet; the bot/bridge logs its own requests
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve encounter generation over HTTP/JSON.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    enable_from_env()  # DND_METRICS=table|json|prometheus: report when the server stops
+
+    config_file = os.path.join(os.path.dirname(__file__), "config", "config.json")
+    try:
+        with open(config_file, "r") as f:
+            config = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        config = {}
+    engine = EncounterEngine(config)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(engine))
+    print(f"🌐 Serving {len(engine.store)} monsters on http://{args.host}:{args.port} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Server stopped.")
+    finally:
+        server.server_close()
+        engine.store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# filepath: src/startup_benchmark.py
+# Measures how long importing the generator takes, using Python's -X importtime
+# report, and checks it against a budget. Shell scripts and the server bridge start
+# a fresh process per request, so every millisecond here is paid each time.
+#
+# It also fails if a module that should only load on first use (requests, dotenv,
+# httpx) shows up at import time.
+#
+# Usage: python startup_benchmark.py [--module main] [--runs 7] [--budget 100] [--json]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Milliseconds importing main.py may take (median of the runs)
+STARTUP_BUDGET_MS = 100
+# Modules that must not be imported until they're needed
+DEFERRED_MODULES = ("requests", "dotenv", "httpx", "urllib3")
+
+
+def parse_importtime(stderr):
+    """
+    Parses "-X importtime" output.
+    :return: Dictionary of module name -> (self microseconds, cumulative microseconds).
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        # "import time:       321 |       1403 |   os"
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            modules[name.strip()] = (int(self_us), int(cumulative_us))
+        except ValueError:
+            continue
+    return modules
+
+
+def measure_import(module, runs=7):
+    """
+    Imports a module in fresh interpreters.
+    :return: (list of cumulative import times in ms, per-module self times in ms from
+             the fastest run, set of every module imported).
+    """
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)  # Measure with cached bytecode, like a real install
+    totals = []
+    fastest = None
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                cwd=src_dir, env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+        modules = parse_importtime(result.stderr)
+        if module not in modules:
+            raise RuntimeError(f"No importtime line for {module}")
+        total_ms = modules[module][1] / 1000
+        totals.append(total_ms)
+        if fastest is None or total_ms < fastest[0]:
+            fastest = (total_ms, modules)
+    self_times = {name: times[0] / 1000 for name, times in fastest[1].items()}
+    return totals, self_times, set(fastest[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time of the generator against a budget.")
+    parser.add_argument("--module", default="main", help="Module to import (main, server, batch, ...)")
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET_MS, help="Budget in ms (median)")
+    parser.add_argument("--top", type=int, default=10, help="Slowest modules to list")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    totals, self_times, imported = measure_import(args.module, args.runs)
+    median = statistics.median(totals)
+    eager = sorted(name for name in imported if name.split(".")[0] in DEFERRED_MODULES)
+    slowest = sorted(self_times.items(), key=lambda item: item[1], reverse=True)[:args.top]
+    within_budget = median <= args.budget and not eager
+
+    if args.json:
+        print(json.dumps({
+            "module": args.module,
+            "runs_ms": [round(total, 2) for total in totals],
+            "median_ms": round(median, 2),
+            "budget_ms": args.budget,
+            "eager_deferred_modules": eager,
+            "slowest_modules_ms": {name: round(ms, 2) for name, ms in slowest},
+            "ok": within_budget,
+        }, indent=2))
+    else:
+        print(f"⏱️  import {args.module}: median {median:.1f} ms over {args.runs} runs "
+              f"(min {min(totals):.1f}, max {max(totals):.1f}), budget {args.budget:.0f} ms")
+        print("Slowest modules (self time):")
+        for name, ms in slowest:
+            print(f"  {ms:7.2f} ms  {name}")
+        if eager:
+            print(f"❌ Imported at startup but should be lazy: {', '.join(eager)}")
+        print("✅ Within budget" if within_budget else "❌ Over budget")
+    sys.exit(0 if within_budget else 1)
+
+
+if __name__ == "__main__":
+    main()
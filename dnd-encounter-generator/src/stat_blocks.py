@@ -0,0 +1,377 @@
+# filepath: src/stat_blocks.py
+# Renders full 5etools monster records as markdown stat blocks, for notes that
+# should work without the bestiary (AC, HP, speed, abilities, traits, actions, ...).
+#
+# The same creatures show up in hundreds of encounters, so rendered blocks are
+# memoized per monster: in memory, and on disk next to the other bestiary caches
+# (src/cache/<bestiary>.stat-blocks.json, rebuilt when the bestiary changes).
+import json
+import os
+from bestiary_store import CACHE_DIR
+from entry_text import TAG_PATTERN, plain_tag
+from instrumentation import increment
+
+# Bump when the rendered markdown changes, so cached blocks are re-rendered
+RENDER_VERSION = 1
+
+SIZES = {"T": "Tiny", "S": "Small", "M": "Medium", "L": "Large", "H": "Huge", "G": "Gargantuan"}
+ALIGNMENTS = {
+    "L": "lawful", "N": "neutral", "NX": "neutral", "NY": "neutral", "C": "chaotic",
+    "G": "good", "E": "evil", "U": "unaligned", "A": "any alignment",
+}
+# Alignment lists that read better as a phrase
+ALIGNMENT_PHRASES = {
+    frozenset(("L", "NX", "C", "G", "NY", "E")): "any alignment",
+    frozenset(("L", "NX", "C", "E")): "any evil alignment",
+    frozenset(("L", "NX", "C", "G")): "any good alignment",
+    frozenset(("L", "NX", "C", "NY", "E")): "any non-good alignment",
+    frozenset(("NX", "C", "G", "NY", "E")): "any non-lawful alignment",
+    frozenset(("C", "G", "NY", "E")): "any chaotic alignment",
+    frozenset(("L", "G", "NY", "E")): "any lawful alignment",
+}
+ABILITIES = ("str", "dex", "con", "int", "wis", "cha")
+# Record field -> heading; "trait" entries come without a heading
+SECTIONS = (
+    ("trait", None),
+    ("action", "Actions"),
+    ("bonus", "Bonus Actions"),
+    ("reaction", "Reactions"),
+    ("legendary", "Legendary Actions"),
+    ("mythic", "Mythic Actions"),
+)
+SPELL_LEVELS = {"0": "Cantrips (at will)", "1": "1st level", "2": "2nd level", "3": "3rd level"}
+
+
+def _markdown_tag(match):
+    tag, text = match.group(1), match.group(2) or ""
+    first = text.split("|")[0]
+    if tag in ("b", "bold"):
+        return f"**{first}**"
+    if tag in ("i", "italic", "spell"):
+        return f"*{first}*"
+    if tag == "atk":
+        return f"*{plain_tag(match)}*"
+    if tag == "h":
+        return "*Hit:* "
+    if tag == "quickref":
+        # {@quickref difficult terrain||3} - the third part is a section number
+        parts = text.split("|")
+        return parts[3] if len(parts) > 3 and parts[3] else first
+    return plain_tag(match)
+
+
+def markdown_tags(text):
+    """
+    Converts 5etools markup to markdown.
+    "{@atk mw} {@hit 4} to hit" -> "*Melee Weapon Attack:* +4 to hit"
+    """
+    previous = None
+    while previous != text:  # Innermost tags first, like entry_text.strip_tags
+        previous = text
+        text = TAG_PATTERN.sub(_markdown_tag, text)
+    return text
+
+
+def render_entries(entries):
+    """
+    Renders an entries structure (strings, nested entries, lists) as markdown lines.
+    """
+    lines = []
+    for entry in entries if isinstance(entries, list) else [entries]:
+        if isinstance(entry, str):
+            lines.append(markdown_tags(entry))
+        elif isinstance(entry, dict):
+            if entry.get("type") == "list":
+                for item in entry.get("items", []):
+                    item_lines = render_entries(item)
+                    lines.extend(f"- {line}" for line in item_lines[:1])
+                    lines.extend(f"  {line}" for line in item_lines[1:])
+            else:
+                inner = render_entries(entry.get("entries", entry.get("entry", [])))
+                if entry.get("name") and inner:
+                    inner[0] = f"***{markdown_tags(entry['name'])}.*** {inner[0]}"
+                lines.extend(inner)
+    return lines
+
+
+def _named_block(item):
+    lines = render_entries(item.get("entries", []))
+    name = markdown_tags(item.get("name", ""))
+    if name and lines:
+        lines[0] = f"***{name}.*** {lines[0]}"
+    return "\n\n".join(lines)
+
+
+def _type_line(monster):
+    sizes = " or ".join(SIZES.get(size, size) for size in monster.get("size", []))
+    monster_type = monster.get("type", "")
+    if isinstance(monster_type, dict):
+        base = monster_type.get("type", "")
+        if isinstance(base, dict):
+            base = " or ".join(base.get("choose", []))
+        tags = [tag if isinstance(tag, str) else tag.get("tag", "") for tag in monster_type.get("tags", [])]
+        monster_type = f"{base} ({', '.join(tags)})" if tags else base
+    alignment = monster.get("alignment", [])
+    if all(isinstance(code, str) for code in alignment):
+        alignment = ALIGNMENT_PHRASES.get(frozenset(alignment)) or " ".join(
+            ALIGNMENTS.get(code, code) for code in alignment
+        )
+    else:
+        alignment = " or ".join(
+            code.get("special") or " ".join(ALIGNMENTS.get(part, part) for part in code.get("alignment", []))
+            for code in alignment if isinstance(code, dict)
+        )
+    return f"*{sizes} {monster_type}, {alignment}*".replace(" ,", ",")
+
+
+def _ac(monster):
+    parts = []
+    for ac in monster.get("ac", []):
+        if isinstance(ac, dict):
+            text = str(ac.get("ac", ac.get("special", "")))
+            if ac.get("from"):
+                text += f" ({', '.join(markdown_tags(source) for source in ac['from'])})"
+            if ac.get("condition"):
+                text += f" {markdown_tags(ac['condition'])}"
+            parts.append(text)
+        else:
+            parts.append(str(ac))
+    return ", ".join(parts)
+
+
+def _hp(monster):
+    hp = monster.get("hp", {})
+    if "special" in hp:
+        return hp["special"]
+    return f"{hp.get('average', '?')} ({hp.get('formula', '')})" if hp.get("formula") else str(hp.get("average", "?"))
+
+
+def _speed(monster):
+    speed = monster.get("speed", {})
+    parts = []
+    for mode in ("walk", "burrow", "climb", "fly", "swim"):
+        value = speed.get(mode)
+        if value is None or value is True:
+            continue
+        if isinstance(value, dict):
+            text = f"{value.get('number')} ft. {value.get('condition', '')}".strip()
+        else:
+            text = f"{value} ft."
+        if mode == "fly" and speed.get("canHover") and "hover" not in text:
+            text += " (hover)"
+        parts.append(text if mode == "walk" else f"{mode} {text}")
+    return ", ".join(parts)
+
+
+def _modifier(score):
+    return f"{(score - 10) // 2:+d}"
+
+
+def _damage_list(values, key):
+    """
+    Damage resistances/immunities: plain strings, or groups like
+    {"immune": [...], "note": "from nonmagical attacks"}.
+    """
+    plain = [value for value in values if isinstance(value, str)]
+    parts = [", ".join(plain)] if plain else []
+    for value in values:
+        if isinstance(value, dict):
+            if "special" in value:
+                parts.append(value["special"])
+                continue
+            text = ", ".join(v for v in value.get(key, []) if isinstance(v, str))
+            if value.get("preNote"):
+                text = f"{value['preNote']} {text}"
+            if value.get("note"):
+                text += f" {value['note']}"
+            parts.append(text)
+    return markdown_tags("; ".join(parts))
+
+
+def _cr(cr):
+    if isinstance(cr, dict):
+        text = cr.get("cr", "?")
+        return f"{text} ({cr['lair']} in lair)" if cr.get("lair") else text
+    return cr
+
+
+def _spellcasting(spellcasting):
+    blocks = []
+    for caster in spellcasting:
+        lines = render_entries(caster.get("headerEntries", []))
+        if lines:
+            lines[0] = f"***{markdown_tags(caster.get('name', 'Spellcasting'))}.*** {lines[0]}"
+        if caster.get("will"):
+            lines.append(f"At will: {markdown_tags(', '.join(caster['will']))}")
+        for uses, spells in sorted(caster.get("daily", {}).items()):
+            each = " each" if uses.endswith("e") else ""
+            lines.append(f"{uses.rstrip('e')}/day{each}: {markdown_tags(', '.join(spells))}")
+        for level, spells in sorted(caster.get("spells", {}).items(), key=lambda item: int(item[0])):
+            label = SPELL_LEVELS.get(level, f"{level}th level")
+            if spells.get("slots"):
+                label += f" ({spells['slots']} slot{'s' if spells['slots'] != 1 else ''})"
+            lines.append(f"- {label}: {markdown_tags(', '.join(spells.get('spells', [])))}")
+        lines.extend(render_entries(caster.get("footerEntries", [])))
+        blocks.append("\n".join(lines))
+    return blocks
+
+
+def render_stat_block(monster):
+    """
+    Renders a full monster record as a markdown stat block.
+    :param monster: Full 5etools record (see BestiaryStore.full_monster).
+    :return: Markdown string, starting with a "### Name" heading.
+    """
+    lines = [f"### {monster.get('name', 'Unknown')}", _type_line(monster), ""]
+    lines.append(f"**Armor Class** {_ac(monster)}  ")
+    lines.append(f"**Hit Points** {_hp(monster)}  ")
+    lines.append(f"**Speed** {_speed(monster)}")
+    lines.append("")
+    lines.append("| " + " | ".join(ability.upper() for ability in ABILITIES) + " |")
+    lines.append("|" + "-----|" * len(ABILITIES))
+    scores = [monster.get(ability, 10) for ability in ABILITIES]
+    lines.append("| " + " | ".join(
+        f"{score} ({_modifier(score)})" if isinstance(score, int) else str(score) for score in scores
+    ) + " |")
+    lines.append("")
+
+    details = []
+    for key, label in (("save", "Saving Throws"), ("skill", "Skills")):
+        if isinstance(monster.get(key), dict):
+            details.append((label, ", ".join(
+                f"{name.title()} {value}" for name, value in monster[key].items() if isinstance(value, str)
+            )))
+    for key, label in (("vulnerable", "Damage Vulnerabilities"), ("resist", "Damage Resistances"),
+                       ("immune", "Damage Immunities"), ("conditionImmune", "Condition Immunities")):
+        if monster.get(key):
+            details.append((label, _damage_list(monster[key], key)))
+    senses = list(monster.get("senses") or [])
+    if monster.get("passive") is not None:
+        senses.append(f"passive Perception {monster['passive']}")
+    details.append(("Senses", markdown_tags(", ".join(senses))))
+    details.append(("Languages", markdown_tags(", ".join(monster.get("languages") or [])) or "—"))
+    details.append(("Challenge", _cr(monster.get("cr", "?"))))
+    lines.extend(f"**{label}** {value}  " for label, value in details if value)
+    lines[-1] = lines[-1].rstrip()
+
+    blocks = ["\n".join(lines)]
+    for field, heading in SECTIONS:
+        items = [_named_block(item) for item in monster.get(field) or [] if isinstance(item, dict)]
+        if field == "trait":
+            items += _spellcasting(monster.get("spellcasting") or [])
+        if not items:
+            continue
+        if heading:
+            blocks.append(f"#### {heading}")
+        if field == "legendary":
+            header = render_entries(monster.get("legendaryHeader") or [
+                f"The {monster.get('name', 'creature').lower()} can take "
+                f"{monster.get('legendaryActions', 3)} legendary actions, choosing from the options below. "
+                "Only one legendary action option can be used at a time and only at the end of another "
+                "creature's turn. The creature regains spent legendary actions at the start of its turn."
+            ])
+            blocks.extend(header)
+        blocks.extend(items)
+    return "\n\n".join(blocks)
+
+
+def get_stat_block_cache_path(source_path):
+    name = os.path.splitext(os.path.basename(source_path))[0]
+    return os.path.join(CACHE_DIR, f"{name}.stat-blocks.json")
+
+
+class StatBlockCache:
+    """
+    Memoizes rendered stat blocks per monster (name and source), in memory and in a
+    JSON file tied to the bestiary's size and modification time.
+
+        stat_blocks = StatBlockCache(source_path)
+        markdown = stat_blocks.get(store.full_monster(monster))
+        stat_blocks.save()
+
+    Without a source_path the blocks are only memoized in memory.
+    """
+
+    def __init__(self, source_path=None, cache_path=None):
+        self.blocks = {}
+        self.cache_path = None
+        self._new = {}
+        self._source_stat = None
+        self._dirty = False
+        if source_path is None:
+            return
+        self.cache_path = cache_path or get_stat_block_cache_path(source_path)
+        self._source_stat = os.stat(source_path)
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if (cached.get("version") == RENDER_VERSION
+                    and cached.get("source_size") == self._source_stat.st_size
+                    and cached.get("source_mtime_ns") == self._source_stat.st_mtime_ns):
+                self.blocks = cached["blocks"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            pass
+
+    def get(self, monster):
+        """
+        Returns the stat block of a full monster record, rendering it on first use.
+        """
+        key = f"{monster.get('name', 'Unknown')}|{monster.get('source', '')}"
+        block = self.blocks.get(key)
+        if block is None:
+            increment("cache.stat_blocks.miss")
+            block = self.blocks[key] = self._new[key] = render_stat_block(monster)
+            self._dirty = True
+        else:
+            increment("cache.stat_blocks.hit")
+        return block
+
+    def for_encounter(self, monsters):
+        """
+        Stat blocks for an encounter, one per distinct monster, in encounter order.
+        :param monsters: Full monster records.
+        :return: List of {"name", "text"} dictionaries (the shape the templates use).
+        """
+        seen = set()
+        result = []
+        for monster in monsters:
+            key = (monster.get("name"), monster.get("source"))
+            if key in seen:
+                continue
+            seen.add(key)
+            result.append({"name": monster.get("name", "Unknown"), "text": self.get(monster)})
+        return result
+
+    def take_new(self):
+        """
+        Returns the blocks rendered since the last call, e.g. to send them from a worker
+        process to the cache that gets saved (see update()).
+        """
+        new, self._new = self._new, {}
+        return new
+
+    def update(self, blocks):
+        """
+        Adds blocks rendered elsewhere (see take_new()); they are written on the next save().
+        """
+        if blocks:
+            self.blocks.update(blocks)
+            self._dirty = True
+
+    def save(self):
+        """
+        Writes newly rendered blocks to the disk cache (no-op if nothing changed).
+        """
+        if not self._dirty or self.cache_path is None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        temp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": RENDER_VERSION,
+                "source_size": self._source_stat.st_size,
+                "source_mtime_ns": self._source_stat.st_mtime_ns,
+                "blocks": self.blocks,
+            }, f, separators=(",", ":"))
+        os.replace(temp_path, self.cache_path)
+        self._dirty = False
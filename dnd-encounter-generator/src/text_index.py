@@ -0,0 +1,203 @@
+# filepath: src/text_index.py
+# Full-text search over what monsters can do: traits, actions, reactions,
+# legendary actions and spellcasting. The index is an inverted index
+# (token -> sorted list of monster ids) built once and cached on disk.
+#
+# Monster ids are positions in the bestiary file, the same as store indexes
+# in bestiary_store.py, so results can be combined with store filters.
+import json
+import os
+import re
+from encounter_generator import iter_monsters
+from entry_text import iter_entry_strings, strip_tags
+from bestiary_store import CACHE_DIR
+from instrumentation import increment, timed
+
+TEXT_SECTIONS = ("trait", "action", "reaction", "legendary", "spellcasting")
+SPEED_MODES = ("fly", "swim", "climb", "burrow")
+INDEX_VERSION = 2
+
+
+def tokenize(text):
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def entry_words(monster):
+    """
+    Words of a monster's text sections, one list per entry string, so phrases never
+    run from one trait or action into the next.
+    """
+    return [tokenize(strip_tags(text))
+            for section in TEXT_SECTIONS for text in iter_entry_strings(monster.get(section, []))]
+
+
+def _pairs(words):
+    return [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+def monster_tokens(monster):
+    """
+    Returns the set of tokens for one monster: every word of its text sections,
+    every pair of adjacent words within an entry (used for phrase queries) and a
+    "speed:<mode>" token for each special movement mode.
+    """
+    tokens = set()
+    for words in entry_words(monster):
+        tokens.update(words)
+        tokens.update(_pairs(words))
+    speed = monster.get("speed", {})
+    if isinstance(speed, dict):
+        tokens.update(f"speed:{mode}" for mode in SPEED_MODES if speed.get(mode))
+    return tokens
+
+
+def build_text_index(monsters):
+    """
+    Builds the inverted index.
+    :param monsters: Iterable of full monster records.
+    :return: Dictionary of token -> sorted list of monster ids.
+    """
+    postings = {}
+    for monster_id, monster in enumerate(monsters):
+        for token in monster_tokens(monster):
+            postings.setdefault(token, []).append(monster_id)
+    return postings
+
+
+def get_text_index_path(source_path):
+    name = os.path.splitext(os.path.basename(source_path))[0]
+    return os.path.join(CACHE_DIR, f"{name}.text-index.json")
+
+
+@timed("text_index.open")
+def open_text_index(source_path, cache_path=None):
+    """
+    Loads the text index for a bestiary file from the cache, building it if it's
+    missing or older than the bestiary.
+    :param source_path: Path to the bestiary JSON file.
+    :param cache_path: Optional cache path (defaults to src/cache/<bestiary>.text-index.json).
+    :return: Dictionary of token -> list of monster ids.
+    """
+    cache_path = cache_path or get_text_index_path(source_path)
+    source_stat = os.stat(source_path)
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if (cached.get("version") == INDEX_VERSION
+                and cached.get("source_size") == source_stat.st_size
+                and cached.get("source_mtime_ns") == source_stat.st_mtime_ns):
+            increment("cache.text_index.hit")
+            return cached["postings"]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        pass
+
+    increment("cache.text_index.miss")
+    postings = build_text_index(iter_monsters(source_path))
+    os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "version": INDEX_VERSION,
+            "source_size": source_stat.st_size,
+            "source_mtime_ns": source_stat.st_mtime_ns,
+            "postings": postings,
+        }, f, separators=(",", ":"))
+    os.replace(temp_path, cache_path)
+    return postings
+
+
+def parse_query(query):
+    """
+    Splits a query into (required, excluded) lists of terms. A term is a list of words
+    (several for a "quoted phrase") or a single "speed:<mode>" token.
+    Words are ANDed together, "quoted phrases" must appear as written,
+    speed:fly (swim, climb, burrow) matches a movement mode and -word excludes.
+    """
+    required, excluded = [], []
+    for negated, phrase, word in re.findall(r'(-?)(?:"([^"]*)"|(\S+))', query):
+        term = [word.lower()] if word.lower().startswith("speed:") else tokenize(phrase or word)
+        if term:
+            (excluded if negated else required).append(term)
+    return required, excluded
+
+
+def _term_tokens(term):
+    """
+    Index tokens of a term: the word itself, or every adjacent pair of a phrase.
+    """
+    return term if len(term) == 1 else _pairs(term)
+
+
+def _has_phrase(word_lists, phrase):
+    size = len(phrase)
+    return any(words[start:start + size] == phrase
+               for words in word_lists for start in range(len(words) - size + 1))
+
+
+def search_text(postings, query, record=None):
+    """
+    Finds monsters matching a query, e.g. 'speed:fly fireball' or '"pack tactics"'.
+    Phrases are looked up by their adjacent word pairs; for phrases of three or more
+    words the pairs could match apart, so candidates are checked against the text of
+    record(monster_id). Without record, such phrases only need all of their pairs.
+    An excluded phrase removes only the monsters that contain that whole phrase.
+    :param postings: Index from open_text_index()/build_text_index().
+    :param query: Query string (see parse_query()).
+    :param record: Optional function monster id -> full record (e.g. BestiaryStore.record).
+    :return: Set of monster ids.
+    """
+    required, excluded = parse_query(query)
+    if not required:
+        return set()
+    words = {}
+
+    def has_phrase(monster_id, term):
+        if monster_id not in words:
+            words[monster_id] = entry_words(record(monster_id))
+        return _has_phrase(words[monster_id], term)
+
+    result = _match_all(postings, [token for term in required for token in _term_tokens(term)])
+    if record is not None:
+        for term in required:
+            if len(term) > 2:
+                result = {monster_id for monster_id in result if has_phrase(monster_id, term)}
+    for term in excluded:
+        if not result:
+            break
+        matches = _match_all(postings, _term_tokens(term)) & result
+        if record is not None and len(term) > 2:
+            matches = {monster_id for monster_id in matches if has_phrase(monster_id, term)}
+        result -= matches
+    return result
+
+
+def _match_all(postings, tokens):
+    """
+    Ids of the monsters that have every token, intersecting the shortest lists first.
+    """
+    lists = sorted((postings.get(token, []) for token in tokens), key=len)
+    result = set(lists[0])
+    for ids in lists[1:]:
+        if not result:
+            break
+        result.intersection_update(ids)
+    return result
+
+
+def search_monsters(store, postings, query, max_xp=None, min_xp=0, environment=None):
+    """
+    Combines a text query with the store's XP and environment filters.
+    :param store: A BestiaryStore built from the same bestiary file as the index.
+    :param postings: Text index for that bestiary.
+    :param query: Query string (see parse_query()).
+    :param max_xp: Optional maximum XP.
+    :param min_xp: Minimum XP.
+    :param environment: Optional environment name.
+    :return: List of monster summaries, in bestiary order.
+    """
+    ids = search_text(postings, query, store.record)
+    if max_xp is not None or min_xp or (environment and environment != "any"):
+        ids.intersection_update(store.filter_indexes(
+            max_xp if max_xp is not None else float("inf"), min_xp, environment
+        ))
+    return [store.summary(monster_id) for monster_id in sorted(ids)]
@@ -0,0 +1,130 @@
+# filepath: src/usage_history.py
+# Remembers which monsters were used in past encounters so the generator can avoid
+# repeating itself and keep creature types balanced across a campaign.
+#
+# History lives in SQLite next to config/config.json. Every use is weighted by how
+# recent it is: a use HALF_LIFE encounters ago counts half as much as one in the
+# latest encounter. Writes are buffered and committed in batches.
+import os
+import sqlite3
+from datetime import datetime
+from sampling import get_monster_type
+
+# After this many encounters a use counts half as much
+HALF_LIFE = 10
+# Uses older than HALF_LIFE * HISTORY_WINDOW encounters are ignored (they'd count < 0.1%)
+HISTORY_WINDOW = 10
+# Buffered uses are written to disk once there are this many
+BATCH_SIZE = 500
+
+
+def get_history_path():
+    return os.path.join(os.path.dirname(__file__), "config", "usage_history.sqlite")
+
+
+class UsageHistory:
+    """
+    Usage history for one campaign (by default the party name).
+
+        history = UsageHistory(campaign="The Brave Few")
+        history.apply_to(sampler)          # Feed the decayed weights into a MonsterSampler
+        history.record_encounter(encounter)
+        history.close()                    # Writes anything still buffered
+    """
+
+    def __init__(self, campaign="default", db_path=None, half_life=HALF_LIFE, batch_size=BATCH_SIZE):
+        self.campaign = campaign or "default"
+        self.half_life = half_life
+        self.batch_size = batch_size
+        db_path = db_path or get_history_path()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS usage ("
+            " campaign TEXT NOT NULL, seq INTEGER NOT NULL, name TEXT NOT NULL,"
+            " type TEXT NOT NULL, role TEXT NOT NULL, used_at TEXT NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS usage_campaign_seq ON usage (campaign, seq)")
+        self.connection.commit()
+        self._pending = []
+        self._usage = None  # Cached decayed_usage() for acceptance()
+
+        row = self.connection.execute(
+            "SELECT MAX(seq) FROM usage WHERE campaign = ?", (self.campaign,)
+        ).fetchone()
+        self.seq = row[0] or 0
+        # Recent uses as (seq, name, type), kept in memory to compute weights
+        self._recent = self.connection.execute(
+            "SELECT seq, name, type FROM usage WHERE campaign = ? AND seq > ?",
+            (self.campaign, self.seq - self.half_life * HISTORY_WINDOW)
+        ).fetchall()
+
+    def record_encounter(self, encounter):
+        """
+        Records the monsters of one encounter (main monster first). Nothing is written
+        to disk until batch_size uses are buffered or flush()/close() is called.
+        """
+        if not encounter:
+            return
+        self.seq += 1
+        used_at = datetime.now().isoformat(timespec="seconds")
+        for i, monster in enumerate(encounter):
+            name = monster.get("name", "Unknown")
+            monster_type = get_monster_type(monster)
+            self._pending.append((self.campaign, self.seq, name, monster_type, "main" if i == 0 else "minion", used_at))
+            self._recent.append((self.seq, name, monster_type))
+        self._usage = None
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        with self.connection:  # One transaction for the whole batch
+            self.connection.executemany("INSERT INTO usage VALUES (?, ?, ?, ?, ?, ?)", self._pending)
+        self._pending = []
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def decayed_usage(self):
+        """
+        Returns (monster_usage, type_usage): dictionaries of name/type -> decayed number of uses.
+        """
+        oldest = self.seq - self.half_life * HISTORY_WINDOW
+        self._recent = [use for use in self._recent if use[0] > oldest]
+        monster_usage = {}
+        type_usage = {}
+        for seq, name, monster_type in self._recent:
+            weight = 0.5 ** ((self.seq - seq) / self.half_life)
+            monster_usage[name] = monster_usage.get(name, 0.0) + weight
+            if monster_type:
+                type_usage[monster_type] = type_usage.get(monster_type, 0.0) + weight
+        return monster_usage, type_usage
+
+    def acceptance(self, monster, type_balance=0.5):
+        """
+        Chance (0-1] of keeping a freshly drawn main monster, lower the more recently it
+        and its creature type were used. The interactive generator re-rolls its seed on
+        rejection instead of changing the sampler weights, so encounter IDs stay reproducible.
+        """
+        if self._usage is None:
+            self._usage = self.decayed_usage()
+        monster_usage, type_usage = self._usage
+        return 1.0 / ((1.0 + monster_usage.get(monster.get("name", ""), 0))
+                      * (1.0 + type_balance * type_usage.get(get_monster_type(monster), 0)))
+
+    def apply_to(self, sampler):
+        """
+        Updates a MonsterSampler with the current decayed usage. In batch runs, call it
+        every so often rather than after every encounter, since it resets the sampler's tables.
+        """
+        sampler.usage, sampler.type_usage = self.decayed_usage()
+        sampler.clear()
@@ -0,0 +1,288 @@
+# filepath: src/vault_index.py
+# Index of the encounters saved in a vault folder, so finding "all hard forest
+# encounters" doesn't mean re-reading every note.
+#
+# The index is a SQLite file inside the folder (.encounter_index.sqlite). Saving an
+# encounter adds it right away; refresh() catches up with notes added, edited or
+# deleted by hand, and only parses notes whose size or modification time changed.
+# Notes that aren't encounters (or can't be read) are remembered too, so they aren't
+# re-read on every refresh either.
+#
+# Usage: python vault_index.py FOLDER [--refresh] [--location forest] [--difficulty hard]
+#                              [--monster goblin] [--min-xp 500] [--max-xp 2000]
+import argparse
+import json
+import os
+import re
+import sqlite3
+from instrumentation import timed
+
+INDEX_FILE_NAME = ".encounter_index.sqlite"
+NOTE_EXTENSION = ".md"
+# Creature lines of the ```encounter block: " - 1: Goblin"
+CREATURE_LINE = re.compile(r"^ - \d+: (.+)$")
+
+
+def parse_front_matter(text):
+    """
+    Reads the "key: value" lines between the leading "---" lines of a note. Quoted
+    values are decoded as JSON strings.
+    :return: Dictionary of front matter values (empty if there's none).
+    """
+    if not text.startswith("---\n"):
+        return {}
+    end = text.find("\n---", 4)
+    if end == -1:
+        return {}
+    values = {}
+    for line in text[4:end].splitlines():
+        key, separator, value = line.partition(":")
+        if not separator:
+            continue
+        value = value.strip()
+        if value.startswith('"'):
+            try:
+                value = json.loads(value)
+            except json.JSONDecodeError:
+                pass
+        values[key.strip()] = value
+    return values
+
+
+def parse_note(path):
+    """
+    Parses a saved encounter note.
+    :return: Dictionary with encounter_id, title, location, difficulty, monsters (names)
+             and xp, or None if the note isn't an encounter.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if "```encounter\n" not in text:
+        return None
+    front_matter = parse_front_matter(text)
+    block = text.split("```encounter\n", 1)[1].split("```", 1)[0]
+    monsters = []
+    title = None
+    for line in block.splitlines():
+        match = CREATURE_LINE.match(line)
+        if match:
+            monsters.append(match.group(1).strip())
+        elif line.startswith("name: "):
+            title = line[6:].replace("_", " ")
+    xp = front_matter.get("xp")
+    return {
+        "encounter_id": front_matter.get("encounter_id"),
+        # Older notes have no title in their front matter
+        "title": front_matter.get("title") or title or os.path.splitext(os.path.basename(path))[0].replace("_", " "),
+        "location": front_matter.get("location"),
+        "difficulty": front_matter.get("difficulty"),
+        "monsters": monsters,
+        "xp": int(xp) if xp and str(xp).isdigit() else None,
+    }
+
+
+class VaultIndex:
+    """
+    Encounter index of one vault folder.
+
+        with VaultIndex(folder_path) as index:
+            index.refresh()
+            for entry in index.query(location="forest", difficulty="hard"):
+                print(entry["title"], entry["path"])
+    """
+
+    def __init__(self, folder_path, db_path=None):
+        self.folder_path = folder_path
+        os.makedirs(folder_path, exist_ok=True)
+        self.connection = sqlite3.connect(db_path or os.path.join(folder_path, INDEX_FILE_NAME))
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(
+            "CREATE TABLE IF NOT EXISTS encounters ("
+            " file_name TEXT PRIMARY KEY, encounter_id TEXT, title TEXT, location TEXT,"
+            " difficulty TEXT, xp INTEGER, monsters TEXT NOT NULL, size INTEGER, mtime_ns INTEGER);"
+            "CREATE TABLE IF NOT EXISTS encounter_monsters (file_name TEXT NOT NULL, name TEXT NOT NULL);"
+            # Notes refresh() looked at that aren't encounters (or couldn't be read)
+            "CREATE TABLE IF NOT EXISTS skipped (file_name TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER);"
+            "CREATE INDEX IF NOT EXISTS encounters_location ON encounters (location, difficulty);"
+            "CREATE INDEX IF NOT EXISTS encounter_monsters_name ON encounter_monsters (name);"
+            "CREATE INDEX IF NOT EXISTS encounter_monsters_file ON encounter_monsters (file_name);"
+        )
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    @timed("export.index")
+    def add(self, path, entry, commit=True):
+        """
+        Adds or updates the entry of one note.
+        :param path: Path of the note (inside the folder).
+        :param entry: Dictionary like parse_note() returns.
+        :param commit: Set to False when adding many entries, then call commit().
+        """
+        file_name = os.path.basename(path)
+        stat = os.stat(path)
+        monsters = entry.get("monsters", [])
+        self.connection.execute(
+            "INSERT OR REPLACE INTO encounters VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (file_name, entry.get("encounter_id"), entry.get("title"), entry.get("location"),
+             entry.get("difficulty"), entry.get("xp"), json.dumps(monsters), stat.st_size, stat.st_mtime_ns)
+        )
+        self.connection.execute("DELETE FROM encounter_monsters WHERE file_name = ?", (file_name,))
+        self.connection.execute("DELETE FROM skipped WHERE file_name = ?", (file_name,))
+        self.connection.executemany(
+            "INSERT INTO encounter_monsters VALUES (?, ?)",
+            [(file_name, name.lower()) for name in set(monsters)]
+        )
+        if commit:
+            self.connection.commit()
+
+    def commit(self):
+        self.connection.commit()
+
+    def refresh(self):
+        """
+        Brings the index up to date with the folder: parses new and changed notes
+        (by size and modification time) and drops deleted ones. Notes that aren't
+        encounters, aren't UTF-8 or can't be read are recorded as skipped until they change.
+        :return: (number of notes parsed, number of entries removed).
+        """
+        known = {
+            row["file_name"]: (row["size"], row["mtime_ns"])
+            for row in self.connection.execute("SELECT file_name, size, mtime_ns FROM encounters")
+        }
+        skipped = {
+            row["file_name"]: (row["size"], row["mtime_ns"])
+            for row in self.connection.execute("SELECT file_name, size, mtime_ns FROM skipped")
+        }
+        parsed = 0
+        seen = set()
+        with self.connection:  # One transaction for the whole refresh
+            for item in os.scandir(self.folder_path):
+                if not item.name.endswith(NOTE_EXTENSION) or not item.is_file():
+                    continue
+                seen.add(item.name)
+                signature = (None, None)  # Retried on the next refresh if reading fails
+                try:
+                    stat = item.stat()
+                    if (stat.st_size, stat.st_mtime_ns) in (known.get(item.name), skipped.get(item.name)):
+                        continue
+                    signature = (stat.st_size, stat.st_mtime_ns)
+                    entry = parse_note(item.path)
+                except (OSError, UnicodeDecodeError) as e:
+                    print(f"⚠️ Skipping {item.name}: {e}")
+                    entry = None
+                if entry is None:
+                    if item.name in known:  # Was an encounter, isn't anymore
+                        self._delete(item.name)
+                    self.connection.execute("INSERT OR REPLACE INTO skipped VALUES (?, ?, ?)", (item.name, *signature))
+                    continue
+                self.add(item.path, entry, commit=False)
+                parsed += 1
+            removed = [file_name for file_name in known if file_name not in seen]
+            for file_name in removed:
+                self._delete(file_name)
+            self.connection.executemany("DELETE FROM skipped WHERE file_name = ?",
+                                        [(f,) for f in skipped if f not in seen])
+        return parsed, len(removed)
+
+    def _delete(self, file_name):
+        self.connection.execute("DELETE FROM encounters WHERE file_name = ?", (file_name,))
+        self.connection.execute("DELETE FROM encounter_monsters WHERE file_name = ?", (file_name,))
+
+    def query(self, location=None, difficulty=None, monster=None, min_xp=None, max_xp=None, title=None, limit=None):
+        """
+        Finds indexed encounters. Every given filter must match.
+        :param monster: Monster name (case-insensitive, exact).
+        :param title: Text the title contains (case-insensitive).
+        :return: List of dictionaries with encounter_id, title, location, difficulty,
+                 monsters, xp and path.
+        """
+        conditions, parameters = [], []
+        for column, value in (("location", location), ("difficulty", difficulty)):
+            if value:
+                conditions.append(f"{column} = ?")
+                parameters.append(value)
+        if min_xp is not None:
+            conditions.append("xp >= ?")
+            parameters.append(min_xp)
+        if max_xp is not None:
+            conditions.append("xp <= ?")
+            parameters.append(max_xp)
+        if title:
+            conditions.append("title LIKE ?")
+            parameters.append(f"%{title}%")
+        if monster:
+            conditions.append("file_name IN (SELECT file_name FROM encounter_monsters WHERE name = ?)")
+            parameters.append(monster.lower())
+        sql = "SELECT * FROM encounters"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY file_name"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return [
+            {
+                "encounter_id": row["encounter_id"],
+                "title": row["title"],
+                "location": row["location"],
+                "difficulty": row["difficulty"],
+                "monsters": json.loads(row["monsters"]),
+                "xp": row["xp"],
+                "path": os.path.join(self.folder_path, row["file_name"]),
+            }
+            for row in self.connection.execute(sql, parameters)
+        ]
+
+
+def index_entry(encounter):
+    """
+    Index entry for an encounter object from renderers.make_encounter().
+    """
+    return {
+        "encounter_id": encounter.get("encounter_id"),
+        "title": encounter.get("title"),
+        "location": encounter.get("environment") or "unknown",
+        "difficulty": encounter.get("difficulty") or "unknown",
+        "monsters": [monster.get("name", "Unknown") for monster in encounter.get("monsters", [])],
+        "xp": encounter.get("xp"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the encounter index of a vault folder.")
+    parser.add_argument("folder")
+    parser.add_argument("--refresh", action="store_true", help="Re-parse notes that changed since the last run")
+    parser.add_argument("--location")
+    parser.add_argument("--difficulty")
+    parser.add_argument("--monster")
+    parser.add_argument("--title")
+    parser.add_argument("--min-xp", type=int)
+    parser.add_argument("--max-xp", type=int)
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    with VaultIndex(args.folder) as index:
+        if args.refresh:
+            parsed, removed = index.refresh()
+            print(f"🔄 {parsed} notes parsed, {removed} removed from the index")
+        results = index.query(args.location, args.difficulty, args.monster, args.min_xp, args.max_xp, args.title, args.limit)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for entry in results:
+        print(f"- {entry['title']} ({entry['location']}, {entry['difficulty']}, {entry['xp']} XP): "
+              f"{', '.join(entry['monsters'])} -> {entry['path']}")
+    print(f"{len(results)} encounters")
+
+
+if __name__ == "__main__":
+    main()
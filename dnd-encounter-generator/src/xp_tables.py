@@ -0,0 +1,182 @@
+# filepath: src/xp_tables.py
+# The DMG's encounter-building tables, plus compiled versions for hot paths.
+#
+# Every CR gets a dense integer code (0 = CR 0, 1 = CR 1/8, ... 33 = CR 30,
+# UNKNOWN_CR for anything else), so XP, thresholds and multipliers are plain
+# array lookups instead of str() conversions and sorted-dict loops.
+from array import array
+
+# XP thresholds per character level (DMG pg. 82)
+XP_THRESHOLDS = {
+    1: [25, 50, 75, 100],
+    2: [50, 100, 150, 200],
+    3: [75, 150, 225, 400],
+    4: [125, 250, 375, 500],
+    5: [250, 500, 750, 1100],
+    6: [300, 600, 900, 1400],
+    7: [350, 750, 1100, 1700],
+    8: [450, 900, 1400, 2100],
+    9: [550, 1100, 1600, 2400],
+    10: [600, 1200, 1900, 2800],
+    11: [800, 1600, 2400, 3600],
+    12: [1000, 2000, 3000, 4500],
+    13: [1100, 2200, 3400, 5100],
+    14: [1250, 2500, 3800, 5700],
+    15: [1400, 2800, 4300, 6400],
+    16: [1600, 3200, 4800, 7200],
+    17: [2000, 3900, 5900, 8800],
+    18: [2100, 4200, 6300, 9500],
+    19: [2400, 4900, 7300, 10900],
+    20: [2800, 5700, 8500, 12700]
+}
+
+# CR-to-XP mapping (DMG pg. 274)
+CR_TO_XP = {
+    "0": 10, "1/8": 25, "1/4": 50, "1/2": 100,
+    "1": 200, "2": 450, "3": 700, "4": 1100,
+    "5": 1800, "6": 2300, "7": 2900, "8": 3900,
+    "9": 5000, "10": 5900, "11": 7200, "12": 8400,
+    "13": 10000, "14": 11500, "15": 13000, "16": 15000,
+    "17": 18000, "18": 20000, "19": 22000, "20": 25000,
+    "21": 33000, "22": 41000, "23": 50000, "24": 62000,
+    "25": 75000, "26": 90000, "27": 105000, "28": 120000,
+    "29": 135000, "30": 155000
+}
+
+# Monster multiplier table (DMG pg. 82)
+MONSTER_MULTIPLIERS = {
+    1: 1,
+    2: 1.5,
+    3: 2,
+    7: 2.5,
+    11: 3,
+    15: 4
+}
+
+DIFFICULTIES = ("easy", "medium", "hard", "deadly")
+
+# Legendary monsters also act on the party's turns: every legendary action adds this
+# share of the monster's XP to its weight in the budget (3 actions -> +30%)
+LEGENDARY_ACTION_WEIGHT = 0.1
+DEFAULT_LEGENDARY_ACTIONS = 3
+# Lair actions, for monsters fought in their lair that have no separate lair CR
+LAIR_ACTION_WEIGHT = 0.1
+
+# --- Compiled tables ---
+
+# CRs in ascending order; a CR's position is its code
+CR_VALUES = list(CR_TO_XP)
+CR_CODES = {cr: code for code, cr in enumerate(CR_VALUES)}
+UNKNOWN_CR = len(CR_VALUES)
+
+# XP_BY_CODE[code] -> XP (0 for UNKNOWN_CR)
+XP_BY_CODE = array("i", [CR_TO_XP[cr] for cr in CR_VALUES] + [0])
+
+MAX_LEVEL = 20
+# THRESHOLD_ARRAY[level * 4 + difficulty] -> threshold for one character (row 0 is all zeros)
+THRESHOLD_ARRAY = array("i", [0] * 4)
+for _level in range(1, MAX_LEVEL + 1):
+    THRESHOLD_ARRAY.extend(XP_THRESHOLDS[_level])
+
+# MULTIPLIER_BY_COUNT[number of monsters] -> multiplier, counts above the last entry use it
+MAX_MULTIPLIER_COUNT = max(MONSTER_MULTIPLIERS)
+MULTIPLIER_BY_COUNT = array("d", [1.0])
+for _count in range(1, MAX_MULTIPLIER_COUNT + 1):
+    MULTIPLIER_BY_COUNT.append(max(
+        multiplier for threshold, multiplier in MONSTER_MULTIPLIERS.items() if _count >= threshold
+    ))
+
+
+def cr_code(cr):
+    """
+    Get the dense code of a CR. Accepts "1/4", 5, or a 5etools CR dictionary
+    like {"cr": "13", "lair": "14"} (the base CR is used).
+    """
+    if isinstance(cr, dict):
+        cr = cr.get("cr", "0")
+    return CR_CODES.get(str(cr), UNKNOWN_CR)
+
+
+def xp_for_cr(cr):
+    return XP_BY_CODE[cr_code(cr)]
+
+
+def threshold(level, difficulty):
+    """
+    XP threshold of one character.
+    :param level: Character level (anything outside 1-20 gives 0).
+    :param difficulty: Index into DIFFICULTIES (0 = easy ... 3 = deadly).
+    """
+    if not 1 <= level <= MAX_LEVEL:
+        return 0
+    return THRESHOLD_ARRAY[level * 4 + difficulty]
+
+
+def multiplier(num_monsters):
+    return MULTIPLIER_BY_COUNT[min(max(num_monsters, 0), MAX_MULTIPLIER_COUNT)]
+
+
+def adjusted_xp(xp, num_monsters):
+    """
+    Adjusted XP of an encounter: its total XP times the multiplier for its number of
+    monsters (DMG pg. 82).
+    """
+    return xp * multiplier(num_monsters)
+
+
+def adjusted_xp_array(xp_array, counts):
+    """
+    Adjusted XP for many encounters at once: xp_array[i] * multiplier(counts[i]).
+    Works on lists/arrays; NumPy arrays are handled in one vectorized step.
+    :param xp_array: Total (unadjusted) XP of each encounter.
+    :param counts: Number of monsters in each encounter.
+    :return: Array (or NumPy array) of adjusted XP values.
+    """
+    if hasattr(counts, "clip"):  # NumPy array
+        import numpy
+        table = numpy.frombuffer(MULTIPLIER_BY_COUNT, dtype=numpy.float64)
+        return numpy.asarray(xp_array) * table[numpy.clip(counts, 0, MAX_MULTIPLIER_COUNT)]
+    table = MULTIPLIER_BY_COUNT
+    top = MAX_MULTIPLIER_COUNT
+    return array("d", [xp * table[min(max(count, 0), top)] for xp, count in zip(xp_array, counts)])
+
+
+def encounter_xp(encounter, in_lair=False):
+    """
+    Total (unadjusted) XP of an encounter; the main monster (first) counts at its lair
+    XP when the fight is in its lair.
+    """
+    return sum(monster_xp(monster, in_lair and i == 0) for i, monster in enumerate(encounter))
+
+
+def monster_xp(monster, in_lair=False, cr_to_xp=None):
+    """
+    XP a monster takes from the encounter budget. Unlike xp_for_cr this looks at the
+    whole monster: a CR dictionary's "lair" CR is used when the fight is in its lair
+    (and its "xp" when it has one), and legendary/lair actions are weighted in.
+    Store summaries carry this precomputed as "_xp"/"_lair_xp".
+    :param monster: Monster dictionary (full record, or a store summary).
+    :param in_lair: Whether the monster is fought in its lair.
+    :param cr_to_xp: Optional CR-to-XP mapping (defaults to the compiled table).
+    :return: XP as an integer.
+    """
+    precomputed = monster.get("_lair_xp" if in_lair else "_xp")
+    if precomputed is not None:
+        return precomputed
+    cr = monster.get("cr", "0")
+    lair_cr = False
+    if isinstance(cr, dict):
+        if in_lair and "lair" in cr:
+            cr, lair_cr = cr["lair"], True
+        elif "xp" in cr:
+            return cr["xp"]  # Fixed XP, e.g. familiars worth nothing
+        else:
+            cr = cr.get("cr", "0")
+    base = cr_to_xp.get(str(cr), 0) if cr_to_xp is not None else XP_BY_CODE[cr_code(cr)]
+    weight = 1.0
+    if monster.get("legendary"):
+        weight += LEGENDARY_ACTION_WEIGHT * monster.get("legendaryActions", DEFAULT_LEGENDARY_ACTIONS)
+    if in_lair and not lair_cr and monster.get("legendaryGroup"):
+        weight += LAIR_ACTION_WEIGHT
+    return int(round(base * weight))
+